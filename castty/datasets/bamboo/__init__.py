@@ -1,4 +1,5 @@
 from .bamboo import *
+from .batch import *
 from .base_internode import *
 from .colander import *
 from .color import *
@@ -1,5 +1,6 @@
 from .builder import INTERNODE
 from .builder import build_internode
+from .profiler import PROFILER
 from .base_internode import BaseInternode
 
 
@@ -14,11 +15,30 @@ class Bamboo(BaseInternode):
         self.internodes = []
         for cfg in internodes:
             self.internodes.append(build_internode(cfg, **kwargs))
+        self.plan = list(self.internodes)
 
         BaseInternode.__init__(self, **kwargs)
 
-    def forward(self, data_dict):
+    def compile(self, fuse_warp=False):
+        # flatten the forward path into bound calls, no-op internodes are dropped
+        plan = []
         for t in self.internodes:
+            t.compile()
+            plan.append(t.compiled_call())
+
+        if fuse_warp:
+            # runs of geometric internodes resample images and masks only once
+            from .fusion import fuse_warps
+            self.plan = fuse_warps(self.internodes, plan)
+        else:
+            self.plan = [call for call in plan if call is not None]
+        return self
+
+    def forward(self, data_dict):
+        if PROFILER.active:
+            return PROFILER.forward_plan(self.plan, data_dict)
+
+        for t in self.plan:
             data_dict = t(data_dict)
         return data_dict
 
@@ -1,4 +1,6 @@
 from .builder import INTERNODE
+from .mixin import DataAugMixin
+from .profiler import PROFILER
 
 
 __all__ = ['BaseInternode']
@@ -28,11 +30,31 @@ class BaseInternode(object):
         return data_dict
 
     def __call__(self, data_dict):
+        if PROFILER.active:
+            return PROFILER.call(self, data_dict)
+
         param = self.calc_intl_param_forward(data_dict)
         data_dict = self.forward(data_dict, **param)
         data_dict = self.forward_rest(data_dict, **param)
         return data_dict
 
+    def compile(self):
+        pass
+
+    def compiled_call(self):
+        # the call used by a compiled bamboo, None means the internode can be dropped
+        cls = type(self)
+        if cls.__call__ is not BaseInternode.__call__:
+            return self.__call__
+        if cls.calc_intl_param_forward is not BaseInternode.calc_intl_param_forward or cls.forward_rest is not BaseInternode.forward_rest:
+            return self.__call__
+
+        if cls.forward is BaseInternode.forward:
+            return None
+        if cls.forward is DataAugMixin.forward and self.forward_plan == []:
+            return None
+        return self.forward
+
     def reverse(self, **kwargs):
         param = self.calc_intl_param_backward(kwargs)
         kwargs = self.backward(kwargs, **param)
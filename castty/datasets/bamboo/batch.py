@@ -0,0 +1,411 @@
+import torch
+import numpy as np
+import torch.nn.functional as F
+from .base_internode import BaseInternode
+from .mixin import BaseFilterMixin, DataAugMixin
+from .builder import BATCH_INTERNODE, build_batch_internode
+from ..utils.common import clip_bbox, clip_point
+from ..utils.warp_tools import warp_bbox, warp_point
+
+
+__all__ = ['BatchBamboo']
+
+
+# batch internodes work on collated data: image (N, C, H, W) and mask (N, H, W) tensors,
+# bbox and point lists with one item per sample, and per sample metas in lists.
+# the collated tensors belong to the batch, they are modified in place.
+TAG_MAPPING = dict(
+    image=['image'],
+    bbox=['bbox'],
+    mask=['mask'],
+    point=['point'],
+)
+
+
+def get_batch_size(image):
+    assert torch.is_tensor(image) and image.dim() == 4, 'batch internodes need stacked images, put ToTensor before collating'
+    n, _, h, w = image.shape
+    return n, (w, h)
+
+
+def blend_(image, other, ratio):
+    # torchvision's _blend written back into image
+    if image.is_floating_point():
+        return image.mul_(ratio).add_((1.0 - ratio) * other).clamp_(0, 1.0)
+    return image.copy_((ratio * image.to(torch.float32) + (1.0 - ratio) * other).clamp(0, 255.0))
+
+
+def as_numpy(item):
+    if torch.is_tensor(item):
+        return item.numpy(), True
+    return item, False
+
+
+def as_item(item, is_tensor):
+    if is_tensor:
+        return torch.from_numpy(item)
+    return item
+
+
+class BatchInternode(DataAugMixin, BaseInternode):
+    def __init__(self, p=1, tag_mapping=TAG_MAPPING, forward_mapping=None, **kwargs):
+        assert 0 < p <= 1
+        self.p = p
+
+        DataAugMixin.__init__(self, tag_mapping, forward_mapping, dict())
+        BaseInternode.__init__(self, **kwargs)
+
+    def calc_flags(self, n):
+        if self.p == 1:
+            return torch.ones(n, dtype=torch.bool)
+        return torch.rand(n) < self.p
+
+    def uniform(self, n, low, high):
+        return torch.rand(n, dtype=torch.float64) * (high - low) + low
+
+    def select(self, x, index):
+        # the whole batch when every sample is selected, otherwise views of the selected samples,
+        # elementwise ops stay in place and in cache either way
+        if len(index) == len(x):
+            return [(x, slice(None))]
+        return [(x[i], i) for i in index.tolist()]
+
+
+@BATCH_INTERNODE.register_module(name='Normalize')
+class BatchNormalize(BatchInternode):
+    def __init__(self, mean, std, **kwargs):
+        self.mean = mean
+        self.std = std
+
+        forward_mapping = dict(
+            image=self.forward_image,
+        )
+        BatchInternode.__init__(self, forward_mapping=forward_mapping, **kwargs)
+
+    def forward_image(self, image, meta, **kwargs):
+        mean = torch.as_tensor(self.mean, dtype=image.dtype).view(1, -1, 1, 1)
+        std = torch.as_tensor(self.std, dtype=image.dtype).view(1, -1, 1, 1)
+        if image.is_floating_point():
+            image = image.sub_(mean).div_(std)
+        else:
+            image = (image - mean) / std
+        return image, meta
+
+    def __repr__(self):
+        return 'BatchNormalize(mean={}, std={})'.format(self.mean, self.std)
+
+
+@BATCH_INTERNODE.register_module(name='BrightnessEnhancement')
+class BatchBrightnessEnhancement(BatchInternode):
+    def __init__(self, brightness, **kwargs):
+        assert len(brightness) == 2
+        assert brightness[1] >= brightness[0]
+        assert brightness[0] > 0
+
+        self.brightness = brightness
+
+        forward_mapping = dict(
+            image=self.forward_image,
+        )
+        BatchInternode.__init__(self, forward_mapping=forward_mapping, **kwargs)
+
+    def calc_intl_param_forward(self, data_dict):
+        n, _ = get_batch_size(data_dict['image'])
+        factor = self.uniform(n, *self.brightness).to(torch.float32).view(-1, 1, 1, 1)
+        return dict(intl_brightness_factor=factor, intl_brightness_index=torch.nonzero(self.calc_flags(n)).flatten())
+
+    def forward_image(self, image, meta, intl_brightness_factor, intl_brightness_index, **kwargs):
+        for x, i in self.select(image, intl_brightness_index):
+            blend_(x, 0, intl_brightness_factor[i])
+        return image, meta
+
+    def __repr__(self):
+        return 'BatchBrightnessEnhancement(brightness={}, p={})'.format(self.brightness, self.p)
+
+
+@BATCH_INTERNODE.register_module(name='ContrastEnhancement')
+class BatchContrastEnhancement(BatchInternode):
+    def __init__(self, contrast, **kwargs):
+        assert len(contrast) == 2
+        assert contrast[1] >= contrast[0]
+        assert contrast[0] > 0
+
+        self.contrast = contrast
+
+        forward_mapping = dict(
+            image=self.forward_image,
+        )
+        BatchInternode.__init__(self, forward_mapping=forward_mapping, **kwargs)
+
+    def calc_intl_param_forward(self, data_dict):
+        n, _ = get_batch_size(data_dict['image'])
+        factor = self.uniform(n, *self.contrast).to(torch.float32).view(-1, 1, 1, 1)
+        return dict(intl_contrast_factor=factor, intl_contrast_index=torch.nonzero(self.calc_flags(n)).flatten())
+
+    def forward_image(self, image, meta, intl_contrast_factor, intl_contrast_index, **kwargs):
+        for x, i in self.select(image, intl_contrast_index):
+            if x.shape[-3] == 3:
+                gray = 0.2989 * x[..., 0, :, :] + 0.587 * x[..., 1, :, :] + 0.114 * x[..., 2, :, :]
+            else:
+                gray = x[..., 0, :, :].to(torch.float32)
+            if not x.is_floating_point():
+                gray = gray.to(x.dtype).to(torch.float32)
+            mean = gray.mean(dim=(-2, -1), keepdim=True).unsqueeze(-3)
+            blend_(x, mean, intl_contrast_factor[i])
+        return image, meta
+
+    def __repr__(self):
+        return 'BatchContrastEnhancement(contrast={}, p={})'.format(self.contrast, self.p)
+
+
+@BATCH_INTERNODE.register_module(name='Flip')
+class BatchFlip(BatchInternode):
+    def __init__(self, horizontal=True, **kwargs):
+        self.horizontal = horizontal
+
+        forward_mapping = dict(
+            image=self.forward_image,
+            bbox=self.forward_bbox,
+            mask=self.forward_mask,
+            point=self.forward_point,
+        )
+        BatchInternode.__init__(self, forward_mapping=forward_mapping, **kwargs)
+
+    def calc_intl_param_forward(self, data_dict):
+        n, size = get_batch_size(data_dict['image'])
+        return dict(intl_flip_flags=self.calc_flags(n), intl_flip_wh=size)
+
+    def flip_tensor(self, x, flags):
+        for v, _ in self.select(x, torch.nonzero(flags).flatten()):
+            v.copy_(v.flip(-1 if self.horizontal else -2))
+        return x
+
+    def forward_image(self, image, meta, intl_flip_flags, **kwargs):
+        return self.flip_tensor(image, intl_flip_flags), meta
+
+    def forward_mask(self, mask, meta, intl_flip_flags, **kwargs):
+        return self.flip_tensor(mask, intl_flip_flags), meta
+
+    def forward_bbox(self, bbox, meta, intl_flip_flags, intl_flip_wh, **kwargs):
+        w, h = intl_flip_wh
+        for i in torch.nonzero(intl_flip_flags).flatten().tolist():
+            b = bbox[i].clone() if torch.is_tensor(bbox[i]) else bbox[i].copy()
+            if self.horizontal:
+                b[:, 0], b[:, 2] = w - bbox[i][:, 2], w - bbox[i][:, 0]
+            else:
+                b[:, 1], b[:, 3] = h - bbox[i][:, 3], h - bbox[i][:, 1]
+            bbox[i] = b
+        return bbox, meta
+
+    def forward_point(self, point, meta, intl_flip_flags, intl_flip_wh, **kwargs):
+        w, h = intl_flip_wh
+        for i in torch.nonzero(intl_flip_flags).flatten().tolist():
+            if self.horizontal:
+                point[i][..., 0] = w - point[i][..., 0]
+            else:
+                point[i][..., 1] = h - point[i][..., 1]
+        return point, meta
+
+    def __repr__(self):
+        return 'BatchFlip(horizontal={}, p={})'.format(self.horizontal, self.p)
+
+
+@BATCH_INTERNODE.register_module(name='WarpPerspective')
+class BatchWarpPerspective(BatchInternode, BaseFilterMixin):
+    def __init__(self, distortion_scale=0.5, use_base_filter=True, **kwargs):
+        self.distortion_scale = distortion_scale
+
+        forward_mapping = dict(
+            image=self.forward_image,
+            bbox=self.forward_bbox,
+            mask=self.forward_mask,
+            point=self.forward_point,
+        )
+        BatchInternode.__init__(self, forward_mapping=forward_mapping, **kwargs)
+        BaseFilterMixin.__init__(self, use_base_filter)
+
+    def get_params(self, n, width, height):
+        # the same ranges as WarpPerspective.get_params, drawn for the whole batch
+        dw = int(self.distortion_scale * int(width / 2))
+        dh = int(self.distortion_scale * int(height / 2))
+
+        x_low = torch.randint(0, dw + 1, (n, 2))
+        x_high = torch.randint(width - dw - 1, width, (n, 2))
+        y_low = torch.randint(0, dh + 1, (n, 2))
+        y_high = torch.randint(height - dh - 1, height, (n, 2))
+
+        startpoints = torch.tensor([(0, 0), (width, 0), (width, height), (0, height)], dtype=torch.float64)
+        endpoints = torch.stack([
+            torch.stack([x_low[:, 0], y_low[:, 0]], dim=1),
+            torch.stack([x_high[:, 0], y_low[:, 1]], dim=1),
+            torch.stack([x_high[:, 1], y_high[:, 0]], dim=1),
+            torch.stack([x_low[:, 1], y_high[:, 1]], dim=1),
+        ], dim=1).to(torch.float64)
+        return startpoints, endpoints
+
+    @staticmethod
+    def build_matrix(startpoints, endpoints):
+        n = len(endpoints)
+        A = torch.zeros(n, 8, 8, dtype=torch.float64)
+        for k, (x, y) in enumerate(startpoints.tolist()):
+            A[:, 2 * k, 0:3] = torch.tensor([x, y, 1], dtype=torch.float64)
+            A[:, 2 * k, 6] = -endpoints[:, k, 0] * x
+            A[:, 2 * k, 7] = -endpoints[:, k, 0] * y
+            A[:, 2 * k + 1, 3:6] = torch.tensor([x, y, 1], dtype=torch.float64)
+            A[:, 2 * k + 1, 6] = -endpoints[:, k, 1] * x
+            A[:, 2 * k + 1, 7] = -endpoints[:, k, 1] * y
+        B = endpoints.reshape(n, 8)
+        c = torch.linalg.solve(A, B)
+        return torch.cat([c, torch.ones(n, 1, dtype=torch.float64)], dim=1).view(n, 3, 3)
+
+    def calc_intl_param_forward(self, data_dict):
+        n, (w, h) = get_batch_size(data_dict['image'])
+        startpoints, endpoints = self.get_params(n, w, h)
+        M = self.build_matrix(startpoints, endpoints)
+
+        flags = self.calc_flags(n)
+        M[~flags] = torch.eye(3, dtype=torch.float64)
+        return dict(intl_warp_matrix=M, intl_warp_flags=flags, intl_warp_size=(w, h))
+
+    def sample(self, x, M, size, mode):
+        # continuous coordinates, pixel centers at +0.5, zeros outside
+        n = len(x)
+        w, h = size
+        ys, xs = torch.meshgrid(torch.arange(h, dtype=torch.float64) + 0.5, torch.arange(w, dtype=torch.float64) + 0.5, indexing='ij')
+        dst = torch.stack([xs, ys, torch.ones_like(xs)], dim=-1).view(1, -1, 3)
+        src = dst @ torch.linalg.inv(M).transpose(1, 2)
+        src = src[..., :2] / src[..., 2:]
+        grid = torch.empty_like(src)
+        grid[..., 0] = src[..., 0] / w * 2 - 1
+        grid[..., 1] = src[..., 1] / h * 2 - 1
+        grid = grid.view(n, h, w, 2).to(torch.float32)
+
+        res = F.grid_sample(x.to(torch.float32), grid, mode=mode, padding_mode='zeros', align_corners=False)
+        if not x.is_floating_point():
+            res = res.round() if mode == 'bilinear' else res
+            res = res.to(x.dtype)
+        return res
+
+    def forward_image(self, image, meta, intl_warp_matrix, intl_warp_flags, intl_warp_size, **kwargs):
+        if not intl_warp_flags.any():
+            return image, meta
+        idx = torch.nonzero(intl_warp_flags).flatten()
+        image[idx] = self.sample(image[idx], intl_warp_matrix[idx], intl_warp_size, 'bilinear')
+        return image, meta
+
+    def forward_mask(self, mask, meta, intl_warp_matrix, intl_warp_flags, intl_warp_size, **kwargs):
+        if not intl_warp_flags.any():
+            return mask, meta
+        idx = torch.nonzero(intl_warp_flags).flatten()
+        mask[idx] = self.sample(mask[idx].unsqueeze(1), intl_warp_matrix[idx], intl_warp_size, 'nearest')[:, 0]
+        return mask, meta
+
+    def forward_bbox(self, bbox, meta, intl_warp_matrix, intl_warp_flags, intl_warp_size, **kwargs):
+        for i in torch.nonzero(intl_warp_flags).flatten().tolist():
+            b, is_tensor = as_numpy(bbox[i])
+            b = warp_bbox(b, intl_warp_matrix[i].numpy())
+            b = clip_bbox(b, intl_warp_size)
+            b, m = self.base_filter_bbox(b, meta[i] if meta is not None else None)
+            bbox[i] = as_item(b, is_tensor)
+        return bbox, meta
+
+    def forward_point(self, point, meta, intl_warp_matrix, intl_warp_flags, intl_warp_size, **kwargs):
+        for i in torch.nonzero(intl_warp_flags).flatten().tolist():
+            p, is_tensor = as_numpy(point[i])
+            k = len(p)
+            if k > 0:
+                p = warp_point(p.reshape(-1, 2), intl_warp_matrix[i].numpy()).reshape(k, -1, 2)
+                p = clip_point(p, intl_warp_size)
+            p, m = self.base_filter_point(p, meta[i] if meta is not None else None)
+            point[i] = as_item(p, is_tensor)
+        return point, meta
+
+    def __repr__(self):
+        return 'BatchWarpPerspective(distortion_scale={}, p={})'.format(self.distortion_scale, self.p)
+
+
+@BATCH_INTERNODE.register_module(name='RandomErasing')
+class BatchRandomErasing(BatchInternode):
+    def __init__(self, scale=(0.02, 0.33), ratio=(0.3, 3.3), value=(0, 0, 0), attempts=10, **kwargs):
+        assert isinstance(value, tuple)
+        if scale[0] < 0 or scale[1] > 1:
+            raise ValueError("range of scale should be between 0 and 1")
+
+        self.scale = scale
+        self.ratio = ratio
+        self.value = value
+        self.attempts = attempts
+
+        forward_mapping = dict(
+            image=self.forward_image,
+            mask=self.forward_mask,
+        )
+        BatchInternode.__init__(self, tag_mapping=dict(image=['image'], mask=['mask']), forward_mapping=forward_mapping, **kwargs)
+
+    def calc_intl_param_forward(self, data_dict):
+        assert 'point' not in data_dict.keys() and 'bbox' not in data_dict.keys()
+
+        n, (w, h) = get_batch_size(data_dict['image'])
+
+        # all attempts of all samples at once, the first valid one of each sample is used
+        erase_area = self.uniform((n, self.attempts), *self.scale) * w * h
+        aspect_ratio = self.uniform((n, self.attempts), *self.ratio)
+        new_h = torch.round(torch.sqrt(erase_area * aspect_ratio)).long()
+        new_w = torch.round(torch.sqrt(erase_area / aspect_ratio)).long()
+
+        valid = (new_h < h) & (new_w < w)
+        first = torch.argmax(valid.to(torch.int8), dim=1)
+        rows = torch.arange(n)
+        new_h, new_w = new_h[rows, first], new_w[rows, first]
+        flags = valid[rows, first] & self.calc_flags(n)
+
+        y = (torch.rand(n, dtype=torch.float64) * (h - new_h + 1)).long()
+        x = (torch.rand(n, dtype=torch.float64) * (w - new_w + 1)).long()
+
+        # the rectangle is drawn inclusive of its right and bottom edges, like ImageDraw
+        rects = torch.stack([x, y, x + new_w + 1, y + new_h + 1], dim=1)
+        return dict(intl_erase_rects=rects.tolist(), intl_erase_index=torch.nonzero(flags).flatten().tolist())
+
+    def forward_image(self, image, meta, intl_erase_rects, intl_erase_index, **kwargs):
+        value = torch.as_tensor(self.value, dtype=image.dtype).view(-1, 1, 1)
+        for i in intl_erase_index:
+            x1, y1, x2, y2 = intl_erase_rects[i]
+            image[i, :, y1:y2, x1:x2] = value
+        return image, meta
+
+    def forward_mask(self, mask, meta, intl_erase_rects, intl_erase_index, **kwargs):
+        for i in intl_erase_index:
+            x1, y1, x2, y2 = intl_erase_rects[i]
+            mask[i, y1:y2, x1:x2] = 0
+        return mask, meta
+
+    def __repr__(self):
+        return 'BatchRandomErasing(scale={}, ratio={}, value={}, p={})'.format(self.scale, self.ratio, self.value, self.p)
+
+
+@BATCH_INTERNODE.register_module()
+class BatchBamboo(BaseInternode):
+    def __init__(self, internodes, **kwargs):
+        assert len(internodes) > 0
+
+        self.internodes = []
+        for cfg in internodes:
+            t = build_batch_internode(cfg, **kwargs)
+            t.compile()
+            self.internodes.append(t)
+
+        BaseInternode.__init__(self, **kwargs)
+
+    def forward(self, data_dict):
+        for t in self.internodes:
+            data_dict = t(data_dict)
+        return data_dict
+
+    def __repr__(self):
+        split_str = [i.__repr__() for i in self.internodes]
+        bamboo_str = type(self).__name__ + '('
+        for i in range(len(split_str)):
+            bamboo_str += '\n  ' + split_str[i].replace('\n', '\n  ')
+        bamboo_str += '\n)'
+
+        return bamboo_str
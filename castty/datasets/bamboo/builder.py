@@ -2,6 +2,7 @@ from ...utils.registry import Registry, build_from_cfg
 
 
 INTERNODE = Registry('internode')
+BATCH_INTERNODE = Registry('batch_internode')
 
 
 def build_internode(cfg, **default_args):
@@ -32,3 +33,11 @@ def build_internode(cfg, **default_args):
 
 def build_bamboo(internodes, **default_args):
     return build_internode(dict(type='Bamboo', internodes=internodes), **default_args)
+
+
+def build_batch_internode(cfg, **default_args):
+    return build_from_cfg(cfg, BATCH_INTERNODE, default_args)
+
+
+def build_batch_bamboo(internodes, **default_args):
+    return build_batch_internode(dict(type='BatchBamboo', internodes=internodes), **default_args)
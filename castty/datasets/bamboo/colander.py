@@ -2,9 +2,10 @@ import numpy as np
 from .builder import INTERNODE
 from ...utils.bbox_tools import xyxy2xywh
 from .base_internode import BaseInternode
+from ..utils.structures import as_poly_array
 from ..utils.common import get_image_size, clip_bbox, clip_poly
 try:
-    from shapely.geometry import Polygon
+    import shapely
 except ImportError:
     pass
 
@@ -123,38 +124,44 @@ class FilterBboxByAspectRatio(BBoxColander):
 
 @INTERNODE.register_module()
 class FilterSelfOverlapping(BaseInternode):
-    def __init__(self, iou=None):
+    def __init__(self, iou=None, **kwargs):
+        assert iou is None or 0 < iou <= 1
         self.iou = iou
 
+        BaseInternode.__init__(self, **kwargs)
+
+    def calc_reject(self, polys):
+        polys = as_poly_array(polys)
+        shapes = shapely.polygons(shapely.linearrings(polys.data, indices=polys.index))
+
+        # only pairs with overlapping bounding boxes, from the tree
+        tree = shapely.STRtree(shapes)
+        if self.iou is None:
+            i, j = tree.query(shapes, predicate='intersects')
+        else:
+            i, j = tree.query(shapes)
+        pairs = i < j
+        i, j = i[pairs], j[pairs]
+
+        if self.iou is not None:
+            intersect = shapely.area(shapely.intersection(shapes[i], shapes[j]))
+            union = shapely.area(shapely.union(shapes[i], shapes[j])) + 1e-6
+            overlap = intersect / union >= self.iou
+            i, j = i[overlap], j[overlap]
+
+        reject = np.zeros(len(polys), dtype=np.bool_)
+        reject[i] = True
+        reject[j] = True
+        return reject
+
     def forward(self, data_dict):
         if 'poly' in data_dict.keys() and len(data_dict['poly']) > 0:
-            polygon_shapes = [Polygon(p) for p in data_dict['poly']]
-
-            reject = set()
-            for i in range(len(data_dict['poly']) - 1):
-                for j in range(i + 1, len(data_dict['poly'])):
-                    if self.iou is None:
-                        if polygon_shapes[i].intersects(polygon_shapes[j]):
-                            reject.add(i)
-                            reject.add(j)
-                    else:
-                        intersect = polygon1.intersection(polygon2).area
-                        union = polygon1.union(polygon2).area + 1e-6
-                        iou = intersect / union
-
-                        if iou >= self.iou:
-                            reject.add(i)
-                            reject.add(j)
-            
+            reject = self.calc_reject(data_dict['poly'])
+
             if 'poly_meta' in data_dict.keys():
-                ignore_flags = data_dict['poly_meta']['ignore_flag']
-                for r in reject:
-                    ignore_flags[r] = True
-                data_dict['poly_meta']['ignore_flag'] = ignore_flags
+                data_dict['poly_meta']['keep'] = data_dict['poly_meta']['keep'] & ~reject
             else:
-                keep = set(range(len(data_dict['poly']))) - reject
-                keep = sorted(list(keep))
-                data_dict['poly'] = [data_dict['poly'][k] for k in keep]
+                data_dict['poly'] = as_poly_array(data_dict['poly'])[~reject]
         return data_dict
 
     def __repr__(self):
@@ -25,6 +25,67 @@ def enhance_bcs(image, factor, mode='Brightness'):
     return enhancer.enhance(factor)
 
 
+def blend_cv2(degenerate, image, factor):
+    # the same arithmetic as PIL Image.blend on 8-bit bands: float32, clipped and truncated.
+    # degenerate is a constant, so one lookup table serves all pixels
+    factor = np.float32(factor)
+    lut = np.float32(degenerate) + factor * (np.arange(256, dtype=np.float32) - np.float32(degenerate))
+    lut = np.clip(lut, 0, 255).astype(np.uint8)
+    return cv2.LUT(image, lut)
+
+
+# PIL convert('L') in fixed point, the channels are taken as RGB just like Image.fromarray does.
+# every partial sum is an integer below 2 ** 24, so float32 is exact
+RGB2L = np.array([[19595, 38470, 7471]], dtype=np.float32)
+
+
+def rgb_to_l(image, num_output_channels=1, dst=None):
+    l = cv2.transform(image.astype(np.float32), np.repeat(RGB2L, num_output_channels, axis=0), dst=dst)
+    l += 0x8000
+    l *= np.float32(1 / 0x10000)
+    return np.floor(l, out=l)
+
+
+def saturate_cv2(image, factor, rows=32):
+    # blend with the gray image a few rows at a time, the float buffers stay in cache
+    factor = np.float32(factor)
+    res = np.empty_like(image)
+    buf = np.empty((rows,) + image.shape[1:], dtype=np.float32)
+    gray = np.empty_like(buf)
+    for y in range(0, image.shape[0], rows):
+        x = image[y:y + rows]
+        b, g = buf[:len(x)], gray[:len(x)]
+        rgb_to_l(x, 3, dst=g)
+        b[...] = x
+        b -= g
+        b *= factor
+        b += g
+        res[y:y + rows] = np.clip(b, 0, 255, out=b)
+    return res
+
+
+def enhance_bcs_cv2(image, factor, mode='Brightness'):
+    # numpy version of enhance_bcs for uint8 gray or RGB arrays, identical to the PIL results
+    assert mode in ['Brightness', 'Contrast', 'Saturation']
+
+    if mode == 'Brightness':
+        return blend_cv2(0, image, factor)
+
+    if image.ndim == 2:
+        if mode == 'Saturation':
+            return image.copy()
+        return blend_cv2(int(image.mean() + 0.5), image, factor)
+
+    if mode == 'Contrast':
+        mean = rgb_to_l(image).sum(dtype=np.float64) / (image.shape[0] * image.shape[1])
+        return blend_cv2(int(mean + 0.5), image, factor)
+    return saturate_cv2(image, factor)
+
+
+def is_enhanceable_cv2(image):
+    return is_cv2(image) and image.dtype == np.uint8 and (image.ndim == 2 or image.shape[2] == 3)
+
+
 # copy from torchvision/transforms/_functional_pil.py
 def enhance_h(img: Image.Image, hue_factor: float) -> Image.Image:
     if not (-0.5 <= hue_factor <= 0.5):
@@ -42,7 +103,7 @@ def enhance_h(img: Image.Image, hue_factor: float) -> Image.Image:
     np_h = np.array(h, dtype=np.uint8)
     # uint8 addition take cares of rotation across boundaries
     with np.errstate(over="ignore"):
-        np_h += np.uint8(hue_factor * 255)
+        np_h += np.array(hue_factor * 255).astype(np.uint8)
     h = Image.fromarray(np_h, "L")
 
     img = Image.merge("HSV", (h, s, v)).convert(input_mode)
@@ -73,6 +134,8 @@ class BrightnessEnhancement(DataAugMixin, BaseInternode):
         if is_pil(image):
             # image = adjust_brightness(image, intl_brightness_factor)
             image = enhance_bcs(image, intl_brightness_factor, 'Brightness')
+        elif is_enhanceable_cv2(image):
+            image = enhance_bcs_cv2(image, intl_brightness_factor, 'Brightness')
         elif is_cv2(image):
             image = Image.fromarray(image)
             # image = adjust_brightness(image, intl_brightness_factor)
@@ -111,6 +174,8 @@ class ContrastEnhancement(DataAugMixin, BaseInternode):
         if is_pil(image):
             # image = adjust_contrast(image, intl_contrast_factor)
             image = enhance_bcs(image, intl_contrast_factor, 'Contrast')
+        elif is_enhanceable_cv2(image):
+            image = enhance_bcs_cv2(image, intl_contrast_factor, 'Contrast')
         elif is_cv2(image):
             image = Image.fromarray(image)
             # image = adjust_contrast(image, intl_contrast_factor)
@@ -149,6 +214,8 @@ class SaturationEnhancement(DataAugMixin, BaseInternode):
         if is_pil(image):
             # image = adjust_saturation(image, intl_saturation_factor)
             image = enhance_bcs(image, intl_saturation_factor, 'Saturation')
+        elif is_enhanceable_cv2(image):
+            image = enhance_bcs_cv2(image, intl_saturation_factor, 'Saturation')
         elif is_cv2(image):
             image = Image.fromarray(image)
             # image = adjust_saturation(image, intl_saturation_factor)
@@ -18,6 +18,10 @@ class ChooseOne(BaseInternode):
 
 		BaseInternode.__init__(self, **kwargs)
 
+	def compile(self):
+		for branch in self.branchs:
+			branch.compile()
+
 	def calc_intl_param_forward(self, data_dict):
 		intl_bid = random.randint(0, len(self.branchs) - 1)
 		return dict(intl_bid=intl_bid)
@@ -90,6 +94,9 @@ class InternodeWarpper(BaseInternode):
 
 		BaseInternode.__init__(self, **kwargs)
 
+	def compile(self):
+		self.internode.compile()
+
 
 @INTERNODE.register_module()
 class RandomWarpper(InternodeWarpper):
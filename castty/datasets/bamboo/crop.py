@@ -1,27 +1,40 @@
 import math
 import random
 import numpy as np
-from PIL import Image
 from .builder import INTERNODE
 from .base_internode import BaseInternode
 from .warp_internode import WarpInternode
 from .mixin import BaseFilterMixin, DataAugMixin
+from ..utils.structures import as_poly_array
 from ...utils.bbox_tools import calc_iou1, xyxy2xywh
 from torchvision.transforms.functional import crop as tensor_crop
-from ..utils.common import get_image_size, is_pil, is_cv2, filter_bbox_by_center, filter_bbox_by_length, clip_bbox, clip_point, clip_poly
+from ..utils.common import get_image_size, is_pil, is_cv2, filter_bbox_by_length, clip_bbox, clip_point, clip_poly
 
 
 __all__ = ['Crop', 'AdaptiveCrop', 'AdaptiveTranslate', 'MinIOUCrop', 'MinIOGCrop', 'CenterCrop', 'RandomAreaCrop', 'EastRandomCrop', 'WestRandomCrop', 'RandomCenterCropPad']
 
 
+def crop_array(array, x1, y1, x2, y2):
+    # the same box as PIL crop, a view if the box is inside the array, zero padded outside of it
+    x1, y1, x2, y2 = map(int, map(round, (x1, y1, x2, y2)))
+    assert x2 >= x1 and y2 >= y1
+
+    h, w = array.shape[:2]
+    if x1 >= 0 and y1 >= 0 and x2 <= w and y2 <= h:
+        return array[y1:y2, x1:x2]
+
+    res = np.zeros((y2 - y1, x2 - x1) + array.shape[2:], dtype=array.dtype)
+    ix1, iy1, ix2, iy2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+    if ix2 > ix1 and iy2 > iy1:
+        res[iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = array[iy1:iy2, ix1:ix2]
+    return res
+
+
 def crop_image(image, x1, y1, x2, y2):
     if is_pil(image):
         image = image.crop((x1, y1, x2, y2))
     elif is_cv2(image):
-        # image = image[y1:y2, x1:x2]
-        image = Image.fromarray(image)
-        image = image.crop((x1, y1, x2, y2))
-        image = np.array(image)
+        image = crop_array(image, x1, y1, x2, y2)
     else:
         image = tensor_crop(image, y1, x1, y2 - y1, x2 - x1)
     return image
@@ -36,9 +49,9 @@ def crop_bbox(bboxes, x1, y1):
 
 
 def crop_poly(polys, x1, y1):
-    for i in range(len(polys)):
-        polys[i][..., 0] -= x1
-        polys[i][..., 1] -= y1
+    polys = as_poly_array(polys)
+    polys.data[:, 0] -= x1
+    polys.data[:, 1] -= y1
     return polys
 
 
@@ -48,11 +61,44 @@ def crop_point(points, x1, y1):
     return points
 
 
+def random_uniform(low, high, num):
+    # num draws of random.uniform at once, still from random so the dataloader workers get different streams
+    return low + (high - low) * np.array([random.random() for _ in range(num)])
+
+
+def centers_in_rects(bboxes, rects, sizes):
+    # filter_bbox_by_center after crop_bbox for every rect at once, num_rects x num_bboxes
+    bboxes = (bboxes[np.newaxis, :, :4] - rects[:, np.newaxis, [0, 1, 0, 1]]).astype(bboxes.dtype)
+    cx = 0.5 * (bboxes[..., 2] + bboxes[..., 0])
+    cy = 0.5 * (bboxes[..., 3] + bboxes[..., 1])
+    t = np.logical_and(cx >= 0, cx < sizes[:, 0:1])
+    s = np.logical_and(cy >= 0, cy < sizes[:, 1:2])
+    return np.logical_and(t, s)
+
+
+def calc_text_bounds(data_dict):
+    # xmin, ymin, xmax, ymax of every polygon and box, the only thing the text region croppers look at
+    bounds = []
+    if 'poly' in data_dict.keys():
+        bounds.append(as_poly_array(data_dict['poly']).bounds)
+    if 'bbox' in data_dict.keys():
+        bboxes = data_dict['bbox'][:, :4]
+        bounds.append(np.concatenate((np.minimum(bboxes[:, :2], bboxes[:, 2:]), np.maximum(bboxes[:, :2], bboxes[:, 2:])), axis=1))
+    return np.concatenate(bounds).astype(np.float64)
+
+
+def calc_free_axis(mins, maxs, length):
+    # the positions no [ceil(min), ceil(max)) interval covers, a sweep over the sorted interval ends
+    starts = np.clip(np.ceil(mins), 0, length).astype(np.int64)
+    stops = np.clip(np.ceil(maxs), 0, length).astype(np.int64)
+    keep = starts < stops
+    events = np.bincount(starts[keep], minlength=length + 1) - np.bincount(stops[keep], minlength=length + 1)
+    return np.nonzero(np.cumsum(events[:length]) == 0)[0]
+
+
 def crop_mask(mask, x1, y1, x2, y2):
     if is_cv2(mask):
-        mask = Image.fromarray(mask)
-        mask = mask.crop((x1, y1, x2, y2))
-        mask = np.array(mask)
+        mask = crop_array(mask, x1, y1, x2, y2)
     else:
         mask = mask.unsqueeze(0)
         mask = tensor_crop(mask, y1, x1, y2 - y1, x2 - x1)
@@ -91,6 +137,13 @@ class CropInternode(DataAugMixin, BaseInternode, BaseFilterMixin):
         xmin, ymin, xmax, ymax = self.calc_cropping(data_dict)
         return dict(intl_cropping=(xmin, ymin, xmax, ymax))
 
+    def calc_warp_matrix(self, size, intl_cropping, **kwargs):
+        xmin, ymin, xmax, ymax = intl_cropping
+        M = np.eye(3)
+        M[0, 2] = -xmin
+        M[1, 2] = -ymin
+        return M, (xmax - xmin, ymax - ymin)
+
     def forward_image(self, image, meta, intl_cropping, **kwargs):
         xmin, ymin, xmax, ymax = intl_cropping
         image = crop_image(image, xmin, ymin, xmax, ymax)
@@ -175,7 +228,7 @@ class AdaptiveCrop(CropInternode):
             box.append(np.concatenate((np.min(points, axis=0), np.max(points, axis=0))).astype(np.int32))
 
         if 'poly' in data_dict.keys():
-            polys = np.array(data_dict['poly']).reshape(-1, 2)
+            polys = as_poly_array(data_dict['poly']).data
             box.append(np.concatenate((np.min(polys, axis=0), np.max(polys, axis=0))).astype(np.int32))
 
         box = np.array(box)
@@ -208,7 +261,7 @@ class AdaptiveTranslate(WarpInternode):
             box.append(np.concatenate((np.min(points, axis=0), np.max(points, axis=0))).astype(np.int32))
 
         if 'poly' in data_dict.keys():
-            polys = np.array(data_dict['poly']).reshape(-1, 2)
+            polys = as_poly_array(data_dict['poly']).data
             box.append(np.concatenate((np.min(polys, axis=0), np.max(polys, axis=0))).astype(np.int32))
 
         box = np.array(box)
@@ -242,6 +295,14 @@ class MinIOUCrop(CropInternode):
         # super(MinIOUCrop, self).__init__(tag_mapping=tag_mapping, use_base_filter=use_base_filter, **kwargs)
         CropInternode.__init__(self, tag_mapping=tag_mapping, use_base_filter=use_base_filter, **kwargs)
 
+    def calc_overlap(self, bboxes, rects):
+        return calc_iou1(bboxes[np.newaxis, ...], rects[:, np.newaxis, ...])
+
+    def calc_valid(self, bboxes, rects, sizes, min_iou):
+        overlap = self.calc_overlap(bboxes, rects)
+        valid = np.logical_not((overlap < min_iou).any(axis=1))
+        return np.logical_and(valid, centers_in_rects(bboxes, rects, sizes).any(axis=1))
+
     def calc_cropping(self, data_dict):
         assert 'bbox' in data_dict.keys()
 
@@ -253,40 +314,19 @@ class MinIOUCrop(CropInternode):
                 return 0, 0, width, height
 
             min_iou = mode
-            # min_iou = -1
-
-            for _ in range(self.attempts):
-                w = int(random.uniform(0.3 * width, width))
-                h = int(random.uniform(0.3 * height, height))
-                # w, h = 184, 213
-
-                if h / w < 1.0 / self.aspect_ratio or h / w > self.aspect_ratio:
-                    continue
-
-                left = int(random.uniform(0, width - w))
-                top = int(random.uniform(0, height - h))
-                # left, top = 257, 35
-
-                rect = np.array([left, top, left + w, top + h]).astype(np.int32)
-
-                overlap = calc_iou1(data_dict['bbox'], rect[np.newaxis, ...])
-
-                # print(overlap, w, h, min_iou, left, top)
-
-                if (overlap < min_iou).any():
-                    continue
-
-                # print(overlap, min_iou, (overlap < min_iou).any())
 
-                boxes = crop_bbox(data_dict['bbox'].copy(), rect[0], rect[1])
-                keep = filter_bbox_by_center(boxes, (w, h))
+            # every attempt at once, the first one meeting the constraints is the one the loop would have stopped at
+            w = random_uniform(0.3 * width, width, self.attempts).astype(np.int32)
+            h = random_uniform(0.3 * height, height, self.attempts).astype(np.int32)
+            left = random_uniform(0, width - w, self.attempts).astype(np.int32)
+            top = random_uniform(0, height - h, self.attempts).astype(np.int32)
+            rects = np.stack((left, top, left + w, top + h), axis=1)
 
-                if len(keep) == 0:
-                    continue
-
-                # rect = [363, 171, 745, 872]
-                # print(rect)
+            valid = np.logical_and(h / w >= 1.0 / self.aspect_ratio, h / w <= self.aspect_ratio)
+            valid[valid] = self.calc_valid(data_dict['bbox'], rects[valid], np.stack((w, h), axis=1)[valid], min_iou)
 
+            if valid.any():
+                rect = rects[np.argmax(valid)]
                 return rect[0], rect[1], rect[2], rect[3]
 
     def __repr__(self):
@@ -313,6 +353,9 @@ class MinIOGCrop(MinIOUCrop):
         # union_area = boxes1_area + boxes2_area - inter_area
         return inter_area / boxes1_area
 
+    def calc_overlap(self, bboxes, rects):
+        return self.iog_calc(bboxes[np.newaxis, :, :4], rects[:, np.newaxis, ...])
+
     def check(self, p, lower, upper):
         ps = []
         if p / self.aspect_ratio <= upper <= p * self.aspect_ratio:
@@ -331,7 +374,7 @@ class MinIOGCrop(MinIOUCrop):
         ulw, ulh = get_image_size(data_dict['image'])
         # assert self.ul[0] * ulh <= ulw <= self.ul[1] * ulh
         if not (self.ul[0] * ulh <= ulw <= self.ul[1] * ulh):
-            return data_dict
+            return 0, 0, ulw, ulh
         llw, llh = 0.3 * ulw, 0.3 * ulh
 
         # llw
@@ -370,25 +413,14 @@ class MinIOGCrop(MinIOUCrop):
             w = np.sum(xp, axis=1).astype(np.int32)[0]
             h = np.sum(yp, axis=1).astype(np.int32)[0]
 
-            for _ in range(self.attempts):
-                left = random.uniform(0, ulw - w)
-                top = random.uniform(0, ulh - h)
-                rect = np.array([left, top, left + w, top + h]).astype(np.int32)
-
-                overlap = self.iog_calc(data_dict['bbox'][:, :4], rect[np.newaxis, ...])
-
-                if (overlap < min_iou).any():
-                    continue
-
-                boxes = crop_bbox(data_dict['bbox'].copy(), rect[0], rect[1])
-                keep = filter_bbox_by_center(boxes, (w, h))
-
-                if len(keep) == 0:
-                    continue
+            left = random_uniform(0, ulw - w, self.attempts)
+            top = random_uniform(0, ulh - h, self.attempts)
+            rects = np.stack((left, top, left + w, top + h), axis=1).astype(np.int32)
 
-                # rect = [363, 171, 745, 872]
-                # print(rect)
+            valid = self.calc_valid(data_dict['bbox'], rects, np.array([[w, h]]), min_iou)
 
+            if valid.any():
+                rect = rects[np.argmax(valid)]
                 return rect[0], rect[1], rect[2], rect[3]
 
     def __repr__(self):
@@ -428,9 +460,9 @@ class RandomAreaCrop(CropInternode):
         width, height = get_image_size(data_dict['image'])
         area = height * width
 
+        log_ratio = (math.log(self.ratio[0]), math.log(self.ratio[1]))
         for attempt in range(self.attempts):
             target_area = random.uniform(*self.scale) * area
-            log_ratio = (math.log(self.ratio[0]), math.log(self.ratio[1]))
             aspect_ratio = math.exp(random.uniform(*log_ratio))
 
             w = int(round(math.sqrt(target_area * aspect_ratio)))
@@ -475,43 +507,21 @@ class EastRandomCrop(CropInternode):
     def calc_cropping(self, data_dict):
         assert 'poly' in data_dict.keys() or 'bbox' in data_dict.keys()
 
-        polys = []
+        bounds = calc_text_bounds(data_dict)
 
-        if 'poly' in data_dict.keys():
-            polys.extend(data_dict['poly'])
-
-        if 'bbox' in data_dict.keys():
-            for bbox in data_dict['bbox']:
-                polys.append(bbox.reshape(2, 2))
-
-        crop_x, crop_y, crop_w, crop_h = self.crop_area(data_dict['image'], polys)
+        crop_x, crop_y, crop_w, crop_h = self.crop_area(data_dict['image'], bounds)
         return crop_x, crop_y, crop_x + crop_w, crop_y + crop_h
 
-    def is_poly_in_rect(self, poly, x, y, w, h):
-        poly = np.array(poly)
-        if poly[:, 0].min() < x or poly[:, 0].max() > x + w:
-            return False
-        if poly[:, 1].min() < y or poly[:, 1].max() > y + h:
-            return False
-        return True
-
-    def is_poly_outside_rect(self, poly, x, y, w, h):
-        poly = np.array(poly).reshape(-1, 2)
-        if poly[:, 0].max() < x or poly[:, 0].min() > x + w:
-            return True
-        if poly[:, 1].max() < y or poly[:, 1].min() > y + h:
-            return True
-        return False
+    def is_poly_in_rect(self, bounds, x, y, w, h):
+        return (bounds[:, 0] >= x) & (bounds[:, 2] <= x + w) & (bounds[:, 1] >= y) & (bounds[:, 3] <= y + h)
+
+    def is_poly_outside_rect(self, bounds, x, y, w, h):
+        return (bounds[:, 2] < x) | (bounds[:, 0] > x + w) | (bounds[:, 3] < y) | (bounds[:, 1] > y + h)
 
     def split_regions(self, axis):
-        regions = []
-        min_axis = 0
-        for i in range(1, axis.shape[0]):
-            if axis[i] != axis[i - 1] + 1:
-                region = axis[min_axis:i]
-                min_axis = i
-                regions.append(region)
-        return regions
+        # the runs of consecutive positions, the last one left out
+        breaks = np.nonzero(np.diff(axis) != 1)[0] + 1
+        return np.split(axis, breaks)[:-1]
 
     def random_select(self, axis, max_size):
         xx = np.random.choice(axis, size=2)
@@ -526,29 +536,17 @@ class EastRandomCrop(CropInternode):
         selected_values = []
         for index in selected_index:
             axis = regions[index]
-            xx = int(np.random.choice(axis, size=1))
+            xx = int(np.random.choice(axis, size=1)[0])
             selected_values.append(xx)
         xmin = min(selected_values)
         xmax = max(selected_values)
         return xmin, xmax
 
-    def crop_area(self, img, polys):
+    def crop_area(self, img, bounds):
         w, h = get_image_size(img)
-        h_array = np.zeros(h, dtype=np.int32)
-        w_array = np.zeros(w, dtype=np.int32)
-        for points in polys:
-            # points = np.round(
-            #     points, decimals=0).astype(np.int32).reshape(-1, 2)
-            points = np.ceil(points).astype(np.int32).reshape(-1, 2)
-            min_x = np.min(points[:, 0])
-            max_x = np.max(points[:, 0])
-            w_array[min_x:max_x] = 1
-            min_y = np.min(points[:, 1])
-            max_y = np.max(points[:, 1])
-            h_array[min_y:max_y] = 1
         # ensure the cropped area not across a text
-        h_axis = np.where(h_array == 0)[0]
-        w_axis = np.where(w_array == 0)[0]
+        h_axis = calc_free_axis(bounds[:, 1], bounds[:, 3], h)
+        w_axis = calc_free_axis(bounds[:, 0], bounds[:, 2], w)
 
         if len(h_axis) == 0 or len(w_axis) == 0:
             return 0, 0, w, h
@@ -572,14 +570,7 @@ class EastRandomCrop(CropInternode):
                     or ymax - ymin < self.min_crop_side_ratio * h):
                 # area too small
                 continue
-            num_poly_in_rect = 0
-            for poly in polys:
-                if not self.is_poly_outside_rect(poly, xmin, ymin, xmax - xmin,
-                                                 ymax - ymin):
-                    num_poly_in_rect += 1
-                    break
-
-            if num_poly_in_rect > 0:
+            if not self.is_poly_outside_rect(bounds, xmin, ymin, xmax - xmin, ymax - ymin).all():
                 return xmin, ymin, xmax - xmin, ymax - ymin
 
         return 0, 0, w, h
@@ -600,49 +591,29 @@ class WestRandomCrop(CropInternode):
     def calc_cropping(self, data_dict):
         assert 'poly' in data_dict.keys() or 'bbox' in data_dict.keys()
 
-        polys = []
-
-        if 'poly' in data_dict.keys():
-            polys.extend(data_dict['poly'])
-
-        if 'bbox' in data_dict.keys():
-            for bbox in data_dict['bbox']:
-                polys.append(bbox.reshape(2, 2))
+        bounds = calc_text_bounds(data_dict)
 
-        xmin, ymin, xmax, ymax = self.crop_area(data_dict['image'], polys)
+        xmin, ymin, xmax, ymax = self.crop_area(data_dict['image'], bounds)
         return xmin, ymin, xmax, ymax
 
     def split_regions(self, axis, max_axis):
-        regions = [[0]]
-        for i in axis:
-            if i == 0:
-                continue
-            if i == regions[-1][-1] + 1:
-                regions[-1].append(i)
-            else:
-                regions.append([i])
-
-        if max_axis == regions[-1][-1] + 1:
-            regions[-1].append(max_axis)
-        else:
-            regions.append([max_axis])
-
-        regions = [[r[0], r[-1]] for r in regions]
-        return regions
+        # [first, last] of the runs of consecutive positions, 0 and max_axis always in one
+        axis = np.concatenate(([0], axis[axis != 0], [max_axis]))
+        breaks = np.nonzero(np.diff(axis) != 1)[0] + 1
+        starts = axis[np.concatenate(([0], breaks))]
+        ends = axis[np.concatenate((breaks - 1, [len(axis) - 1]))]
+        return np.stack((starts, ends), axis=1).tolist()
 
     def calc_regions_distances(self, regions):
-        dis = np.zeros([len(regions), len(regions)], dtype=np.float32)
-        for i in range(len(regions)):
-            for j in range(len(regions)):
-                if i != j:
-                    t = regions[i] + regions[j]
-                    dis[i][j] = max(t) - min(t)
-        return dis
+        regions = np.array(regions)
+        dis = np.maximum(regions[:, np.newaxis, 1], regions[np.newaxis, :, 1]) - np.minimum(regions[:, np.newaxis, 0], regions[np.newaxis, :, 0])
+        np.fill_diagonal(dis, 0)
+        return dis.astype(np.float32)
 
     def region_wise_random_select(self, regions, dis, length):
         flags = dis >= length
         x, y = np.nonzero(flags)
-        i = np.random.choice(np.arange(len(x), dtype=np.int32), size=1)
+        i = np.random.choice(np.arange(len(x), dtype=np.int32), size=1)[0]
         i_min = int(min(x[i], y[i]))
         i_max = int(max(x[i], y[i]))
 
@@ -660,25 +631,11 @@ class WestRandomCrop(CropInternode):
             maxv = random.randint(minv + length, right_region[1])
         return minv, maxv
 
-    def crop_area(self, img, polys):
+    def crop_area(self, img, bounds):
         w, h = get_image_size(img)
-        h_array = np.zeros(h, dtype=np.int32)
-        w_array = np.zeros(w, dtype=np.int32)
-        for points in polys:
-            points = np.ceil(points).astype(np.int32).reshape(-1, 2)
-
-            min_x = np.min(points[:, 0])
-            max_x = np.max(points[:, 0])
-
-            min_y = np.min(points[:, 1])
-            max_y = np.max(points[:, 1])
-
-            w_array[min_x:max_x] = 1
-            h_array[min_y:max_y] = 1
-
         # ensure the cropped area not across a text
-        h_axis = np.where(h_array == 0)[0]
-        w_axis = np.where(w_array == 0)[0]
+        h_axis = calc_free_axis(bounds[:, 1], bounds[:, 3], h)
+        w_axis = calc_free_axis(bounds[:, 0], bounds[:, 2], w)
 
         if len(h_axis) == 0 or len(w_axis) == 0:
             return 0, 0, w, h
@@ -1,12 +1,13 @@
 import cv2
 import math
+import warnings
 import torch
 import random
 import numpy as np
 from .builder import INTERNODE
 from .mixin import DataAugMixin
 from .base_internode import BaseInternode
-from PIL import Image, ImageOps, ImageDraw
+from PIL import Image
 from ..utils.common import get_image_size, is_pil, is_cv2
 
 
@@ -25,22 +26,36 @@ class ErasingInternode(DataAugMixin, BaseInternode):
         BaseInternode.__init__(self, **kwargs)
 
     def forward_image(self, image, meta, intl_erase_mask, intl_erase_bgd, **kwargs):
+        # intl_erase_mask is a uint8 (h, w) array, 0 where erased, intl_erase_bgd a color or a (h, w) gray noise
         if intl_erase_mask is None:
             return image, meta
 
+        noise = not isinstance(intl_erase_bgd, tuple)
+
         if is_pil(image):
-            image = Image.composite(image, intl_erase_bgd, intl_erase_mask)
+            # paste writes in place, the reader may keep the image
+            image = image.copy()
+            bgd = Image.fromarray(intl_erase_bgd) if noise else intl_erase_bgd
+            image.paste(bgd, None, Image.fromarray(intl_erase_mask == 0))
         elif is_cv2(image):
-            image = Image.fromarray(image)
-            image = Image.composite(image, intl_erase_bgd, intl_erase_mask)
-            image = np.array(image)
+            if not image.flags.writeable or not image.flags.c_contiguous:
+                image = image.copy()
+            erase = cv2.compare(intl_erase_mask, 0, cv2.CMP_EQ)
+            if noise:
+                c = image.shape[2] if image.ndim == 3 else 1
+                cv2.copyTo(cv2.merge([intl_erase_bgd] * c), erase, image)
+            else:
+                # zeroed then raised to the color, both only under the erase mask
+                cv2.subtract(image, image, dst=image, mask=erase)
+                cv2.add(image, tuple(intl_erase_bgd) + (0, ) * (4 - len(intl_erase_bgd)), dst=image, mask=erase)
         else:
-            intl_erase_mask = torch.from_numpy((np.array(intl_erase_mask) > 0).astype(np.int32))
-            intl_erase_mask = intl_erase_mask.unsqueeze(0).repeat(3, 1, 1)
-            w, h = get_image_size(image)
-            intl_erase_bgd = torch.from_numpy(np.array(intl_erase_bgd))
-            intl_erase_bgd = intl_erase_bgd.permute(2, 0, 1)
-            image = image * intl_erase_mask + intl_erase_bgd * (1 - intl_erase_mask)
+            erase = torch.from_numpy(intl_erase_mask == 0)
+            bgd = torch.from_numpy(intl_erase_bgd).type(image.dtype) if noise else intl_erase_bgd
+            for i in range(image.shape[0]):
+                if noise:
+                    image[i] = torch.where(erase, bgd, image[i])
+                else:
+                    image[i].masked_fill_(erase, bgd[i])
 
         return image, meta
 
@@ -49,19 +64,35 @@ class ErasingInternode(DataAugMixin, BaseInternode):
             return mask, meta
 
         if is_cv2(mask):
-            intl_erase_mask = (np.array(intl_erase_mask) > 0).astype(np.int32)
-            w, h = get_image_size(mask)
-            bgd = np.zeros((h, w), np.int32)
-            mask = mask * intl_erase_mask + bgd * (1 - intl_erase_mask)
+            if not mask.flags.writeable:
+                mask = mask.copy()
+            np.putmask(mask, intl_erase_mask == 0, 0)
         else:
-            intl_erase_mask = torch.from_numpy((np.array(intl_erase_mask) > 0).astype(np.int32))
-            h, w = mask.shape
-            bgd = torch.zeros(mask.shape, dtype=mask.dtype)
-            mask = mask * intl_erase_mask + bgd * (1 - intl_erase_mask)
+            mask.masked_fill_(torch.from_numpy(intl_erase_mask == 0), 0)
 
         return mask, meta
 
 
+def calc_stripes(length, d, l, st):
+    # the rows (or columns) d * i + st to d * i + st + l, for i < length // d
+    i = np.arange(length)
+    return (i >= st) & ((i - st) % d < l) & ((i - st) // d < length // d)
+
+
+def draw_stripes(rows, cols, invert):
+    # 255 on the rows and columns, 0 elsewhere, or the other way round
+    grid = np.bitwise_or.outer(rows.astype(np.uint8) * 255, cols.astype(np.uint8) * 255)
+    if invert:
+        np.bitwise_not(grid, out=grid)
+    return grid
+
+
+def calc_offset_bgd(size):
+    w, h = size
+    offset = 2 * (np.random.rand(h, w) - 0.5)
+    return np.uint8(offset * 255)
+
+
 @INTERNODE.register_module()
 class RandomErasing(ErasingInternode):
     def __init__(self, scale=(0.02, 0.33), ratio=(0.3, 3.3), offset=False, value=(0, 0, 0), tag_mapping=dict(image=['image'], mask=['mask']), **kwargs):
@@ -96,17 +127,15 @@ class RandomErasing(ErasingInternode):
                 y = random.randint(0, h - new_h)
                 x = random.randint(0, w - new_w)
 
-                param['intl_erase_mask'] = Image.new("L", get_image_size(data_dict['image']), 255)
-                draw = ImageDraw.Draw(param['intl_erase_mask'])
-                draw.rectangle((x, y, x + new_w, y + new_h), fill=0)
+                param['intl_erase_mask'] = np.full((h, w), 255, dtype=np.uint8)
+                # the corners of ImageDraw.rectangle are inclusive
+                param['intl_erase_mask'][y:y + new_h + 1, x:x + new_w + 1] = 0
 
                 if 'image' in data_dict.keys():
                     if self.offset:
-                        offset = 2 * (np.random.rand(h, w) - 0.5)
-                        offset = np.uint8(offset * 255)
-                        param['intl_erase_bgd'] = Image.fromarray(offset).convert('RGB')
+                        param['intl_erase_bgd'] = calc_offset_bgd((w, h))
                     else:
-                        param['intl_erase_bgd'] = Image.new('RGB', get_image_size(data_dict['image']), self.value)
+                        param['intl_erase_bgd'] = self.value
                 break
 
         return param
@@ -146,41 +175,42 @@ class GridMask(ErasingInternode):
         else:
             l = min(max(int(d * self.ratio + 0.5), 1), d - 1)
 
-        mask = np.ones((hh, ww), np.float32)
-
         st_h = np.random.randint(d)
         st_w = np.random.randint(d)
 
-        if self.use_h:
-            for i in range(hh // d):
-                s = d * i + st_h
-                t = min(s + l, hh)
-                mask[s:t, :] = 0
-
-        if self.use_w:
-            for i in range(ww // d):
-                s = d * i + st_w
-                t = min(s + l, ww)
-                mask[:, s:t] = 0
+        rows = calc_stripes(hh, d, l, st_h) if self.use_h else np.zeros(hh, dtype=np.bool_)
+        cols = calc_stripes(ww, d, l, st_w) if self.use_w else np.zeros(ww, dtype=np.bool_)
 
-        mask = Image.fromarray(np.uint8(mask * 255))
-        if not self.invert:
-            mask = ImageOps.invert(mask)
-
-        if self.rotate != 0:
-            r = np.random.randint(self.rotate)
-            mask = mask.rotate(r)
-
-        param = dict()
-        param['intl_erase_mask'] = mask.crop(((ww - w) // 2, (hh - h) // 2, (ww - w) // 2 + w, (hh - h) // 2 + h))
+        top, left = (hh - h) // 2, (ww - w) // 2
+        r = np.random.randint(self.rotate) if self.rotate != 0 else 0
+        if r == 0:
+            # the stripes are 0 in the grid, which is inverted unless invert
+            mask = draw_stripes(rows[top:top + h], cols[left:left + w], self.invert)
+        else:
+            # the crop of the grid rotated by r degrees around the center, filled with 0 like PIL rotate,
+            # only the part of the grid the crop reaches is drawn
+            angle = -math.radians(r)
+            a, b = math.cos(angle), math.sin(angle)
+            m = np.array([[a, b], [-b, a]])
+            cx, cy = ww / 2, hh / 2
+            corners = np.array([[left, top], [left + w, top], [left, top + h], [left + w, top + h]]) - (cx, cy)
+            src = corners @ m.T + (cx, cy)
+            x1, y1 = np.clip(np.floor(src.min(axis=0)).astype(np.int64), 0, (ww - 1, hh - 1))
+            x2, y2 = np.clip(np.ceil(src.max(axis=0)).astype(np.int64) + 1, 1, (ww, hh))
+            roi = draw_stripes(rows[y1:y2], cols[x1:x2], self.invert)
+
+            # PIL samples at pixel centers, cv2 at integer coordinates
+            shift = m @ (left + 0.5 - cx, top + 0.5 - cy) + (cx - 0.5 - x1, cy - 0.5 - y1)
+            M = np.concatenate((m, shift[:, np.newaxis]), axis=1)
+            mask = cv2.warpAffine(roi, M, (w, h), flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+        param = dict(intl_erase_mask=mask, intl_erase_bgd=None)
 
         if 'image' in data_dict.keys():
             if self.offset:
-                offset = 2 * (np.random.rand(h, w) - 0.5)
-                offset = np.uint8(offset * 255)
-                param['intl_erase_bgd'] = Image.fromarray(offset).convert('RGB')
+                param['intl_erase_bgd'] = calc_offset_bgd((w, h))
             else:
-                param['intl_erase_bgd'] = Image.new('RGB', get_image_size(data_dict['image']), 0)
+                param['intl_erase_bgd'] = (0, 0, 0)
 
         return param
 
@@ -1,10 +1,12 @@
 import os
 import cv2
 import random
+import numpy as np
 from PIL import Image
 from .builder import INTERNODE
 from .mixin import DataAugMixin
 from .base_internode import BaseInternode
+from ..utils.structures import as_poly_array
 from ..utils.common import get_image_size, is_pil, is_cv2
 from torchvision.transforms.functional import hflip, vflip
 
@@ -51,6 +53,17 @@ class Flip(DataAugMixin, BaseInternode):
     def calc_intl_param_forward(self, data_dict):
         return dict(intl_flip_wh=get_image_size(data_dict['image']))
 
+    def calc_warp_matrix(self, size, intl_flip_wh, **kwargs):
+        w, h = intl_flip_wh
+        M = np.eye(3)
+        if self.horizontal:
+            M[0, 0] = -1
+            M[0, 2] = w
+        else:
+            M[1, 1] = -1
+            M[1, 2] = h
+        return M, (w, h)
+
     def forward_image(self, image, meta, intl_flip_wh, **kwargs):
         if is_pil(image):
             mode = Image.FLIP_LEFT_RIGHT if self.horizontal else Image.FLIP_TOP_BOTTOM
@@ -102,12 +115,11 @@ class Flip(DataAugMixin, BaseInternode):
     def forward_poly(self, poly, meta, intl_flip_wh, **kwargs):
         w, h = intl_flip_wh
         
+        poly = as_poly_array(poly)
         if self.horizontal:
-            for i in range(len(poly)):
-                poly[i][:, 0] = w - poly[i][:, 0]
+            poly.data[:, 0] = w - poly.data[:, 0]
         else:
-            for i in range(len(poly)):
-                poly[i][:, 1] = h - poly[i][:, 1]
+            poly.data[:, 1] = h - poly.data[:, 1]
 
         return poly, meta
 
@@ -0,0 +1,251 @@
+import cv2
+import numpy as np
+from .bamboo import Bamboo
+from .base_internode import BaseInternode
+from .control_flow import RandomWarpper, ForwardOnly
+from .resize import ResizeInternode
+from .warp_internode import WarpInternode
+from ..utils.common import get_image_size, is_cv2
+from ..utils.warp_tools import fix_cv2_matrix
+
+
+__all__ = ['FusedWarp', 'fuse_warps']
+
+
+def is_plain_bamboo(t):
+    cls = type(t)
+    return isinstance(t, Bamboo) and cls.forward is Bamboo.forward and \
+        cls.calc_intl_param_forward is BaseInternode.calc_intl_param_forward and cls.forward_rest is BaseInternode.forward_rest
+
+
+def warp_leaves(t):
+    # geometric internodes reached from t, None if t can not be expressed as warps
+    if isinstance(t, (RandomWarpper, ForwardOnly)):
+        return warp_leaves(t.internode)
+    if type(t) is BaseInternode:
+        return []
+    if is_plain_bamboo(t):
+        leaves = []
+        for i in t.internodes:
+            sub = warp_leaves(i)
+            if sub is None:
+                return None
+            leaves += sub
+        return leaves
+    if hasattr(t, 'calc_warp_matrix'):
+        return [t]
+    return None
+
+
+def resamples(t):
+    # crop, padding, flip and rot90 move whole pixels, only these interpolate
+    return isinstance(t, (ResizeInternode, WarpInternode))
+
+
+def corners(size):
+    w, h = size
+    return np.array([(0, 0, 1), (w, 0, 1), (w, h, 1), (0, h, 1)], dtype=np.float64)
+
+
+def inside(P, size, eps=1e-3):
+    xy = P[:, :2] / P[:, 2:3]
+    return (xy >= -eps).all() and (xy[:, 0] <= size[0] + eps).all() and (xy[:, 1] <= size[1] + eps).all()
+
+
+def is_integer(v, eps=1e-6):
+    return abs(v - round(v)) < eps
+
+
+def placeholder(item, size):
+    # zero strided array, only its shape is visible to calc_intl_param_forward
+    w, h = size
+    return np.broadcast_to(np.zeros((), dtype=np.uint8), (h, w) + item.shape[2:])
+
+
+def paste(array, x, y, size):
+    # array placed at (x, y) of a zero frame, parts outside of it are cut
+    w, h = size
+    if (x, y) == (0, 0) and array.shape[1] == w and array.shape[0] == h:
+        return array
+
+    res = np.zeros((h, w) + array.shape[2:], dtype=array.dtype)
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + array.shape[1], w), min(y + array.shape[0], h)
+    if x2 > x1 and y2 > y1:
+        res[y1:y2, x1:x2] = array[y1 - y:y2 - y, x1 - x:x2 - x]
+    return res
+
+
+def warp_rect(array, M, size, interpolation):
+    """
+    M without rotation or shear besides quarter turns and flips is a transpose, a flip, one resize
+    and a paste, as the sequential path does it. None if M is not of that kind or lands between pixels.
+    """
+    eps = 1e-9
+    if not np.allclose(M[2], (0, 0, 1)):
+        return None
+
+    if abs(M[0, 0]) < eps and abs(M[1, 1]) < eps:
+        array = cv2.transpose(array)
+        M = M @ np.array([[0, 1, 0], [1, 0, 0], [0, 0, 1]], dtype=np.float64)
+    elif abs(M[0, 1]) > eps or abs(M[1, 0]) > eps:
+        return None
+
+    h, w = array.shape[:2]
+    if M[0, 0] < 0 or M[1, 1] < 0:
+        F = np.eye(3)
+        if M[0, 0] < 0:
+            F[0, 0], F[0, 2] = -1, w
+        if M[1, 1] < 0:
+            F[1, 1], F[1, 2] = -1, h
+        array = cv2.flip(array, -1 if M[0, 0] < 0 and M[1, 1] < 0 else int(M[0, 0] < 0))
+        M = M @ F
+
+    rw, rh, x, y = M[0, 0] * w, M[1, 1] * h, M[0, 2], M[1, 2]
+    if not all(is_integer(v) for v in (rw, rh, x, y)):
+        return None
+    rw, rh = int(round(rw)), int(round(rh))
+    if (rw, rh) != (w, h):
+        array = cv2.resize(array, (rw, rh), interpolation=interpolation)
+    return paste(array, int(round(x)), int(round(y)), size)
+
+
+def warp_array(array, M, size, interpolation):
+    res = warp_rect(array, M, size, interpolation)
+    if res is not None:
+        return res
+
+    M = fix_cv2_matrix(M.copy())
+    if np.allclose(M[2], (0, 0, 1)):
+        return cv2.warpAffine(array, M[:2], size, flags=interpolation)
+    return cv2.warpPerspective(array, M, size, flags=interpolation)
+
+
+class FusedWarp(object):
+    """
+    Runs a sequence of geometric internodes, bbox/point/poly are handled by the internodes
+    themselves step by step, while images and masks are resampled once with the composed matrix.
+    Crop, padding, flip and rot90 run on the images as usual while nothing is pending.
+    """
+    def __init__(self, internodes, tag_mapping):
+        self.internodes = internodes
+        self.image_tags = list(tag_mapping.get('image', []))
+        self.mask_tags = list(tag_mapping.get('mask', []))
+
+    def materialize(self, data_dict, state):
+        for tag in state['deferred'].keys():
+            data_dict.pop(tag)
+
+        if not state['pending']:
+            data_dict.update(state['deferred'])
+        else:
+            for tag, item in state['deferred'].items():
+                interpolation = cv2.INTER_LINEAR if tag in self.image_tags else cv2.INTER_NEAREST
+                data_dict[tag] = warp_array(item, state['M'], state['size'], interpolation)
+        return data_dict
+
+    def defer(self, data_dict, state):
+        state['deferred'] = dict()
+        for tag in self.image_tags + self.mask_tags:
+            if tag in data_dict.keys():
+                state['deferred'][tag] = data_dict[tag]
+                data_dict[tag] = placeholder(data_dict[tag], get_image_size(data_dict[tag]))
+        state['M'] = np.eye(3)
+        state['size'] = get_image_size(state['deferred'][self.image_tags[0]])
+        state['src_size'] = state['size']
+        state['pending'] = False
+
+    def step(self, t, data_dict, state):
+        if isinstance(t, RandomWarpper):
+            if t.calc_intl_param_forward(data_dict)['intl_random_flag']:
+                self.step(t.internode, data_dict, state)
+            return
+        if isinstance(t, ForwardOnly):
+            self.step(t.internode, data_dict, state)
+            return
+        if type(t) is BaseInternode:
+            return
+        if is_plain_bamboo(t):
+            for i in t.internodes:
+                self.step(i, data_dict, state)
+            return
+
+        param = t.calc_intl_param_forward(data_dict)
+        warp = t.calc_warp_matrix(state['size'], **param)
+        if warp is not None and (state['pending'] or resamples(t)):
+            # content cut away by a crop would come back where the step shows area outside the current frame,
+            # the sequential path fills it, so the pending warp is applied first
+            hidden = not inside(corners(state['src_size']) @ state['M'].T, state['size'])
+            exposed = not inside(corners(warp[1]) @ np.linalg.inv(warp[0]).T, state['size'])
+            if hidden and exposed:
+                self.materialize(data_dict, state)
+                self.defer(data_dict, state)
+
+            # images and masks are left out, the internode moves the rest
+            for tag in state['deferred'].keys():
+                data_dict.pop(tag)
+            t.forward(data_dict, **param)
+            t.forward_rest(data_dict, **param)
+            state['M'] = warp[0] @ state['M']
+            state['size'] = tuple(warp[1])
+            state['pending'] = True
+            for tag, item in state['deferred'].items():
+                data_dict[tag] = placeholder(item, state['size'])
+        else:
+            # exact steps with nothing pending, and steps a warp can not express, run on the images
+            self.materialize(data_dict, state)
+            t.forward(data_dict, **param)
+            t.forward_rest(data_dict, **param)
+            self.defer(data_dict, state)
+
+    def sequential(self, data_dict):
+        for t in self.internodes:
+            data_dict = t(data_dict)
+        return data_dict
+
+    def __call__(self, data_dict):
+        items = [data_dict[tag] for tag in self.image_tags + self.mask_tags if tag in data_dict.keys()]
+        if self.image_tags[0] not in data_dict.keys() or not all(is_cv2(i) for i in items):
+            return self.sequential(data_dict)
+
+        state = dict()
+        self.defer(data_dict, state)
+        for t in self.internodes:
+            self.step(t, data_dict, state)
+        return self.materialize(data_dict, state)
+
+    def __repr__(self):
+        return 'FusedWarp({})'.format(', '.join(type(t).__name__ for t in self.internodes))
+
+
+def fuse_warps(internodes, plan):
+    """
+    Replace runs of consecutive geometric internodes in plan by a FusedWarp, when the run holds
+    at least two internodes that resample.
+    internodes and plan are aligned, an entry of plan is None if the internode was dropped.
+    """
+    res = []
+    run, run_calls, run_leaves = [], [], []
+
+    def flush():
+        mappings = [t.tag_mapping for t in run_leaves]
+        if sum(resamples(t) for t in run_leaves) > 1 and 'image' in mappings[0].keys() and all(m == mappings[0] for m in mappings):
+            res.append(FusedWarp(list(run), mappings[0]))
+        else:
+            res.extend(c for c in run_calls if c is not None)
+        run.clear()
+        run_calls.clear()
+        run_leaves.clear()
+
+    for t, call in zip(internodes, plan):
+        leaves = warp_leaves(t)
+        if leaves is None:
+            flush()
+            if call is not None:
+                res.append(call)
+        else:
+            run.append(t)
+            run_calls.append(call)
+            run_leaves.extend(leaves)
+    flush()
+    return res
@@ -1,3 +1,4 @@
+import cv2
 import random
 import numpy as np
 from PIL import Image
@@ -66,18 +67,15 @@ class SwapInternode(DataAugMixin, BaseInternode):
     @staticmethod
     def swap_channels(image, swap):
         if is_pil(image):
-            image = np.array(image)
-            is_np = False
-        else:
-            is_np = True
+            # shuffle the bands, no round trip through numpy
+            return Image.merge(image.mode, [image.getchannel(i) for i in swap])
 
         if is_tensor(image):
             image = image[swap, ...]
+        elif tuple(swap) == (2, 1, 0) and image.ndim == 3 and image.shape[2] == 3 and image.dtype == np.uint8:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         else:
             image = image[..., swap]
-
-        if not is_np:
-            image = Image.fromarray(image)
         return image
 
     def forward_image(self, image, meta, **kwargs):
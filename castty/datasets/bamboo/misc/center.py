@@ -6,7 +6,7 @@ from ..base_internode import BaseInternode
 from ...utils.common import get_image_size
 from ....utils.point_tools import heatmaps2points
 from torch.nn.functional import affine_grid, grid_sample, pad, interpolate
-from ....utils.heatmap_tools import calc_gaussian_2d, gaussian_radius, gen_gaussian_target
+from ....utils.heatmap_tools import calc_gaussian_2d, gaussian_radii, gen_gaussian_targets, assign_last
 
 
 __all__ = ['CalcHeatmapByPoint', 'CalcCenterNetGrids']
@@ -30,90 +30,73 @@ class CalcHeatmapByPoint(BaseInternode):
 
         BaseInternode.__init__(self, **kwargs)
 
-    def calc_heatmap(self, size, pt, vis):
+    def calc_heatmaps(self, size, points, visible):
+        # one (K, h, w) output for all points, the shifted kernels of resample come from one grid_sample
         w, h = size
         w = int(self.ratio * w)
         h = int(self.ratio * h)
-        x, y = self.ratio * pt
-        cx, cy = round(x), round(y)
+        points = np.asarray(points).reshape(-1, 2)
+        visible = np.asarray(visible).reshape(-1).astype(np.bool_)
 
-        img = torch.zeros(h, w)
+        xy = self.ratio * points
+        cxy = np.round(xy).astype(np.int64)
+        cx, cy = cxy[:, 0], cxy[:, 1]
+        new_visible = visible & (0 <= cx) & (cx < w) & (0 <= cy) & (cy < h)
 
-        if not vis or not (0 <= cx < w) or not (0 <= cy < h):
-            return img, False
+        heatmaps = torch.zeros(len(points), h, w)
+        ids = np.nonzero(new_visible)[0]
+        if len(ids) == 0:
+            return heatmaps, new_visible
 
         if self.resample:
-            offset_x = x - cx
-            offset_y = y - cy
-            # offset_x = offset_y = 1
-            # print(x, y)
-            # print(cx, cy)
-            # print(offset_x, offset_y)
-            # print(self.w.numpy(), self.w.numpy().shape)
-
-            # a = 2 / (2 * radius + 1)
-            theta = torch.zeros(1, 2, 3)
-            theta[0, 0, 0] = 1
-            theta[0, 1, 1] = 1
-            theta[0, 0, 2] = offset_x * self.a
-            theta[0, 1, 2] = offset_y * self.a
-            # print(theta)
-
-            grid = affine_grid(theta, self.w.size(), align_corners=False)
-            warp_w = grid_sample(self.w, grid, align_corners=False).squeeze()
-
-            radius = (warp_w.shape[-1] - 1) / 2
-            # print(warp_w.numpy(), warp_w.numpy().shape, radius)
-            # exit()
+            offset = xy[ids] - cxy[ids].astype(xy.dtype)
+            theta = torch.zeros(len(ids), 2, 3)
+            theta[:, 0, 0] = 1
+            theta[:, 1, 1] = 1
+            theta[:, :, 2] = torch.from_numpy(offset * self.a)
+
+            n, c, kh, kw = self.w.shape
+            grid = affine_grid(theta, (len(ids), c, kh, kw), align_corners=False)
+            warp_ws = grid_sample(self.w.expand(len(ids), c, kh, kw), grid, align_corners=False)[:, 0]
+            radius = (kw - 1) / 2
         else:
-            # print(x, y)
-            # print(cx, cy)
-            # print(img.shape, img.dtype)
-
+            warp_ws = self.w.expand(len(ids), *self.w.shape)
             radius = 3 * self.sigma
-            warp_w = self.w
-
-        l = max(0, int(cx - radius))
-        t = max(0, int(cy - radius))
-        r = min(int(cx + radius) + 1, w)
-        b = min(int(cy + radius) + 1, h)
-
-        lo = int(radius - cx) if radius > cx else 0
-        to = int(radius - cy) if radius > cy else 0
-        ro = int(cx + radius + 1 - w) if cx + radius + 1 > w else 0
-        bo = int(cy + radius + 1 - h) if cy + radius + 1 > h else 0
-
-        wh, ww = warp_w.shape
-
-        # print(radius, warp_w.shape)
-        # print(l, t, r, b)
-        # print(lo, to, ro, bo)
-        # print(h - bo, w - ro)
-        # print(img[t:b, l:r].shape, warp_w[to:(wh - bo), lo:(ww - ro)].shape)
-        img[t:b, l:r] = warp_w[to:(wh - bo), lo:(ww - ro)]
-        # exit()
 
-        return img, True
+        wh, ww = warp_ws.shape[1:]
+        inside = (cx[ids] >= radius) & (cy[ids] >= radius) & (cx[ids] + radius + 1 <= w) & (cy[ids] + radius + 1 <= h)
+        if radius == int(radius) and inside.any():
+            # whole kernels, pasted with one indexed assignment
+            r = int(radius)
+            k = torch.from_numpy(ids[inside])
+            ys = torch.from_numpy(cy[ids[inside]] - r)[:, None] + torch.arange(wh)
+            xs = torch.from_numpy(cx[ids[inside]] - r)[:, None] + torch.arange(ww)
+            heatmaps[k[:, None, None], ys[:, :, None], xs[:, None, :]] = warp_ws[torch.from_numpy(inside)]
+            ids, warp_ws = ids[~inside], warp_ws[torch.from_numpy(~inside)]
 
-    def forward(self, data_dict, **kwargs):
-        w, h = get_image_size(data_dict['image'])
-        heatmaps_per_img = []
-        visible_per_img = []
+        for i, warp_w in zip(ids.tolist(), warp_ws):
+            x, y = int(cx[i]), int(cy[i])
 
-        visible = data_dict['point_meta']['keep']
+            l = max(0, int(x - radius))
+            t = max(0, int(y - radius))
+            r = min(int(x + radius) + 1, w)
+            b = min(int(y + radius) + 1, h)
 
-        for points, vises in zip(data_dict['point'], visible):
-            for point, vis in zip(points, vises):
-                # print('a', vis)
-                heatmap, new_vis = self.calc_heatmap((w, h), point, vis)
-                # print(new_vis)
-                heatmaps_per_img.append(heatmap.unsqueeze(0))
-                visible_per_img.append(new_vis)
+            lo = int(radius - x) if radius > x else 0
+            to = int(radius - y) if radius > y else 0
+            ro = int(x + radius + 1 - w) if x + radius + 1 > w else 0
+            bo = int(y + radius + 1 - h) if y + radius + 1 > h else 0
 
-        visible_per_img = np.array(visible_per_img).reshape(visible.shape)
-        data_dict['heatmap'] = torch.cat(heatmaps_per_img, dim=0)
+            heatmaps[i, t:b, l:r] = warp_w[to:(wh - bo), lo:(ww - ro)]
 
-        data_dict['point_meta']['keep'] = visible_per_img
+        return heatmaps, new_visible
+
+    def forward(self, data_dict, **kwargs):
+        w, h = get_image_size(data_dict['image'])
+        visible = data_dict['point_meta']['keep']
+
+        data_dict['heatmap'], visible_per_img = self.calc_heatmaps((w, h), data_dict['point'], visible)
+        data_dict['point_meta']['keep'] = visible_per_img.reshape(visible.shape)
 
         return data_dict
 
@@ -177,48 +160,53 @@ class CalcCenterNetGrids(BaseInternode):
             gt_keypoints = torch.from_numpy(data_dict['point']) * self.ratio
             visible = data_dict['point_meta']['keep']
 
-        for j, ct in enumerate(gt_centers):
-            ctx_int, cty_int = ct.int()
-            ctx, cty = ct
-            scale_box_h = (gt_bbox[j][3] - gt_bbox[j][1]) * self.ratio
-            scale_box_w = (gt_bbox[j][2] - gt_bbox[j][0]) * self.ratio
-            radius = gaussian_radius([scale_box_h, scale_box_w], min_overlap=0.3)
-            radius = max(0, int(radius))
-            ind = gt_label[j]
-            gen_gaussian_target(center_heatmap_target[ind], [ctx_int, cty_int], radius)
-
-            if self.use_bbox:
-                wh_target[0, cty_int, ctx_int] = scale_box_w
-                wh_target[1, cty_int, ctx_int] = scale_box_h
-
-                offset_target[0, cty_int, ctx_int] = ctx - ctx_int
-                offset_target[1, cty_int, ctx_int] = cty - cty_int
-
-                wh_target_weight[:, cty_int, ctx_int] = 1
-                offset_target_weight[:, cty_int, ctx_int] = 1
+        # every object and keypoint at once, scalar writes to a repeated position keep the last one like the loop did
+        ct_int = gt_centers.int()
+        ctx_int, cty_int = ct_int[:, 0], ct_int[:, 1]
+        ctx, cty = gt_centers[:, 0], gt_centers[:, 1]
+        scale_box_h = (gt_bbox[:, 3] - gt_bbox[:, 1]) * self.ratio
+        scale_box_w = (gt_bbox[:, 2] - gt_bbox[:, 0]) * self.ratio
+        radius = gaussian_radii(scale_box_h, scale_box_w, min_overlap=0.3).int().clamp(min=0)
+        gen_gaussian_targets(center_heatmap_target, gt_label, ct_int, radius)
 
-            if self.use_point:
-                for k, kpt in enumerate(gt_keypoints[j]):
-                    if not visible[j][k]:
-                        continue
+        # offset_target is shared by centers and keypoints, writes are ordered by object then keypoint
+        offset_order = []
+        offset_index = []
+        offset_value = []
 
-                    kpx_int, kpy_int = kpt.int()
-                    kpx, kpy = kpt
-                    gen_gaussian_target(kpt_heatmap_target[k], [kpx_int, kpy_int], radius)
-
-                    loc_target[2 * k, kpy_int, kpx_int] = kpx - ctx
-                    loc_target[2 * k + 1, kpy_int, kpx_int] = kpy - cty
-
-                    loc_target_weight[2 * k, kpy_int, kpx_int] = 1
-                    loc_target_weight[2 * k + 1, kpy_int, kpx_int] = 1
+        if self.use_bbox:
+            n = len(gt_centers)
+            assign_last(wh_target, (torch.tensor([0, 1]).repeat_interleave(n), cty_int.repeat(2), ctx_int.repeat(2)), torch.cat((scale_box_w, scale_box_h)))
+            wh_target_weight[:, cty_int.long(), ctx_int.long()] = 1
 
-                    offset_target[0, kpy_int, kpx_int] = kpx - kpx_int
-                    offset_target[1, kpy_int, kpx_int] = kpy - kpy_int
+            offset_order.append(torch.arange(n) * (gt_keypoints.shape[1] + 1 if self.use_point else 1))
+            offset_index.append((cty_int, ctx_int))
+            offset_value.append(torch.stack((ctx - ctx_int, cty - cty_int), dim=1))
+            offset_target_weight[:, cty_int.long(), ctx_int.long()] = 1
 
-                    offset_target_weight[:, kpy_int, kpx_int] = 1
-                    # print(loc_target.shape)
-                    # print(k, kpx_int, kpy_int, visible[j][k])
-                    # exit()
+        if self.use_point:
+            j, k = np.nonzero(visible)
+            j, k = torch.from_numpy(j), torch.from_numpy(k)
+            kpt = gt_keypoints[j, k]
+            kpt_int = kpt.int()
+            kpx_int, kpy_int = kpt_int[:, 0], kpt_int[:, 1]
+            kpx, kpy = kpt[:, 0], kpt[:, 1]
+            gen_gaussian_targets(kpt_heatmap_target, k, kpt_int, radius[j])
+
+            assign_last(loc_target, (torch.stack((2 * k, 2 * k + 1), dim=1), kpy_int[:, None], kpx_int[:, None]), torch.stack((kpx - ctx[j], kpy - cty[j]), dim=1))
+            loc_target_weight[torch.stack((2 * k, 2 * k + 1), dim=1), kpy_int[:, None].long(), kpx_int[:, None].long()] = 1
+
+            offset_order.append(j * (n_points + 1) + k + 1)
+            offset_index.append((kpy_int, kpx_int))
+            offset_value.append(torch.stack((kpx - kpx_int, kpy - kpy_int), dim=1))
+            offset_target_weight[:, kpy_int.long(), kpx_int.long()] = 1
+
+        if offset_order:
+            order = torch.argsort(torch.cat(offset_order), stable=True)
+            y = torch.cat([i[0] for i in offset_index])[order]
+            x = torch.cat([i[1] for i in offset_index])[order]
+            value = torch.cat(offset_value)[order]
+            assign_last(offset_target, (torch.tensor([[0, 1]]), y[:, None], x[:, None]), value)
 
         data_dict['center_heatmap'] = center_heatmap_target
 
@@ -5,7 +5,7 @@ import torch
 import numpy as np
 from ..builder import INTERNODE
 from ..base_internode import BaseInternode
-from .psenet import generate_effective_mask, generate_kernel
+from .psenet import generate_effective_mask, generate_kernels
 from ...utils.common import get_image_size, is_pil, clip_poly
 
 try:
@@ -134,43 +134,39 @@ class DBEncode(BaseInternode):
         y_min = padded_polygon[:, 1].min()
         y_max = padded_polygon[:, 1].max()
 
-        width = x_max - x_min + 1
-        height = y_max - y_min + 1
+        x_min_valid = min(max(0, x_min), canvas.shape[1] - 1)
+        x_max_valid = min(max(0, x_max), canvas.shape[1] - 1)
+        y_min_valid = min(max(0, y_min), canvas.shape[0] - 1)
+        y_max_valid = min(max(0, y_max), canvas.shape[0] - 1)
+
+        if x_max < 0 or y_max < 0 or x_min >= canvas.shape[1] or y_min >= canvas.shape[0]:
+            return
+
+        cv2.fillPoly(mask, [padded_polygon.astype(np.int32)], 1.0)
 
         polygon[:, 0] = polygon[:, 0] - x_min
         polygon[:, 1] = polygon[:, 1] - y_min
 
-        xs = np.broadcast_to(
-            np.linspace(0, width - 1, num=width).reshape(1, width),
-            (height, width)).astype(np.float32)
-        ys = np.broadcast_to(
-            np.linspace(0, height - 1, num=height).reshape(height, 1),
-            (height, width)).astype(np.float32)
-
-        distance_map = np.zeros((polygon.shape[0], height, width),
-                                dtype=np.float32)
+        # 1 - min over edges equals max over edges of 1 - d, and an edge only reaches the pixels
+        # within distance of it, so each edge is drawn into its own window of the valid box
         for i in range(polygon.shape[0]):
             j = (i + 1) % polygon.shape[0]
-            absolute_distance = point2line(xs, ys, polygon[i], polygon[j])
-            distance_map[i] = np.clip(absolute_distance / distance, 0, 1)
-        distance_map = distance_map.min(axis=0)
+            p1, p2 = polygon[i], polygon[j]
 
-        x_min_valid = min(max(0, x_min), canvas.shape[1] - 1)
-        x_max_valid = min(max(0, x_max), canvas.shape[1] - 1)
-        y_min_valid = min(max(0, y_min), canvas.shape[0] - 1)
-        y_max_valid = min(max(0, y_max), canvas.shape[0] - 1)
+            l = max(int(np.floor(min(p1[0], p2[0]) - distance)) - 1 + x_min, x_min_valid)
+            r = min(int(np.ceil(max(p1[0], p2[0]) + distance)) + 1 + x_min, x_max_valid)
+            t = max(int(np.floor(min(p1[1], p2[1]) - distance)) - 1 + y_min, y_min_valid)
+            b = min(int(np.ceil(max(p1[1], p2[1]) + distance)) + 1 + y_min, y_max_valid)
+            if l > r or t > b:
+                continue
 
-        if x_min_valid - x_min >= width or y_min_valid - y_min >= height:
-            return
+            # a row and a column, point2line broadcasts them to the window
+            xs = np.arange(l - x_min, r - x_min + 1, dtype=np.float32).reshape(1, -1)
+            ys = np.arange(t - y_min, b - y_min + 1, dtype=np.float32).reshape(-1, 1)
 
-        cv2.fillPoly(mask, [padded_polygon.astype(np.int32)], 1.0)
-        canvas[y_min_valid:y_max_valid + 1,
-               x_min_valid:x_max_valid + 1] = np.fmax(
-                   1 - distance_map[y_min_valid - y_min:y_max_valid - y_max +
-                                    height, x_min_valid - x_min:x_max_valid -
-                                    x_max + width],
-                   canvas[y_min_valid:y_max_valid + 1,
-                          x_min_valid:x_max_valid + 1])
+            absolute_distance = point2line(xs, ys, p1, p2)
+            window = canvas[t:b + 1, l:r + 1]
+            np.fmax(1 - np.clip(absolute_distance / distance, 0, 1).astype(np.float32), window, out=window)
 
     def forward(self, data_dict, **kwargs):
         labels = data_dict['poly_meta']['class_id']
@@ -180,19 +176,17 @@ class DBEncode(BaseInternode):
         ignore_flags = np.logical_not(data_dict['poly_meta']['keep'])
         ignore_flags = self.find_invalid(data_dict['poly'], ignore_flags)
 
-        data_dict['db_shrink_map'] = []
+        data_dict['db_shrink_map'] = np.zeros((self.num_classes, h, w), dtype=np.float32)
         for i in range(self.num_classes):
             keep = np.nonzero(labels == i)[0].tolist()
             tmp_polys = [data_dict['poly'][k] for k in keep]
             tmp_flags = [ignore_flags[k] for k in keep]
 
-            shrink_map, tmp_flags = generate_kernel((w, h), tmp_polys, self.shrink_ratio, ignore_flags=tmp_flags)
-            data_dict['db_shrink_map'].append(shrink_map)
+            _, tmp_flags = generate_kernels((w, h), tmp_polys, (self.shrink_ratio,), ignore_flags=tmp_flags, out=data_dict['db_shrink_map'][i:i + 1])
 
             for j, k in enumerate(keep):
                 ignore_flags[k] = tmp_flags[j]
 
-        data_dict['db_shrink_map'] = np.array(data_dict['db_shrink_map'])
         data_dict['db_shrink_mask'] = generate_effective_mask((w, h), data_dict['poly'], ignore_flags)
         data_dict['db_thr_map'], data_dict['db_thr_mask'] = self.generate_thr_map((h, w), data_dict['poly'], ignore_flags)
 
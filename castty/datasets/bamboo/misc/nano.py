@@ -19,6 +19,7 @@ class CalcNanoGrids(BaseInternode):
         self.top_k = top_k
         self.analysis = analysis
         self.INF = 100000000
+        self.grid_cache = dict()
 
         if len(self.strides) > 1:
             for i in range(1, len(self.strides)):
@@ -26,55 +27,49 @@ class CalcNanoGrids(BaseInternode):
 
         BaseInternode.__init__(self, **kwargs)
 
+    def get_grids(self, w, h):
+        # the grids only depend on the image size, shared by every sample of that size
+        key = (w, h)
+        if key not in self.grid_cache.keys():
+            featmap_sizes = [(h // s, w // s) for s in self.strides]
+
+            grids = []
+            num_grids = []
+            for i, (fh, fw) in enumerate(featmap_sizes):
+                y, x = get_grid2(fh, fw)
+                y, x = y.flatten() * self.strides[i], x.flatten() * self.strides[i]
+                cell_size = self.strides[i] * self.scale
+
+                grid = torch.stack(
+                    [x - 0.5 * cell_size, y - 0.5 * cell_size,
+                     x + 0.5 * cell_size, y + 0.5 * cell_size], dim=-1
+                )
+                num_grids.append(grid.shape[0])
+                grids.append(grid)
+
+            grids = torch.cat(grids)
+            grids_center = xyxy2xywh(grids)[:, :2]
+            self.grid_cache[key] = (featmap_sizes, grids, grids_center, num_grids)
+        return self.grid_cache[key]
+
     def forward(self, data_dict, **kwargs):
-        # _, h, w = data_dict['image'].shape
         w, h = get_image_size(data_dict['image'])
-        featmap_sizes = [(h // s, w // s) for s in self.strides]
-
-        grids = []
-        num_grids = []
-        for i, (fh, fw) in enumerate(featmap_sizes):
-            y, x = get_grid2(fh, fw)
-            y, x = y.flatten() * self.strides[i], x.flatten() * self.strides[i]
-            cell_size = self.strides[i] * self.scale
-
-            grid = torch.stack(
-                [x - 0.5 * cell_size, y - 0.5 * cell_size,
-                 x + 0.5 * cell_size, y + 0.5 * cell_size], dim=-1
-            )
-            num_grids.append(grid.shape[0])
-            grids.append(grid)
-
-        grids = torch.cat(grids)
-        # print(data_dict['bbox'].shape)
-        # print(data_dict['bbox_meta'])
-
-        # bboxes, labels, weights = torch.split(torch.from_numpy(data_dict['bbox']).type(torch.float), (2, 1, 1), dim=1)
+        featmap_sizes, grids, grids_center, num_grids = self.get_grids(w, h)
+        featmap_sizes = list(featmap_sizes)
+
         bboxes = torch.from_numpy(data_dict['bbox'])
         labels = torch.from_numpy(data_dict['bbox_meta']['class_id']).unsqueeze(-1).type(torch.float32)
         weights = torch.from_numpy(data_dict['bbox_meta']['score']).unsqueeze(-1).type(torch.float32)
-        # print(bboxes.shape, labels.shape, weights.shape)
-        # bboxes = bboxes.type(torch.float)
-        # labels = labels.type(torch.long)
-        # weights = weights.type(torch.float)
-
-        # print(bboxes.shape, labels.shape, weights.shape)
-        # print(bboxes)
-        # print(labels)
-        # print(weights)
-        # exit()
-
-        overlaps = calc_iou2(grids.unsqueeze(1), bboxes.unsqueeze(0))
 
-        assigned_gt_inds = overlaps.new_full((grids.shape[0],), 0, dtype=torch.long)
-        # assigned_labels = assigned_gt_inds.new_full((grids.shape[0],), -1)
+        assigned_gt_inds = torch.zeros(grids.shape[0], dtype=torch.long)
 
         if bboxes.shape[0] > 0:
-            gt_center = xyxy2xywh(bboxes.clone())[:, :2]
-            grids_center = xyxy2xywh(grids.clone())[:, :2]
+            num_gts = bboxes.shape[0]
+            gt_center = xyxy2xywh(bboxes)[:, :2]
 
-            distances = (grids_center.unsqueeze(1) -
-                         gt_center.unsqueeze(0)).pow(2).sum(-1).sqrt()
+            # the same values as .pow(2).sum(-1) without a reduction over a dim of 2
+            distances = ((grids_center[:, 0:1] - gt_center[:, 0]).pow(2) +
+                         (grids_center[:, 1:2] - gt_center[:, 1]).pow(2)).sqrt()
 
             distances = torch.split(distances, num_grids, dim=0)
             start_ids = [0] + np.array(num_grids[:-1]).cumsum().tolist()
@@ -85,40 +80,34 @@ class CalcNanoGrids(BaseInternode):
                 candidate_ids.append(topk_ids_per_level + sid)
             candidate_ids = torch.cat(candidate_ids, dim=0)
 
-            candidate_overlaps = overlaps[candidate_ids, torch.arange(bboxes.shape[0])]
+            # iou of the candidates only, each pair as it is in the full grids x gts matrix
+            candidate_overlaps = calc_iou2(grids[candidate_ids], bboxes.unsqueeze(0))
             overlaps_mean_per_gt = candidate_overlaps.mean(0)
             overlaps_std_per_gt = candidate_overlaps.std(0)
             overlaps_thr_per_gt = overlaps_mean_per_gt + overlaps_std_per_gt
 
             is_pos = candidate_overlaps >= overlaps_thr_per_gt.unsqueeze(0)
 
-            for gt_idx in range(bboxes.shape[0]):
-                candidate_ids[:, gt_idx] += gt_idx * grids.shape[0]
-            candidate_ids = candidate_ids.view(-1)
-
-            ep_bboxes_cx = grids_center[:, 0].view(1, -1).expand(bboxes.shape[0], grids.shape[0]).contiguous().view(-1)
-            ep_bboxes_cy = grids_center[:, 1].view(1, -1).expand(bboxes.shape[0], grids.shape[0]).contiguous().view(-1)
-
-            l_ = ep_bboxes_cx[candidate_ids].view(-1, bboxes.shape[0]) - bboxes[:, 0]
-            t_ = ep_bboxes_cy[candidate_ids].view(-1, bboxes.shape[0]) - bboxes[:, 1]
-            r_ = bboxes[:, 2] - ep_bboxes_cx[candidate_ids].view(-1, bboxes.shape[0])
-            b_ = bboxes[:, 3] - ep_bboxes_cy[candidate_ids].view(-1, bboxes.shape[0])
+            candidate_cx = grids_center[candidate_ids, 0]
+            candidate_cy = grids_center[candidate_ids, 1]
+            l_ = candidate_cx - bboxes[:, 0]
+            t_ = candidate_cy - bboxes[:, 1]
+            r_ = bboxes[:, 2] - candidate_cx
+            b_ = bboxes[:, 3] - candidate_cy
             is_in_gts = torch.stack([l_, t_, r_, b_], dim=1).min(dim=1)[0] > 0.01
             is_pos = is_pos & is_in_gts
 
-            overlaps_inf = torch.full_like(overlaps, -self.INF).t().contiguous().view(-1)
-            index = candidate_ids.view(-1)[is_pos.view(-1)]
-            overlaps_inf[index] = overlaps.t().contiguous().view(-1)[index]
-            overlaps_inf = overlaps_inf.view(bboxes.shape[0], -1).t()
-
-            max_overlaps, argmax_overlaps = overlaps_inf.max(dim=1)
-            assigned_gt_inds[max_overlaps != -self.INF] = argmax_overlaps[max_overlaps != -self.INF] + 1  # background 0
+            # a grid positive for several gts takes the one of highest iou, the first on ties
+            pos_grids = candidate_ids[is_pos]
+            pos_gts = torch.arange(num_gts).expand_as(candidate_ids)[is_pos]
+            pos_overlaps = candidate_overlaps[is_pos]
 
-            # assigned_labels = assigned_gt_inds.new_full((grids.shape[0],), -1)
-            # pos_inds = torch.nonzero(assigned_gt_inds > 0, as_tuple=False).squeeze()
-            # if pos_inds.numel() > 0:
-            #     gt_labels = boxes[:, 4].type(torch.long)
-            #     assigned_labels[pos_inds] = gt_labels[assigned_gt_inds[pos_inds] - 1]
+            max_overlaps = torch.full((grids.shape[0],), -float(self.INF), dtype=pos_overlaps.dtype)
+            max_overlaps.scatter_reduce_(0, pos_grids, pos_overlaps, 'amax')
+            is_max = pos_overlaps == max_overlaps[pos_grids]
+            argmax_overlaps = torch.full((grids.shape[0],), num_gts, dtype=torch.long)
+            argmax_overlaps.scatter_reduce_(0, pos_grids[is_max], pos_gts[is_max], 'amin')
+            assigned_gt_inds[pos_grids] = argmax_overlaps[pos_grids] + 1  # background 0
 
         pos_inds = torch.nonzero(assigned_gt_inds > 0, as_tuple=False).squeeze(-1)
         neg_inds = torch.nonzero(assigned_gt_inds == 0, as_tuple=False).squeeze(-1)
@@ -165,7 +154,8 @@ class CalcNanoGrids(BaseInternode):
         data_dict['nano_target'] = targets
         data_dict['num_pos'] = pos_inds.numel()
         data_dict['num_neg'] = neg_inds.numel()
-        data_dict['nano_grid'] = grids
+        # a copy, the cached grids are shared by every later sample of this size
+        data_dict['nano_grid'] = grids.clone()
         data_dict['nano_fs'] = featmap_sizes
 
         if self.analysis:
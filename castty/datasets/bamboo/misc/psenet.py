@@ -10,7 +10,6 @@ from ..crop import CropInternode, TAG_MAPPING
 from ...utils.common import get_image_size, is_pil, clip_poly
 try:
     import pyclipper
-    from shapely.geometry import Polygon as plg
 except ImportError:
     pass
 
@@ -18,39 +17,54 @@ except ImportError:
 __all__ = ['PSEEncode', 'PSECrop']
 
 
-def generate_kernel(img_size, polys, shrink_ratio, max_shrink=sys.maxsize, ignore_flags=None):
+def shrink_polygon(poly, shrink_ratios, max_shrink=sys.maxsize):
+    # area, perimeter and the clipper path once, one offset per distinct distance
+    instance = poly.reshape(-1, 2).astype(np.int32)
+    area = cv2.contourArea(instance)
+    peri = cv2.arcLength(instance, True)
+    pco = pyclipper.PyclipperOffset()
+    pco.AddPath(instance, pyclipper.JT_ROUND,
+                pyclipper.ET_CLOSEDPOLYGON)
+
+    shrunks = dict()
+    for shrink_ratio in shrink_ratios:
+        distance = min(
+            int(area * (1 - shrink_ratio * shrink_ratio) / (peri + 0.001) +
+                0.5), max_shrink)
+        if distance not in shrunks.keys():
+            shrunk = pco.Execute(-distance)
+            # check shrunk == [] or empty ndarray
+            shrunks[distance] = np.array(shrunk[0]).reshape(-1, 2).astype(np.int32) if len(shrunk) > 0 and len(shrunk[0]) > 0 else None
+        yield shrunks[distance]
+
+
+def generate_kernels(img_size, polys, shrink_ratios, max_shrink=sys.maxsize, ignore_flags=None, out=None):
+    """
+    Draws every polygon shrunk by each of shrink_ratios into out, a (len(shrink_ratios), h, w) stack.
+    A polygon whose kernel vanishes at a ratio is flagged and not drawn from that ratio on.
+    """
     w, h = img_size
-    text_kernel = np.zeros((h, w), dtype=np.float32)
+    if out is None:
+        out = np.zeros((len(shrink_ratios), h, w), dtype=np.float32)
+    assert out.shape == (len(shrink_ratios), h, w)
 
     if ignore_flags is None:
         ignore_flags = np.array([False] * len(polys))
 
     for text_ind, poly in enumerate(polys):
-        instance = poly.reshape(-1, 2).astype(np.int32)
-        area = plg(instance).area
-        peri = cv2.arcLength(instance, True)
-        distance = min(
-            int(area * (1 - shrink_ratio * shrink_ratio) / (peri + 0.001) +
-                0.5), max_shrink)
-        pco = pyclipper.PyclipperOffset()
-        pco.AddPath(instance, pyclipper.JT_ROUND,
-                    pyclipper.ET_CLOSEDPOLYGON)
-        shrunk = np.array(pco.Execute(-distance))
-
-        # check shrunk == [] or empty ndarray
-        if len(shrunk) == 0 or shrunk.size == 0:
-            ignore_flags[text_ind] = True
+        if ignore_flags[text_ind]:
             continue
-        try:
-            shrunk = np.array(shrunk[0]).reshape(-1, 2)
+        for level, shrunk in enumerate(shrink_polygon(poly, shrink_ratios, max_shrink)):
+            if shrunk is None:
+                ignore_flags[text_ind] = True
+                break
+            cv2.fillPoly(out[level], [shrunk], 1)
+    return out, ignore_flags
 
-        except Exception as e:
-            ignore_flags[text_ind] = True
-            continue
 
-        if not ignore_flags[text_ind]:
-            cv2.fillPoly(text_kernel, [shrunk.astype(np.int32)], 1)
-    return text_kernel, ignore_flags
+def generate_kernel(img_size, polys, shrink_ratio, max_shrink=sys.maxsize, ignore_flags=None):
+    text_kernel, ignore_flags = generate_kernels(img_size, polys, (shrink_ratio,), max_shrink, ignore_flags)
+    return text_kernel[0], ignore_flags
 
 
 def generate_effective_mask(img_size, polys, ignore_flags):
@@ -84,20 +98,18 @@ class PSEEncode(BaseInternode):
 
         ignore_flags = np.logical_not(data_dict['poly_meta']['keep'])
 
-        kernels = []
+        num_levels = len(self.shrink_ratio)
+        kernels = np.zeros((self.num_classes * num_levels, h, w), dtype=np.float32)
         for i in range(self.num_classes):
             keep = np.nonzero(labels == i)[0].tolist()
             tmp_polys = [data_dict['poly'][k] for k in keep]
             tmp_flags = [ignore_flags[k] for k in keep]
 
-            for s in self.shrink_ratio:
-                kernel, tmp_flags = generate_kernel((w, h), tmp_polys, s, self.max_shrink, tmp_flags)
-                kernels.append(kernel[np.newaxis, ...])
+            _, tmp_flags = generate_kernels((w, h), tmp_polys, self.shrink_ratio, self.max_shrink, tmp_flags, out=kernels[i * num_levels:(i + 1) * num_levels])
 
             for j, k in enumerate(keep):
                 ignore_flags[k] = tmp_flags[j]
 
-        kernels = np.concatenate(kernels)
         data_dict['pse_kernel'] = torch.from_numpy(kernels)
 
         pse_mask = generate_effective_mask((w, h), data_dict['poly'], ignore_flags)
@@ -132,15 +144,16 @@ class PSECrop(CropInternode):
         # target size is bigger than origin size
         t_h = t_h if t_h < h else h
         t_w = t_w if t_w < w else w
-        if torch.max(img_gt) > 0 and np.random.random_sample() < self.positive_sample_ratio:
+        if img_gt.any() and np.random.random_sample() < self.positive_sample_ratio:
 
             # make sure to crop the positive region
+            positive = torch.vstack(torch.where(img_gt))
 
             # the minimum top left to crop positive region (h,w)
-            tl = torch.min(torch.vstack(torch.where(img_gt > 0)), dim=1)[0] - torch.tensor([t_h, t_w])
+            tl = torch.min(positive, dim=1)[0] - torch.tensor([t_h, t_w])
             tl[tl < 0] = 0
             # the maximum top left to crop positive region
-            br = torch.max(torch.vstack(torch.where(img_gt > 0)), dim=1)[0] - torch.tensor([t_h, t_w])
+            br = torch.max(positive, dim=1)[0] - torch.tensor([t_h, t_w])
             br[br < 0] = 0
             # if br is too big so that crop the outside region of img
             br[0] = min(br[0], h - t_h)
@@ -161,11 +174,7 @@ class PSECrop(CropInternode):
 
         w, h = get_image_size(data_dict['image'])
 
-        img_gt = data_dict['pse_kernel']
-        img_gt = img_gt.sum(dim=0) > 0
-        img_gt = img_gt.type(torch.int32)
-        # print(torch.unique(img_gt), torch.max(img_gt))
-        # print(img_gt, img_gt.shape)
+        img_gt = data_dict['pse_kernel'].any(dim=0)
 
         top, left = self.sample_offset(img_gt, (w, h))
         right = left + self.size[0]
@@ -5,7 +5,7 @@ from ..builder import INTERNODE
 from ..base_internode import BaseInternode
 from ...utils.common import get_image_size
 from torch.nn.functional import pairwise_distance
-from ....utils.heatmap_tools import calc_gaussian_2d, gaussian_radius, gen_gaussian_target
+from ....utils.heatmap_tools import calc_gaussian_2d, gaussian_radii, gen_gaussian_targets, assign_last
 
 
 __all__ = ['CalcPTSGrids']
@@ -18,38 +18,36 @@ class CalcPTSGrids(BaseInternode):
 
         BaseInternode.__init__(self, **kwargs)
 
-    def calc_kpt2cen(self, kpt, table_id, cens, all_table_ids):
-        kpx, kpy = kpt
-        centers = cens[all_table_ids == table_id]
-        dis = pairwise_distance(centers, kpt)
-
-        lt = (centers[..., 0] < kpx) & (centers[..., 1] < kpy)
-        rt = (centers[..., 0] >= kpx) & (centers[..., 1] < kpy)
-        rb = (centers[..., 0] >= kpx) & (centers[..., 1] >= kpy)
-        lb = (centers[..., 0] < kpx) & (centers[..., 1] >= kpy)
-
-        res = torch.zeros(8, dtype=torch.float32)
-        res_weights = torch.zeros(8, dtype=torch.float32)
-
-        self.get_value(kpt, centers[lt], dis[lt], res, res_weights, 0)
-        self.get_value(kpt, centers[rt], dis[rt], res, res_weights, 1)
-        self.get_value(kpt, centers[rb], dis[rb], res, res_weights, 2)
-        self.get_value(kpt, centers[lb], dis[lb], res, res_weights, 3)
+    def calc_kpt2cen(self, kpts, table_ids, cens, all_table_ids):
+        # for every keypoint the nearest center of its table in each quadrant (lt, rt, rb, lb), ties go to the first center
+        res = torch.zeros(len(kpts), 8, dtype=torch.float32)
+        res_weights = torch.zeros(len(kpts), 8, dtype=torch.float32)
+        if len(kpts) == 0:
+            return res, res_weights
+
+        dis = pairwise_distance(cens[None], kpts[:, None])
+        same = torch.from_numpy(np.asarray(table_ids)[:, None] == np.asarray(all_table_ids)[None, :])
+
+        cx, cy = cens[None, :, 0], cens[None, :, 1]
+        kpx, kpy = kpts[:, [0]], kpts[:, [1]]
+        quadrants = [
+            (cx < kpx) & (cy < kpy),
+            (cx >= kpx) & (cy < kpy),
+            (cx >= kpx) & (cy >= kpy),
+            (cx < kpx) & (cy >= kpy),
+        ]
+
+        for k, quadrant in enumerate(quadrants):
+            mask = same & quadrant
+            has = mask.any(dim=1)
+            min_id = torch.where(mask, dis, torch.full_like(dis, float('inf'))).argmin(dim=1)[has]
+            res[has, 2 * k] = cens[min_id, 0] - kpts[has, 0]
+            res[has, 2 * k + 1] = cens[min_id, 1] - kpts[has, 1]
+            res_weights[has, 2 * k] = 1
+            res_weights[has, 2 * k + 1] = 1
 
         return res, res_weights
 
-    def get_value(self, kpt, centers, dis, res, res_weights, k):
-        if len(dis) == 0:
-            return
-        min_id = torch.argmin(dis)
-        ctx, cty = centers[min_id]
-        kpx, kpy = kpt
-
-        res[2 * k] = ctx - kpx
-        res[2 * k + 1] = cty - kpy
-        res_weights[2 * k] = 1
-        res_weights[2 * k + 1] = 1
-
     def forward(self, data_dict, **kwargs):
         w, h = get_image_size(data_dict['image'])
 
@@ -78,56 +76,38 @@ class CalcPTSGrids(BaseInternode):
         gt_keypoints = torch.from_numpy(data_dict['point']) * self.ratio
         visible = data_dict['point_meta']['keep']
 
-        for j, ct in enumerate(gt_centers):
-            ctx_int, cty_int = ct.int()
-            ctx, cty = ct
-            scale_box_h = (gt_bbox[j][3] - gt_bbox[j][1]) * self.ratio
-            scale_box_w = (gt_bbox[j][2] - gt_bbox[j][0]) * self.ratio
-            radius = gaussian_radius([scale_box_h, scale_box_w], min_overlap=0.3)
-            radius = max(0, int(radius))
-            # ind = gt_label[j]
-            gen_gaussian_target(center_heatmap_target[0], [ctx_int, cty_int], radius)
-
-            for i in range(4):
-                if not visible[j][i]:
-                    continue
-                # 到底是浮点还是取整？
-                kpx, kpy = gt_keypoints[j][i]
-                # 跟论文里图3下面公式1的计算方法不一样
-                cen2kpt_target[2 * i, cty_int, ctx_int] = kpx - ctx
-                cen2kpt_target[2 * i + 1, cty_int, ctx_int] = kpy - cty
-                cen2kpt_target_weight[2 * i, cty_int, ctx_int] = 1
-                cen2kpt_target_weight[2 * i + 1, cty_int, ctx_int] = 1
-
-            cen_offset_target[0, cty_int, ctx_int] = ctx - ctx_int
-            cen_offset_target[1, cty_int, ctx_int] = cty - cty_int
-            cen_offset_target_weight[:, cty_int, ctx_int] = 1
-
-            # table_id = center_meta['table_id'][j]
-            # startcol = center_meta['startcol'][j]
-            # endcol = center_meta['endcol'][j]
-            # startrow = center_meta['startrow'][j]
-            # endrow = center_meta['endrow'][j]
-            # print(j, table_id, startcol, endcol, startrow, endrow)
-            # exit()
-
-            for k, kpt in enumerate(gt_keypoints[j]):
-                if not visible[j][k]:
-                    continue
-
-                kpx_int, kpy_int = kpt.int()
-                kpx, kpy = kpt
-                # print(j, k, kpt)
-                gen_gaussian_target(kpt_heatmap_target[0], [kpx_int, kpy_int], radius)
-
-                res, res_weights = self.calc_kpt2cen(kpt, center_meta['table_id'][j], gt_centers, center_meta['table_id'])
-
-                kpt2cen_target[:, kpy_int, kpx_int] = res
-                kpt2cen_target_weight[:, kpy_int, kpx_int] = res_weights
-
-                kpt_offset_target[0, kpy_int, kpx_int] = kpx - kpx_int
-                kpt_offset_target[1, kpy_int, kpx_int] = kpy - kpy_int
-                kpt_offset_target_weight[:, kpy_int, kpx_int] = 1
+        # every object and keypoint at once, scalar writes to a repeated position keep the last one like the loop did
+        ct_int = gt_centers.int()
+        ctx_int, cty_int = ct_int[:, 0], ct_int[:, 1]
+        ctx, cty = gt_centers[:, 0], gt_centers[:, 1]
+        scale_box_h = (gt_bbox[:, 3] - gt_bbox[:, 1]) * self.ratio
+        scale_box_w = (gt_bbox[:, 2] - gt_bbox[:, 0]) * self.ratio
+        radius = gaussian_radii(scale_box_h, scale_box_w, min_overlap=0.3).int().clamp(min=0)
+        gen_gaussian_targets(center_heatmap_target, torch.zeros(len(gt_centers)), ct_int, radius)
+
+        # 到底是浮点还是取整？跟论文里图3下面公式1的计算方法不一样
+        j, i = np.nonzero(visible[:, :4])
+        j, i = torch.from_numpy(j), torch.from_numpy(i)
+        kpt = gt_keypoints[j, i]
+        channel = torch.stack((2 * i, 2 * i + 1), dim=1)
+        assign_last(cen2kpt_target, (channel, cty_int[j, None], ctx_int[j, None]), torch.stack((kpt[:, 0] - ctx[j], kpt[:, 1] - cty[j]), dim=1))
+        cen2kpt_target_weight[channel, cty_int[j, None].long(), ctx_int[j, None].long()] = 1
+
+        assign_last(cen_offset_target, (torch.tensor([[0, 1]]), cty_int[:, None], ctx_int[:, None]), torch.stack((ctx - ctx_int, cty - cty_int), dim=1))
+        cen_offset_target_weight[:, cty_int.long(), ctx_int.long()] = 1
+
+        j, k = np.nonzero(visible)
+        kpt = gt_keypoints[torch.from_numpy(j), torch.from_numpy(k)]
+        kpt_int = kpt.int()
+        kpx_int, kpy_int = kpt_int[:, 0], kpt_int[:, 1]
+        gen_gaussian_targets(kpt_heatmap_target, torch.zeros(len(kpt)), kpt_int, radius[torch.from_numpy(j)])
+
+        res, res_weights = self.calc_kpt2cen(kpt, center_meta['table_id'][j], gt_centers, center_meta['table_id'])
+        assign_last(kpt2cen_target, (torch.arange(8)[None], kpy_int[:, None], kpx_int[:, None]), res)
+        assign_last(kpt2cen_target_weight, (torch.arange(8)[None], kpy_int[:, None], kpx_int[:, None]), res_weights)
+
+        assign_last(kpt_offset_target, (torch.tensor([[0, 1]]), kpy_int[:, None], kpx_int[:, None]), torch.stack((kpt[:, 0] - kpx_int, kpt[:, 1] - kpy_int), dim=1))
+        kpt_offset_target_weight[:, kpy_int.long(), kpx_int.long()] = 1
 
         data_dict['center_heatmap'] = center_heatmap_target
         data_dict['kpt_heatmap'] = kpt_heatmap_target
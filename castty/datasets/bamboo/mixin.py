@@ -1,4 +1,5 @@
-from ..utils.common import TAG_MAPPING, clip_bbox, clip_poly, filter_bbox_by_length, filter_point, filter_poly, filter_list
+from ..utils.structures import as_poly_array
+from ..utils.common import TAG_MAPPING, clip_bbox, clip_poly, filter_bbox_by_length, filter_point, filter_poly
 
 
 def identity(item, meta=None, **param):
@@ -6,6 +7,8 @@ def identity(item, meta=None, **param):
 
 
 class DataAugMixin(object):
+    forward_plan = None
+
     def __init__(self, tag_mapping=None, forward_mapping=None, backward_mapping=None):
         self.tag_mapping_backward = TAG_MAPPING
         if tag_mapping is None:
@@ -35,7 +38,30 @@ class DataAugMixin(object):
         else:
             self.backward_mapping = backward_mapping
 
+    def compile(self):
+        # resolve the dispatch once, identity mappings are dropped
+        if self.tag_mapping is TAG_MAPPING:
+            # the global mapping may still grow, keep the dynamic dispatch
+            return
+
+        self.forward_plan = []
+        for map2func, tags in self.tag_mapping.items():
+            func = self.forward_mapping.get(map2func, identity)
+            if func is identity:
+                continue
+            for tag in tags:
+                self.forward_plan.append((tag, tag + '_meta', func))
+
     def forward(self, data_dict, **param):
+        if self.forward_plan is not None:
+            for tag, meta_tag, func in self.forward_plan:
+                if tag in data_dict:
+                    item, meta = func(data_dict[tag], data_dict.get(meta_tag, None), **param)
+                    data_dict[tag] = item
+                    if meta is not None:
+                        data_dict[meta_tag] = meta
+            return data_dict
+
         # print(type(self).__name__, self.tag_mapping)
         # exit()
         for map2func, tags in self.tag_mapping.items():
@@ -98,8 +124,9 @@ class BaseFilterMixin(object):
         if not self.use_base_filter:
             return poly, meta
 
+        poly = as_poly_array(poly)
         keep_poly = filter_poly(poly)
-        poly = filter_list(poly, keep_poly)
+        poly = poly[keep_poly]
 
         if meta is not None:
             # print(meta['keep'], keep_poly)
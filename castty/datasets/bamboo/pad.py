@@ -6,6 +6,7 @@ import numpy as np
 from .builder import INTERNODE
 from .base_internode import BaseInternode
 from .mixin import BaseFilterMixin, DataAugMixin
+from ..utils.structures import as_poly_array
 from torchvision.transforms.functional import pad as tensor_pad
 from .crop import crop_image, crop_bbox, crop_poly, crop_point, crop_mask
 from ..utils.common import is_pil, is_cv2, get_image_size, clip_bbox, clip_point, clip_poly
@@ -175,9 +176,9 @@ def pad_bbox(bboxes, left, top):
 
 
 def pad_poly(polys, left, top):
-    for i in range(len(polys)):
-        polys[i][..., 0] += left
-        polys[i][..., 1] += top
+    polys = as_poly_array(polys)
+    polys.data[:, 0] += left
+    polys.data[:, 1] += top
     return polys
 
 
@@ -247,6 +248,17 @@ class PaddingInternode(DataAugMixin, BaseInternode):
         w, h = get_image_size(data_dict['image'])
         return dict(intl_padding=self.calc_padding(w, h))
 
+    def calc_warp_matrix(self, size, intl_padding, **kwargs):
+        # a warp can only fill the border with zeros
+        if self.padding_mode != 'constant' or any(self.fill):
+            return None
+
+        left, top, right, bottom = intl_padding
+        M = np.eye(3)
+        M[0, 2] = left
+        M[1, 2] = top
+        return M, (size[0] + left + right, size[1] + top + bottom)
+
     def forward_image(self, image, meta, intl_padding, **kwargs):
         left, top, right, bottom = intl_padding
         image = pad_image(image, (left, top, right, bottom), self.fill, self.padding_mode)
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+import multiprocessing.util
+from ..utils.common import get_image_size
+
+
+__all__ = ['PROFILER']
+
+
+def image_size(data_dict):
+    if 'image' in data_dict.keys():
+        return tuple(get_image_size(data_dict['image']))
+    return None
+
+
+class InternodeProfiler(object):
+    """
+    Wall time, call count and image sizes per internode, keyed by the path of nested internode names.
+    Disabled it costs one attribute check per call. Samples made in DataLoader workers (forked from
+    the process that called enable) are sent back through a queue and merged by a collector thread.
+    """
+    def __init__(self):
+        self.active = False
+        self.trace = False
+        self.interval = 1.0
+        self.max_events = 1 << 20
+
+        self.pid = None
+        self.local_pid = os.getpid()
+        self.queue = None
+        self.collector = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # path -> [calls, total time, time in children, last input size, last output size]
+        self.stats = dict()
+        self.events = []
+        self.path = []
+        self.child = []
+
+        self.merged = dict()
+        self.merged_events = []
+
+    def enable(self, trace=False, interval=1.0, max_events=1 << 20):
+        self.trace = trace
+        self.interval = interval
+        self.max_events = max_events
+
+        self.pid = self.local_pid = os.getpid()
+        self.last_flush = time.perf_counter()
+        if self.queue is None:
+            # SimpleQueue writes synchronously, a Queue feeder thread may not finish before a worker exits
+            self.queue = multiprocessing.SimpleQueue()
+            self.collector = threading.Thread(target=self.collect_forever, daemon=True)
+            self.collector.start()
+
+        self.active = True
+        return self
+
+    def disable(self):
+        self.active = False
+
+    def run(self, name, fn, data_dict):
+        if not self.path and self.local_pid != os.getpid():
+            self.fork()
+
+        self.path.append(name)
+        self.child.append(0.0)
+        in_size = image_size(data_dict)
+
+        start = time.perf_counter()
+        try:
+            data_dict = fn(data_dict)
+        finally:
+            end = time.perf_counter()
+            key = tuple(self.path)
+            self.path.pop()
+            child = self.child.pop()
+            if self.child:
+                self.child[-1] += end - start
+
+        s = self.stats.get(key)
+        if s is None:
+            s = self.stats[key] = [0, 0.0, 0.0, None, None]
+        s[0] += 1
+        s[1] += end - start
+        s[2] += child
+        s[3] = in_size
+        s[4] = image_size(data_dict)
+
+        if self.trace and len(self.events) < self.max_events:
+            self.events.append((key, start, end - start, self.local_pid))
+
+        if not self.path and self.local_pid != self.pid and end - self.last_flush > self.interval:
+            self.flush()
+        return data_dict
+
+    def call(self, t, data_dict):
+        # BaseInternode.__call__ when active
+        def forward(data_dict):
+            param = t.calc_intl_param_forward(data_dict)
+            data_dict = t.forward(data_dict, **param)
+            data_dict = t.forward_rest(data_dict, **param)
+            return data_dict
+        return self.run(type(t).__name__, forward, data_dict)
+
+    def forward_plan(self, plan, data_dict):
+        # Bamboo.forward when active, compiled calls bypass __call__ and are timed here
+        for call in plan:
+            if getattr(call, '__name__', None) == '__call__':
+                data_dict = call(data_dict)
+            else:
+                data_dict = self.run(type(getattr(call, '__self__', call)).__name__, call, data_dict)
+        return data_dict
+
+    def fork(self):
+        # first sample in a worker, drop what was inherited and send the rest on exit
+        self.reset()
+        self.local_pid = os.getpid()
+        self.last_flush = time.perf_counter()
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    def flush(self):
+        if self.stats or self.events:
+            self.queue.put((self.stats, self.events))
+        self.stats = dict()
+        self.events = []
+        self.last_flush = time.perf_counter()
+
+    def merge(self, stats, events):
+        with self.lock:
+            for key, s in stats.items():
+                m = self.merged.get(key)
+                if m is None:
+                    self.merged[key] = list(s)
+                else:
+                    m[0] += s[0]
+                    m[1] += s[1]
+                    m[2] += s[2]
+                    m[3], m[4] = s[3], s[4]
+            self.merged_events.extend(events[:max(self.max_events - len(self.merged_events), 0)])
+
+    def collect_forever(self):
+        while True:
+            try:
+                stats, events = self.queue.get()
+            except (EOFError, OSError):
+                return
+            self.merge(stats, events)
+
+    def collect(self):
+        # what this process recorded plus what the workers sent so far
+        self.merge(self.stats, self.events)
+        self.stats = dict()
+        self.events = []
+        with self.lock:
+            return dict(self.merged), list(self.merged_events)
+
+    def report(self, top=None):
+        stats, _ = self.collect()
+        roots = sum(s[1] for k, s in stats.items() if len(k) == 1)
+        rows = sorted(stats.items(), key=lambda x: x[1][1] - x[1][2], reverse=True)[:top]
+
+        res = '{:<64}{:>10}{:>12}{:>12}{:>12}{:>8}  {}\n'.format('internode', 'calls', 'total ms', 'self ms', 'us/call', 'self%', 'in -> out')
+        for key, (calls, total, child, in_size, out_size) in rows:
+            name = ' > '.join(key)
+            res += '{:<64}{:>10}{:>12.1f}{:>12.1f}{:>12.1f}{:>8.1f}  {} -> {}\n'.format(
+                name, calls, total * 1e3, (total - child) * 1e3, total / calls * 1e6,
+                (total - child) / roots * 100 if roots > 0 else 0, in_size, out_size)
+        return res[:-1]
+
+    def export_chrome_trace(self, path):
+        _, events = self.collect()
+        trace = []
+        for key, start, dur, pid in events:
+            trace.append(dict(name=key[-1], cat=' > '.join(key), ph='X', ts=start * 1e6, dur=dur * 1e6, pid=pid, tid=pid))
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=trace), f)
+
+
+PROFILER = InternodeProfiler()
+
+
+if __name__ == '__main__':
+    import argparse
+    from ..data_manager import DataManager
+    from ...config import load_config_far_away
+
+    parser = argparse.ArgumentParser(description='profile the internodes of a config')
+    parser.add_argument('config', type=str)
+    parser.add_argument('--split', type=str, default='test_data')
+    parser.add_argument('--num_batches', type=int, default=100)
+    parser.add_argument('--trace', type=str, default='', help='path of a chrome trace to write')
+    parser.add_argument('--top', type=int, default=None)
+    args = parser.parse_args()
+
+    cfg = load_config_far_away(args.config)
+    cfg[args.split].dataset.profile = dict(trace=bool(args.trace))
+    data_manager = DataManager(cfg[args.split])
+
+    for i, _ in enumerate(data_manager.load_data()):
+        if i + 1 >= args.num_batches:
+            break
+    del data_manager
+
+    print(PROFILER.report(args.top))
+    if args.trace:
+        PROFILER.export_chrome_trace(args.trace)
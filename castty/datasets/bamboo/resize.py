@@ -10,6 +10,7 @@ from .mixin import DataAugMixin
 from .builder import build_internode
 from .base_internode import BaseInternode
 from .control_flow import InternodeWarpper
+from ..utils.structures import as_poly_array
 from ..utils.common import get_image_size, is_pil, is_cv2
 from torchvision.transforms import functional, InterpolationMode
 
@@ -37,9 +38,9 @@ def resize_bbox(bboxes, scale):
 
 
 def resize_poly(polys, scale):
-    for i in range(len(polys)):
-        polys[i][..., 0] *= scale[0]
-        polys[i][..., 1] *= scale[1]
+    polys = as_poly_array(polys)
+    polys.data[:, 0] *= scale[0]
+    polys.data[:, 1] *= scale[1]
     return polys
 
 
@@ -91,6 +92,13 @@ class ResizeInternode(DataAugMixin, BaseInternode):
         intl_scale, intl_new_size = self.calc_scale_and_new_size(w, h)
         return dict(intl_scale=intl_scale, intl_new_size=intl_new_size)
 
+    def calc_warp_matrix(self, size, intl_scale, intl_new_size, **kwargs):
+        # the image is stretched to intl_new_size, which intl_scale only rounds to
+        M = np.eye(3)
+        M[0, 0] = intl_new_size[0] / size[0]
+        M[1, 1] = intl_new_size[1] / size[1]
+        return M, intl_new_size
+
     def forward_image(self, image, meta, intl_scale, intl_new_size, **kwargs):
         image = resize_image(image, intl_new_size)
         return image, meta
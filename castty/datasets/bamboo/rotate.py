@@ -6,6 +6,7 @@ from PIL import Image
 from .builder import INTERNODE
 from .mixin import DataAugMixin
 from .base_internode import BaseInternode
+from ..utils.structures import PolyArray, as_poly_array
 from ..utils.common import get_image_size, is_pil, is_cv2
 from torchvision.transforms import functional, InterpolationMode
 from ..utils.warp_tools import calc_expand_size_and_matrix, warp_bbox, warp_point
@@ -77,6 +78,13 @@ class Rot90(DataAugMixin, BaseInternode):
 
         return param
 
+    def calc_warp_matrix(self, size, intl_rot90_angle, intl_rot90_matrix, **kwargs):
+        if intl_rot90_angle == 0:
+            return np.eye(3), size
+        if intl_rot90_angle == 180:
+            return intl_rot90_matrix, size
+        return intl_rot90_matrix, (size[1], size[0])
+
     def forward_image(self, image, meta, intl_rot90_angle, intl_rot90_matrix, **kwargs):
         if intl_rot90_angle == 0:
             return image, meta
@@ -136,7 +144,8 @@ class Rot90(DataAugMixin, BaseInternode):
     def forward_poly(self, poly, meta, intl_rot90_angle, intl_rot90_matrix, **kwargs):
         if intl_rot90_angle == 0:
             return poly, meta
-        poly = [warp_point(p, intl_rot90_matrix) for p in poly]
+        poly = as_poly_array(poly)
+        poly = PolyArray(data=warp_point(poly.data, intl_rot90_matrix), offsets=poly.offsets)
         return poly, meta
 
     def __repr__(self):
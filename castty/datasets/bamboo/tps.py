@@ -2,6 +2,7 @@ import os
 import torch
 import numpy as np
 from PIL import Image
+from functools import lru_cache
 from .builder import INTERNODE
 import torch.nn.functional as F
 from .mixin import DataAugMixin
@@ -14,55 +15,46 @@ __all__ = ['TPSStretch', 'TPSDistort']
 
 
 def calc_points(length):
-    a1, a2 = -1, 1
+    # (2i - l) / l is exact in the numerator, the same values as ((l - i) * -1 + i) / l
     l = length - 1
-
-    res = []
-    for i in range(length):
-        res.append(((l - i) * a1 + i * a2) / l)
-    return res
+    return (2 * np.arange(length) - l) / l
 
 
+@lru_cache(maxsize=32)
 def build_P(width, height):
     x = calc_points(width)
     y = calc_points(height)
 
     shiftx, shifty = np.meshgrid(x, y)
     xy = np.stack([shiftx, shifty], axis=-1).astype(np.float32).reshape(-1, 2)
+    # shared by every image of that size
+    xy.flags.writeable = False
     return xy  # n (= self.I_r_width x self.I_r_height) x 2
 
 
 def build_inv_delta_C(F, C):
     """ Return inv_delta_C which is needed to calculate T """
-    hat_C = np.zeros((F, F), dtype=float)  # F x F
-    for i in range(0, F):
-        for j in range(i, F):
-            r = np.linalg.norm(C[i] - C[j])
-            hat_C[i, j] = r
-            hat_C[j, i] = r
+    hat_C = np.sqrt(np.square(C[:, np.newaxis] - C[np.newaxis]).sum(axis=-1)).astype(float)  # F x F
     np.fill_diagonal(hat_C, 1)
     hat_C = (hat_C ** 2) * np.log(hat_C)
-    # print(C.shape, hat_C.shape)
-    delta_C = np.concatenate(  # F+3 x F+3
-        [
-            np.concatenate([np.ones((F, 1)), C, hat_C], axis=1),  # F x F+3
-            np.concatenate([np.zeros((2, 3)), np.transpose(C)], axis=1),  # 2 x F+3
-            np.concatenate([np.zeros((1, 3)), np.ones((1, F))], axis=1)  # 1 x F+3
-        ],
-        axis=0
-    )
+    delta_C = np.zeros((F + 3, F + 3), dtype=float)  # F+3 x F+3
+    delta_C[:F, 0] = 1
+    delta_C[:F, 1:3] = C
+    delta_C[:F, 3:] = hat_C
+    delta_C[F:F + 2, 3:] = np.transpose(C)
+    delta_C[F + 2, 3:] = 1
     inv_delta_C = np.linalg.inv(delta_C)
     return inv_delta_C  # F+3 x F+3
 
 
 def build_P_hat(F, C, P, eps=1e-6):
     n = P.shape[0]  # n (= self.I_r_width x self.I_r_height)
-    P_tile = np.tile(np.expand_dims(P, axis=1), (1, F, 1))  # n x 2 -> n x 1 x 2 -> n x F x 2
-    C_tile = np.expand_dims(C, axis=0)  # 1 x F x 2
-    P_diff = P_tile - C_tile  # n x F x 2
-    rbf_norm = np.linalg.norm(P_diff, ord=2, axis=2, keepdims=False)  # n x F
-    rbf = np.multiply(np.square(rbf_norm), np.log(rbf_norm + eps))  # n x F
-    P_hat = np.concatenate([np.ones((n, 1)), P, rbf], axis=1)
+    P_hat = np.empty((n, F + 3), dtype=float)
+    P_hat[:, 0] = 1
+    P_hat[:, 1:3] = P
+    # per axis instead of an n x F x 2 tile
+    rbf_norm = np.sqrt(np.square(P[:, 0:1] - C[:, 0]) + np.square(P[:, 1:2] - C[:, 1]))  # n x F
+    P_hat[:, 3:] = np.multiply(np.square(rbf_norm), np.log(rbf_norm + eps))  # n x F
     return P_hat  # n x F+3
 
 
@@ -73,7 +65,11 @@ def build_P_prime(tgt_cps, inv_delta_C, P_hat):
     return grids.astype(np.float32)  # n x 2
 
 
-def gen_grid(size, src_cps, tgt_cps, eps=1e-6, resize=False):
+def gen_grid(size, src_cps, tgt_cps, eps=1e-6, resize=False, grid_scale=1):
+    """
+    The sampling grid of size (height, width, 2) mapping src_cps onto tgt_cps. With grid_scale < 1
+    the spline is solved on a lattice grid_scale times smaller and upsampled bilinearly.
+    """
     width, height = size
 
     if resize:
@@ -95,21 +91,34 @@ def gen_grid(size, src_cps, tgt_cps, eps=1e-6, resize=False):
     
     n_cps = len(resized_src_cps)
 
-    P = build_P(width, height)  # 全图控制点，范围-1，1
+    grid_width, grid_height = width, height
+    if grid_scale < 1:
+        grid_width = min(max(int(np.ceil(width * grid_scale)), 2), width)
+        grid_height = min(max(int(np.ceil(height * grid_scale)), 2), height)
+
+    P = build_P(grid_width, grid_height)  # 全图控制点，范围-1，1
 
     inv_delta_C = build_inv_delta_C(n_cps, resized_src_cps)  # F+3 x F+3
     P_hat = build_P_hat(n_cps, resized_src_cps, P, eps=1e-6)  # n x F+3
     grids = build_P_prime(tgt_cps, inv_delta_C, P_hat)
-    grids = grids.reshape(height, width, 2)
+    grids = grids.reshape(grid_height, grid_width, 2)
+
+    if (grid_width, grid_height) != (width, height):
+        # both lattices span [-1, 1] corner to corner, as align_corners=True
+        grids = torch.from_numpy(grids).permute(2, 0, 1).unsqueeze(0)
+        grids = F.interpolate(grids, size=(height, width), mode='bilinear', align_corners=True)
+        grids = grids[0].permute(1, 2, 0).contiguous().numpy()
     return grids
 
 
 class TPS(DataAugMixin, BaseInternode):
-    def __init__(self, segment, resize=False, tag_mapping=dict(image=['image']), **kwargs):
+    def __init__(self, segment, resize=False, grid_scale=1, tag_mapping=dict(image=['image']), **kwargs):
         assert segment > 1
+        assert 0 < grid_scale <= 1
 
         self.segment = segment
         self.resize = resize
+        self.grid_scale = grid_scale
 
         forward_mapping = dict(
             image=self.forward_image
@@ -124,7 +133,7 @@ class TPS(DataAugMixin, BaseInternode):
 
     def forward_image(self, image, meta, intl_tps_tgt_cps, intl_tps_src_cps, **kwargs): 
         if is_tensor(image):
-            grids = gen_grid(get_image_size(image), intl_tps_src_cps, intl_tps_tgt_cps, resize=self.resize)
+            grids = gen_grid(get_image_size(image), intl_tps_src_cps, intl_tps_tgt_cps, resize=self.resize, grid_scale=self.grid_scale)
             image = image.unsqueeze(0)
             image = F.grid_sample(image, torch.from_numpy(grids).unsqueeze(0), align_corners=True)
             image = image[0]
@@ -136,7 +145,7 @@ class TPS(DataAugMixin, BaseInternode):
         else:
             is_np = False
 
-        grids = gen_grid(get_image_size(image), intl_tps_src_cps, intl_tps_tgt_cps, resize=self.resize)
+        grids = gen_grid(get_image_size(image), intl_tps_src_cps, intl_tps_tgt_cps, resize=self.resize, grid_scale=self.grid_scale)
 
         img = to_tensor(image)
         img = img.unsqueeze(0)
@@ -201,7 +210,7 @@ class TPSStretch(TPS):
         return dict(intl_tps_tgt_cps=intl_tps_tgt_cps, intl_tps_src_cps=intl_tps_src_cps)
 
     def __repr__(self):
-        return 'TPSStretch(segment={})'.format(self.segment)
+        return 'TPSStretch(segment={}, grid_scale={})'.format(self.segment, self.grid_scale)
 
 
 @INTERNODE.register_module()
@@ -245,4 +254,4 @@ class TPSDistort(TPS):
         return dict(intl_tps_tgt_cps=intl_tps_tgt_cps, intl_tps_src_cps=intl_tps_src_cps)
 
     def __repr__(self):
-        return 'TPSDistort(segment={}, resize={})'.format(self.segment, self.resize)
+        return 'TPSDistort(segment={}, resize={}, grid_scale={})'.format(self.segment, self.resize, self.grid_scale)
@@ -31,6 +31,10 @@ class Warp(Bamboo):
 
         Bamboo.__init__(self, tmp_internodes, **kwargs)
 
+    def compile(self):
+        self.internode.compile()
+        return Bamboo.compile(self)
+
     def forward(self, data_dict):
         # intl_warp_matrix = np.eye(3)
         data_dict['intl_warp_matrix'] = np.eye(3)
@@ -4,6 +4,7 @@ from PIL import Image
 from .builder import build_internode
 from .base_internode import BaseInternode
 from .mixin import BaseFilterMixin, DataAugMixin
+from ..utils.structures import PolyArray, as_poly_array
 from ..utils.common import get_image_size, is_pil, clip_bbox, clip_point, clip_poly
 from ..utils.warp_tools import fix_cv2_matrix, warp_bbox, warp_mask, warp_point, warp_image, calc_expand_size_and_matrix
 
@@ -48,6 +49,17 @@ class WarpInternode(DataAugMixin, BaseInternode, BaseFilterMixin):
             data_dict['intl_warp_matrix'] = intl_warp_rest_matrix @ data_dict['intl_warp_matrix']
         return data_dict
 
+    def calc_warp_matrix(self, size, intl_warp_tmp_matrix=None, intl_warp_tmp_size=None, **kwargs):
+        if intl_warp_tmp_matrix is None:
+            return None
+        if self.ccs:
+            return intl_warp_tmp_matrix, intl_warp_tmp_size
+
+        # without ccs the matrix acts on pixel indices, the fused matrix is on pixel centers
+        C = np.eye(3)
+        C[:2, 2] = 0.5
+        return C @ intl_warp_tmp_matrix @ np.linalg.inv(C), intl_warp_tmp_size
+
     def forward_image(self, image, meta, intl_warp_tmp_matrix, intl_warp_tmp_size, **kwargs):
         if intl_warp_tmp_matrix is None:
             return image, meta
@@ -105,7 +117,8 @@ class WarpInternode(DataAugMixin, BaseInternode, BaseFilterMixin):
         M = intl_warp_tmp_matrix
         dst_size = intl_warp_tmp_size
 
-        poly = [warp_point(p, M) for p in poly]
+        poly = as_poly_array(poly)
+        poly = PolyArray(data=warp_point(poly.data, M), offsets=poly.offsets)
         poly = clip_poly(poly, dst_size)
 
         poly, meta = self.base_filter_poly(poly, meta)
@@ -3,6 +3,7 @@ import random
 import numpy as np
 from copy import deepcopy
 from ..utils.registry import Registry, build_from_cfg
+from .bamboo.builder import build_batch_bamboo
 from torch.utils.data._utils.collate import default_collate
 
 
@@ -14,11 +15,14 @@ def build_collatefn(cfg, **default_args):
 
 
 class Collator(object):
-    def __init__(self, fn_list):
+    def __init__(self, fn_list, batch_internodes=None):
         self.fn_list = []
         for cfg in fn_list:
             self.fn_list.append(build_collatefn(cfg))
 
+        # augmentations applied to the whole batch after collating
+        self.batch_bamboo = build_batch_bamboo(batch_internodes) if batch_internodes else None
+
     def collate_fn(self, batch):
         # print(sorted(batch[0].keys()), len(batch[0].keys()))
         # exit()
@@ -36,17 +40,22 @@ class Collator(object):
             tmp = fn.collate()
             res.update(tmp)
 
+        if self.batch_bamboo is not None:
+            res = self.batch_bamboo(res)
+
         # print(sorted(res.keys()), len(res.keys()))
         # exit()
         return res
 
     def __repr__(self):
-        if len(self.fn_list) == 0:
+        if len(self.fn_list) == 0 and self.batch_bamboo is None:
             return 'Collator(None)'
         else:
             res = 'Collator(\n'
             for t in self.fn_list:
                 res += '  ' + t.__repr__() + '\n'
+            if self.batch_bamboo is not None:
+                res += '  ' + self.batch_bamboo.__repr__().replace('\n', '\n  ') + '\n'
             res = res[:-1]
             res += '\n)'
             return res
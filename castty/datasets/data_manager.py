@@ -32,8 +32,8 @@ class DataManager(object):
         else:
             batch_sampler = torch.utils.data.BatchSampler(sampler, self.cfg.batch_size, drop_uneven)
 
-        if self.cfg.collator:
-            self.cfm = Collator(self.cfg.collator)
+        if self.cfg.collator or self.cfg.batch_internodes:
+            self.cfm = Collator(self.cfg.collator if self.cfg.collator else [], self.cfg.batch_internodes)
             self.cf = self.cfm.collate_fn
         else:
             self.cf = None
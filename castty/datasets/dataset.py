@@ -1,5 +1,6 @@
 import torch.utils.data as data
 from .bamboo.builder import build_bamboo
+from .bamboo.profiler import PROFILER
 from .readers.builder import build_reader
 
 
@@ -13,6 +14,11 @@ class Dataset(data.Dataset):
         # self.bamboo = build_internode(dict(type='Bamboo', internodes=cfg.internodes), tag_mapping=self._info['tag_mapping'])
         tag_mapping = cfg.tag_mapping if cfg.tag_mapping else self._info['tag_mapping']
         self.bamboo = build_bamboo(internodes=cfg.internodes, tag_mapping=tag_mapping)
+        self.bamboo.compile(fuse_warp=bool(cfg.fuse_warp))
+
+        if cfg.profile:
+            # per internode timings, see PROFILER.report()
+            PROFILER.enable(**(cfg.profile if isinstance(cfg.profile, dict) else dict()))
 
         forcat = self._info.pop('forcat')
         self._info.update(forcat)
@@ -0,0 +1,161 @@
+import os
+import cv2
+import torch
+import random
+import pickle
+import numpy as np
+import multiprocessing
+from copy import deepcopy
+from .dataset import Dataset
+from .readers.packed import ENCODINGS, encode_image
+
+
+__all__ = ['export_dataset']
+
+
+_dataset = None
+
+
+def sample_seed(seed, epoch, index):
+    # independent of the shard layout and of the process that draws the sample
+    return int(np.random.SeedSequence([seed, epoch, index]).generate_state(1)[0])
+
+
+def init_worker(cfg):
+    global _dataset
+    # one process per core, nested thread pools only oversubscribe
+    torch.set_num_threads(1)
+    cv2.setNumThreads(0)
+    if _dataset is None:
+        # forked workers inherit the dataset of the parent
+        _dataset = Dataset(deepcopy(cfg))
+
+
+def shard_path(root, shard_id, ext):
+    return os.path.join(root, 'shard_{:05d}.{}'.format(shard_id, ext))
+
+
+def export_shard(root, shard_id, start, end, epoch_size, seed, encoding):
+    index = np.zeros((end - start, 2), dtype=np.int64)
+    dtype, tensor = None, False
+
+    tmp = shard_path(root, shard_id, 'bin.tmp')
+    with open(tmp, 'wb') as f:
+        for i in range(start, end):
+            epoch, j = divmod(i, epoch_size)
+            s = sample_seed(seed, epoch, j)
+            random.seed(s)
+            np.random.seed(s)
+            torch.manual_seed(s)
+
+            res = _dataset[j]
+            image = res.pop('image')
+            tensor = isinstance(image, torch.Tensor)
+            if tensor:
+                assert encoding == 'raw', 'tensor images need raw encoding'
+                image = image.numpy()
+            dtype = np.asarray(image).dtype.str if dtype is None else dtype
+
+            shape, buf = encode_image(image, encoding)
+            record = pickle.dumps((shape, buf, res), protocol=pickle.HIGHEST_PROTOCOL)
+            index[i - start] = (f.tell(), len(record))
+            f.write(record)
+    os.replace(tmp, shard_path(root, shard_id, 'bin'))
+
+    # the shard counts as done once its index exists
+    tmp = shard_path(root, shard_id, 'pkl.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(dict(index=index, dtype=dtype, tensor=tensor), f)
+    os.replace(tmp, shard_path(root, shard_id, 'pkl'))
+    return shard_id
+
+
+def run_shard(args):
+    return export_shard(*args)
+
+
+def export_dataset(cfg, root, num_epochs=1, num_workers=None, encoding='png', shard_size=1024, seed=0):
+    """
+    Runs the internodes of cfg (a dataset cfg) num_epochs times over the reader and writes the
+    augmented samples as packed shards readable by PackedReader(root, epoch=...). Sample i of
+    epoch e is drawn with a seed made of (seed, e, i), so the output does not depend on
+    num_workers. Shards already written by an interrupted export are kept.
+    """
+    assert encoding in ENCODINGS
+    assert num_epochs > 0 and shard_size > 0
+
+    from tqdm import tqdm
+
+    os.makedirs(root, exist_ok=True)
+    num_workers = num_workers if num_workers else os.cpu_count()
+
+    global _dataset
+    # building pops keys out of the internode cfgs
+    dataset = _dataset = Dataset(deepcopy(cfg))
+    epoch_size = len(dataset)
+    total = epoch_size * num_epochs
+    num_shards = (total + shard_size - 1) // shard_size
+
+    tasks = []
+    for shard_id in range(num_shards):
+        if not os.path.exists(shard_path(root, shard_id, 'pkl')):
+            start = shard_id * shard_size
+            tasks.append((root, shard_id, start, min(start + shard_size, total), epoch_size, seed, encoding))
+
+    if tasks:
+        ctx = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        with ctx.Pool(min(num_workers, len(tasks)), initializer=init_worker, initargs=(cfg,)) as pool:
+            for _ in tqdm(pool.imap_unordered(run_shard, tasks), total=len(tasks), initial=num_shards - len(tasks), desc='exporting'):
+                pass
+    _dataset = None
+
+    index = []
+    dtypes = set()
+    tensors = set()
+    for shard_id in range(num_shards):
+        with open(shard_path(root, shard_id, 'pkl'), 'rb') as f:
+            shard = pickle.load(f)
+        index.append(np.concatenate((np.full((len(shard['index']), 1), shard_id, dtype=np.int64), shard['index']), axis=1))
+        dtypes.add(shard['dtype'])
+        tensors.add(shard['tensor'])
+    assert len(dtypes) == 1 and len(tensors) == 1, 'images of every sample must share a type, got {} {}'.format(dtypes, tensors)
+    index = np.concatenate(index, axis=0)
+
+    info = dataset.info
+    np.save(os.path.join(root, 'index.npy'), index)
+    with open(os.path.join(root, 'info.pkl'), 'wb') as f:
+        pickle.dump(
+            dict(
+                encoding=encoding,
+                num_shards=num_shards,
+                source=dataset.__repr__(),
+                forcat={k: v for k, v in info.items() if k not in ('tag_mapping', 'api', 'cache_stats')},
+                tag_mapping=info['tag_mapping'],
+                dtype=dtypes.pop(),
+                tensor=tensors.pop(),
+                num_epochs=num_epochs,
+                epoch_size=epoch_size,
+                seed=seed
+            ),
+            f
+        )
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+    from ..config import load_config_far_away
+
+    parser = argparse.ArgumentParser(description='write augmented epochs of a config into packed shards')
+    parser.add_argument('config', type=str)
+    parser.add_argument('root', type=str)
+    parser.add_argument('--split', type=str, default='test_data')
+    parser.add_argument('--num_epochs', type=int, default=1)
+    parser.add_argument('--num_workers', type=int, default=None)
+    parser.add_argument('--encoding', type=str, default='png', choices=ENCODINGS)
+    parser.add_argument('--shard_size', type=int, default=1024, help='samples per shard')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    cfg = load_config_far_away(args.config)
+    export_dataset(cfg[args.split].dataset, args.root, args.num_epochs, args.num_workers, args.encoding, args.shard_size, args.seed)
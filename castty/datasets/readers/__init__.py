@@ -1,3 +1,4 @@
+from .cache import *
 from .cat import *
 from .ccpd import *
 from .cls import *
@@ -17,6 +18,7 @@ from .market1501 import *
 from .mhp import *
 from .mm import *
 from .mpii import *
+from .packed import *
 from .poster_layout import *
 from .psd_parse import *
 from .text_gen import *
@@ -1,7 +1,12 @@
+from .cache import CachedReader
 from ...utils.registry import Registry, build_from_cfg
 
 READER = Registry('reader')
 
 
 def build_reader(cfg, **default_args):
+    if 'cache' in cfg.keys():
+        cfg = cfg.copy()
+        cache_cfg = dict(cfg.pop('cache'))
+        return CachedReader(build_from_cfg(cfg, READER, default_args), **cache_cfg)
     return build_from_cfg(cfg, READER, default_args)
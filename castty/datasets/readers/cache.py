@@ -0,0 +1,217 @@
+import os
+import mmap
+import pickle
+import tempfile
+import numpy as np
+import multiprocessing
+from PIL import Image
+from collections import OrderedDict
+from ..utils.common import is_pil
+
+
+__all__ = ['CachedReader']
+
+
+def dump_sample(res):
+    res = dict(res)
+    pil_keys = []
+    for k, v in res.items():
+        if is_pil(v):
+            res[k] = np.array(v)
+            pil_keys.append(k)
+    return pickle.dumps((pil_keys, res), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_sample(buf):
+    pil_keys, res = pickle.loads(buf)
+    for k in pil_keys:
+        res[k] = Image.fromarray(res[k])
+    return res
+
+
+class MemorySampleCache(object):
+    def __init__(self, num_items, max_bytes):
+        assert max_bytes > 0
+
+        self.num_items = num_items
+        self.max_bytes = max_bytes
+
+        self.items = OrderedDict()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, index):
+        if index in self.items.keys():
+            self.items.move_to_end(index)
+            self.hits += 1
+            return load_sample(self.items[index])
+        self.misses += 1
+        return None
+
+    def put(self, index, res):
+        buf = dump_sample(res)
+        if len(buf) > self.max_bytes or index in self.items.keys():
+            return
+
+        while self.used + len(buf) > self.max_bytes:
+            _, old = self.items.popitem(last=False)
+            self.used -= len(old)
+
+        self.items[index] = buf
+        self.used += len(buf)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return 'MemorySampleCache(max_bytes={}, items={}, hits={}, misses={})'.format(self.max_bytes, len(self), self.hits, self.misses)
+
+
+class MmapSampleCache(object):
+    # layout: [clock, hits, misses] + table[num_items, (offset, nbytes, stamp)] + arena
+    def __init__(self, num_items, max_bytes, path=None):
+        assert max_bytes > 0
+
+        self.num_items = num_items
+        self.max_bytes = max_bytes
+        self.header_bytes = (3 + num_items * 3) * 8
+
+        if path is None:
+            shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            fd, path = tempfile.mkstemp(prefix='castty_cache_', dir=shm_dir)
+            os.close(fd)
+            self.owned = True
+        else:
+            self.owned = False
+        self.path = path
+        self.owner_pid = os.getpid()
+
+        with open(self.path, 'wb') as f:
+            f.truncate(self.header_bytes + self.max_bytes)
+
+        self.lock = multiprocessing.Lock()
+        self.open()
+
+    def open(self):
+        self.f = open(self.path, 'r+b')
+        self.mm = mmap.mmap(self.f.fileno(), self.header_bytes + self.max_bytes)
+
+        header = np.frombuffer(self.mm, dtype=np.int64, count=3 + self.num_items * 3)
+        self.counters = header[:3]
+        self.table = header[3:].reshape(self.num_items, 3)
+        self.arena = memoryview(self.mm)[self.header_bytes:]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['f', 'mm', 'counters', 'table', 'arena']:
+            state.pop(k)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
+
+    @property
+    def hits(self):
+        return int(self.counters[1])
+
+    @property
+    def misses(self):
+        return int(self.counters[2])
+
+    def get(self, index):
+        with self.lock:
+            offset, nbytes, stamp = self.table[index]
+            if stamp == 0:
+                self.counters[2] += 1
+                return None
+            self.counters[0] += 1
+            self.counters[1] += 1
+            self.table[index, 2] = self.counters[0]
+            buf = self.arena[offset:offset + nbytes].tobytes()
+        return load_sample(buf)
+
+    def alloc(self, nbytes):
+        while True:
+            live = np.nonzero(self.table[:, 2] > 0)[0]
+            live = live[np.argsort(self.table[live, 0])]
+
+            ends = self.table[live, 0] + self.table[live, 1]
+            gap_starts = np.concatenate(([0], ends))
+            gap_ends = np.concatenate((self.table[live, 0], [self.max_bytes]))
+            fit = np.nonzero(gap_ends - gap_starts >= nbytes)[0]
+            if len(fit) > 0:
+                return int(gap_starts[fit[0]])
+
+            lru = live[np.argmin(self.table[live, 2])]
+            self.table[lru] = 0
+
+    def put(self, index, res):
+        buf = dump_sample(res)
+        if len(buf) > self.max_bytes:
+            return
+
+        with self.lock:
+            if self.table[index, 2] > 0:
+                return
+            offset = self.alloc(len(buf))
+            self.arena[offset:offset + len(buf)] = buf
+            self.counters[0] += 1
+            self.table[index] = (offset, len(buf), self.counters[0])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.table[:, 2]))
+
+    def __del__(self):
+        # the views into the map go first, a map with exported buffers can not be closed
+        if getattr(self, 'arena', None) is not None:
+            self.arena.release()
+        self.counters = self.table = self.arena = None
+        if getattr(self, 'mm', None) is not None:
+            self.mm.close()
+        if getattr(self, 'f', None) is not None:
+            self.f.close()
+        if getattr(self, 'owned', False) and self.owner_pid == os.getpid() and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __repr__(self):
+        return 'MmapSampleCache(max_bytes={}, items={}, hits={}, misses={})'.format(self.max_bytes, len(self), self.hits, self.misses)
+
+
+CACHE_KINDS = dict(
+    memory=MemorySampleCache,
+    mmap=MmapSampleCache
+)
+
+
+class CachedReader(object):
+    def __init__(self, reader, kind='mmap', max_bytes=1 << 30, **kwargs):
+        assert kind in CACHE_KINDS.keys()
+
+        self.reader = reader
+        # kept off the shared info dict, it holds a lock and the cached samples
+        self.cache = CACHE_KINDS[kind](len(reader), max_bytes, **kwargs)
+
+    @property
+    def info(self):
+        # counters as plain numbers, the cache itself stays out of the info dict
+        return dict(self.reader.info, cache_stats=dict(hits=self.cache.hits, misses=self.cache.misses, items=len(self.cache)))
+
+    def __getattr__(self, name):
+        if name == 'reader':
+            raise AttributeError(name)
+        return getattr(self.reader, name)
+
+    def __getitem__(self, index):
+        res = self.cache.get(index)
+        if res is None:
+            res = self.reader[index]
+            self.cache.put(index, res)
+        return res
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __repr__(self):
+        return 'CachedReader(\n  {}\n  {}\n  )'.format(self.reader.__repr__(), self.cache.__repr__())
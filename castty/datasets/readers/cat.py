@@ -1,44 +1,73 @@
+import time
+import bisect
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from .reader import Reader
+from .cache import CachedReader
 from .builder import READER, build_reader
 
 
 __all__ = ['CatReader']
 
 
+def timed_build_reader(cfg):
+    start = time.perf_counter()
+    reader = build_reader(cfg)
+    return reader, time.perf_counter() - start
+
+
 @READER.register_module()
 class CatReader(Reader):
-    def __init__(self, readers, use_pil=True, output_gid=False, **kwargs):
+    def __init__(self, readers, use_pil=True, output_gid=False, build_workers=0, build_backend='thread', **kwargs):
         assert len(readers) > 1
+        assert build_backend in ('thread', 'process')
 
         self.output_gid = output_gid
 
-        self.readers = []
+        cfgs = []
         for cfg in readers:
             assert cfg['type'] != 'CatReader'
             cfg['use_pil'] = use_pil
-            self.readers.append(build_reader(cfg))
-            if len(self.readers) > 1:
-                assert self.readers[-2].info['forcat'] == self.readers[-1].info['forcat']
+            cfgs.append(cfg)
 
-        self.groups = [0]
-        for i in self.readers:
-            self.groups.append(len(i))
+        if build_workers > 0:
+            # json parsing holds the gil, processes for readers that parse big annotation files, their readers are pickled back
+            if build_backend == 'thread':
+                executor = ThreadPoolExecutor(min(build_workers, len(cfgs)))
+            else:
+                # a sample cache holds a lock that can not be pickled back, it is built here around the returned reader
+                cache_cfgs = [cfg.get('cache') for cfg in cfgs]
+                cfgs = [{k: v for k, v in cfg.items() if k != 'cache'} for cfg in cfgs]
+                ctx = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+                executor = ProcessPoolExecutor(min(build_workers, len(cfgs)), mp_context=ctx)
+            with executor:
+                built = list(executor.map(timed_build_reader, cfgs))
+            if build_backend == 'process':
+                built = [(r if c is None else CachedReader(r, **dict(c)), t) for (r, t), c in zip(built, cache_cfgs)]
+        else:
+            built = [timed_build_reader(cfg) for cfg in cfgs]
+
+        self.readers = [r for r, _ in built]
+        # seconds each child took to build, shown by __repr__
+        self.build_times = [t for _, t in built]
+        for i in range(1, len(self.readers)):
+            assert self.readers[i - 1].info['forcat'] == self.readers[i].info['forcat']
 
-        for i in range(len(self.groups) - 1):
-            self.groups[i + 1] += self.groups[i]
+        self.groups = np.zeros(len(self.readers) + 1, dtype=np.int64)
+        self.groups[1:] = np.cumsum([len(r) for r in self.readers])
 
         self._info = dict()
         for i in self.readers:
-            self._info.update(i.info)
+            # cache_stats of a cached child is a snapshot of that child only
+            self._info.update({k: v for k, v in i.info.items() if k != 'cache_stats'})
 
     def get_offset(self, index):
-        for i in range(len(self.groups) - 1):
-            if self.groups[i] <= index < self.groups[i + 1]:
-                index -= self.groups[i]
-                break
-            elif index < self.groups[i]:
-                raise ValueError
-        return index, i
+        if index < 0 or index >= self.groups[-1]:
+            raise ValueError
+        # bisect beats searchsorted on one scalar
+        i = bisect.bisect_right(self.groups, index) - 1
+        return index - int(self.groups[i]), i
 
     def __getitem__(self, index):
         offset, gid = self.get_offset(index)
@@ -48,12 +77,12 @@ class CatReader(Reader):
         return res
 
     def __len__(self):
-        return self.groups[-1]
+        return int(self.groups[-1])
 
     def __repr__(self):
         res = 'CatReader(\n'
-        for t in self.readers:
-            res += '  ' + t.__repr__() + '\n'
+        for t, s in zip(self.readers, self.build_times):
+            res += '  ' + t.__repr__() + ' built in {:.2f}s\n'.format(s)
         res += '  output_gid={}'.format(self.output_gid)
         res += '\n  )'
         return res
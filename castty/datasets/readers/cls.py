@@ -3,6 +3,7 @@ import numpy as np
 from .reader import Reader
 from .builder import READER
 from .utils import is_image_file
+from .manifest import walk
 from ..utils.structures import Meta
 from ..utils.common import get_image_size
 
@@ -16,16 +17,19 @@ class ImageFolderReader(Reader):
         super(ImageFolderReader, self).__init__(**kwargs)
 
         self.root = root
-        self.classes = [d.name for d in os.scandir(self.root) if d.is_dir()]
+        # one walk of the root, its top lists the class directories
+        walked = walk(self.root, followlinks=True, manifest=self.manifest)
+        self.classes = list(walked[0][1])
         self.classes.sort()
         self.class_to_idx = {self.classes[i]: i for i in range(len(self.classes))}
 
+        groups = dict()
+        for w in walked[1:]:
+            groups.setdefault(os.path.relpath(w[0], self.root).split(os.sep)[0], []).append(w)
+
         self.samples = []
         for target in sorted(self.class_to_idx.keys()):
-            d = os.path.join(self.root, target)
-            if not os.path.isdir(d):
-                continue
-            for root, _, fnames in sorted(os.walk(d, followlinks=True)):
+            for root, _, fnames in sorted(groups.get(target, [])):
                 for fname in sorted(fnames):
                     path = os.path.join(root, fname)
                     if is_image_file(path):
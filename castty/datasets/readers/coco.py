@@ -1,9 +1,11 @@
 import os
+import json
 import numpy as np
 from PIL import Image
 from .reader import Reader
 from .builder import READER
 from ..utils.structures import Meta
+from .utils import group_by_index, load_index_cache, save_index_cache
 from ...utils.bbox_tools import xywh2xyxy
 
 
@@ -28,14 +30,15 @@ coco_classes = ('person', 'bicycle', 'car', 'motorcycle', 'airplane',
 
 @READER.register_module()
 class COCOAPIReader(Reader):
-    def __init__(self, set_path, img_root, classes=coco_classes, use_keypoint=False, **kwargs):
+    def __init__(self, set_path, img_root, classes=coco_classes, use_keypoint=False, keep_api=False, index_cache=False, **kwargs):
         super(COCOAPIReader, self).__init__(**kwargs)
 
         self.set = set_path
         self.img_root = img_root
         self.classes = classes
-        self.use_instance_mask = False
         self.use_keypoint = use_keypoint
+        self.keep_api = keep_api
+        self.index_cache = index_cache
 
         if self.use_keypoint:
             self.classes = ['person']
@@ -43,14 +46,44 @@ class COCOAPIReader(Reader):
         assert os.path.exists(self.set)
         assert os.path.exists(self.img_root)
 
-        from pycocotools.coco import COCO
+        cache_path = self.set + '.npz'
+        index = load_index_cache(cache_path, self.set) if self.index_cache else None
 
-        self.coco_api = COCO(self.set)
-        self.cat_ids = sorted(self.coco_api.getCatIds())
+        if self.keep_api or index is None:
+            with open(self.set, 'r') as f:
+                dataset = json.load(f)
+
+            if index is None:
+                index = self.compile_annotations(dataset)
+                if self.index_cache:
+                    save_index_cache(cache_path, self.set, index)
+
+            if self.keep_api:
+                from pycocotools.coco import COCO
+
+                self.coco_api = COCO()
+                self.coco_api.dataset = dataset
+                self.coco_api.createIndex()
+            else:
+                self.coco_api = None
+            del dataset
+        else:
+            self.coco_api = None
+
+        if self.use_keypoint:
+            assert 'keypoints' in index.keys()
+
+        self.img_ids = index['img_ids']
+        self.file_names = index['file_names']
+        self.widths = index['widths']
+        self.heights = index['heights']
+        self.offsets = index['offsets']
+        self.boxes = index['boxes']
+        self.labels = index['labels']
+        self.iscrowd = index['iscrowd']
+        self.keypoints = index.get('keypoints', None)
+        self.cat_ids = index['cat_ids'].tolist()
         self.cat2label = {cat_id: i for i, cat_id in enumerate(self.cat_ids)}
-        # self.cats = self.coco_api.loadCats(self.cat_ids)
-        self.img_ids = sorted(self.coco_api.imgs.keys())
-        self.data_info = self.coco_api.loadImgs(self.img_ids)
 
         self._info = dict(
             forcat=dict(
@@ -62,78 +95,82 @@ class COCOAPIReader(Reader):
                 image=['image'],
                 bbox=['bbox']
             ),
-            api=self.coco_api,
             ids=self.cat_ids
         )
 
+        if self.keep_api:
+            self._info['api'] = self.coco_api
+
         if self.use_keypoint:
             self._info['forcat']['point'] = dict()
+            self._info['tag_mapping']['point'] = ['point']
             # self._info['forcat']['point']
 
+    @staticmethod
+    def compile_annotations(dataset):
+        imgs = sorted({img['id']: img for img in dataset['images']}.values(), key=lambda x: x['id'])
+        img_ids = np.array([img['id'] for img in imgs], dtype=np.int64)
+        cat_ids = np.array(sorted([cat['id'] for cat in dataset['categories']]), dtype=np.int64)
+
+        anns = dataset.get('annotations', [])
+        img_index = {img_id: i for i, img_id in enumerate(img_ids.tolist())}
+
+        ann_img = np.array([img_index.get(ann['image_id'], -1) for ann in anns], dtype=np.int64)
+        xywh = np.array([ann['bbox'] for ann in anns], dtype=np.float64).reshape(-1, 4)
+        area = np.array([ann['area'] for ann in anns], dtype=np.float64)
+        ignore = np.array([ann.get('ignore', False) for ann in anns], dtype=np.bool_)
+        iscrowd = np.array([ann.get('iscrowd', 0) for ann in anns], dtype=np.bool_)
+        cats = np.array([ann['category_id'] for ann in anns], dtype=np.int64)
+
+        valid = (ann_img >= 0) & ~ignore & (area > 0) & (xywh[:, 2] >= 1) & (xywh[:, 3] >= 1) & np.isin(cats, cat_ids)
+        valid = np.nonzero(valid)[0]
+
+        order, offsets = group_by_index(ann_img[valid], len(img_ids))
+        valid = valid[order]
+
+        xyxy = xywh[valid].copy()
+        xyxy[:, 2:] += xyxy[:, :2]
+
+        index = dict(
+            img_ids=img_ids,
+            file_names=np.array([img['file_name'] for img in imgs]),
+            widths=np.array([img['width'] for img in imgs], dtype=np.int64),
+            heights=np.array([img['height'] for img in imgs], dtype=np.int64),
+            offsets=offsets,
+            boxes=xyxy.astype(np.float32),
+            labels=np.searchsorted(cat_ids, cats[valid]).astype(np.int32),
+            iscrowd=iscrowd[valid],
+            cat_ids=cat_ids,
+        )
+
+        if len(anns) > 0 and all('keypoints' in ann for ann in anns):
+            keypoints = [anns[i]['keypoints'] for i in valid.tolist()]
+            num_keypoints = len(anns[0]['keypoints']) // 3
+            index['keypoints'] = np.array(keypoints, dtype=np.float32).reshape(-1, num_keypoints, 3)
+
+        return index
+
     def read_annotations(self, idx):
-        img_id = self.img_ids[idx]
-        ann_ids = self.coco_api.getAnnIds([img_id])
-        anns = self.coco_api.loadAnns(ann_ids)
-        gt_bboxes = []
-        gt_labels = []
-        gt_bboxes_ignore = []
-
-        if self.use_instance_mask:
-            gt_masks = []
-        if self.use_keypoint:
-            gt_keypoints = []
-
-        for ann in anns:
-            if ann.get('ignore', False):
-                continue
-            x1, y1, w, h = ann['bbox']
-            if ann['area'] <= 0 or w < 1 or h < 1:
-                continue
-            if ann['category_id'] not in self.cat_ids:
-                continue
-            bbox = [x1, y1, x1 + w, y1 + h]
-            if ann['iscrowd']:
-                gt_bboxes_ignore.append(bbox)
-            else:
-                gt_bboxes.append(bbox)
-                gt_labels.append(self.cat2label[ann['category_id']])
-                if self.use_instance_mask:
-                    gt_masks.append(self.coco_api.annToMask(ann))
-                if self.use_keypoint:
-                    gt_keypoints.append(np.array(ann['keypoints'], dtype=np.float32).reshape(1, -1, 3))
-
-        if gt_bboxes:
-            gt_bboxes = np.array(gt_bboxes, dtype=np.float32)
-            gt_labels = np.array(gt_labels, dtype=np.int32)
-        else:
-            gt_bboxes = np.zeros((0, 4), dtype=np.float32)
-            gt_labels = np.array([], dtype=np.int32)
+        s, e = self.offsets[idx], self.offsets[idx + 1]
 
-        if gt_bboxes_ignore:
-            gt_bboxes_ignore = np.array(gt_bboxes_ignore, dtype=np.float32)
-        else:
-            gt_bboxes_ignore = np.zeros((0, 4), dtype=np.float32)
+        crowd = self.iscrowd[s:e]
+        keep = ~crowd
 
         annotation = dict(
-            bboxes=gt_bboxes, labels=gt_labels, bboxes_ignore=gt_bboxes_ignore)
-
-        if self.use_instance_mask:
-            annotation['masks'] = gt_masks
+            bboxes=self.boxes[s:e][keep],
+            labels=self.labels[s:e][keep],
+            bboxes_ignore=self.boxes[s:e][crowd]
+        )
 
         if self.use_keypoint:
-            if gt_keypoints:
-                annotation['keypoints'] = np.concatenate(gt_keypoints, axis=0)
-            else:
-                annotation['keypoints'] = np.zeros((0, 17, 3), dtype=np.float32)
+            annotation['keypoints'] = self.keypoints[s:e][keep]
 
         return annotation
 
     def __getitem__(self, index):
-        img_info = self.data_info[index]
-
-        path = os.path.join(self.img_root, img_info['file_name'])
+        path = os.path.join(self.img_root, self.file_names[index])
         img = self.read_image(path)
-        w, h = img_info['width'], img_info['height']
+        w, h = int(self.widths[index]), int(self.heights[index])
 
         anno = self.read_annotations(index)
 
@@ -149,7 +186,7 @@ class COCOAPIReader(Reader):
             image=img,
             bbox=bbox,
             bbox_meta=bbox_meta,
-            image_meta=dict(ori_size=(w, h), path=path, coco_id=img_info['id']),
+            image_meta=dict(ori_size=(w, h), path=path, coco_id=int(self.img_ids[index])),
         )
 
         if self.use_keypoint:
@@ -162,4 +199,4 @@ class COCOAPIReader(Reader):
         return len(self.img_ids)
 
     def __repr__(self):
-        return 'COCOAPIReader(set_path={}, img_root={}, classes={}, use_keypoint={}, {})'.format(self.set, self.img_root, self.classes, self.use_keypoint, super(COCOAPIReader, self).__repr__())
+        return 'COCOAPIReader(set_path={}, img_root={}, classes={}, use_keypoint={}, keep_api={}, index_cache={}, {})'.format(self.set, self.img_root, self.classes, self.use_keypoint, self.keep_api, self.index_cache, super(COCOAPIReader, self).__repr__())
@@ -3,7 +3,7 @@ import pickle
 import numpy as np
 from .reader import Reader
 from .builder import READER
-from ..utils.structures import Meta
+from ..utils.structures import Meta, PolyArray
 from ..utils.common import get_image_size
 
 
@@ -61,7 +61,7 @@ class DDI100SubsetDetReader(Reader):
         return dict(
             image=img,
             image_meta=dict(ori_size=(w, h), path=path),
-            poly=polys,
+            poly=PolyArray(polys),
             poly_meta=meta
         )
 
@@ -2,6 +2,7 @@ import os
 import numpy as np
 from .reader import Reader
 from .builder import READER
+from .manifest import listdir
 
 
 __all__ = ['DukeMTMCAttritubesReader']
@@ -101,7 +102,7 @@ class DukeMTMCAttritubesReader(Reader):
 
         self.pids = []
         self.img_paths = []
-        tmp = sorted(os.listdir(img_root))
+        tmp = sorted(listdir(img_root, manifest=self.manifest))
         for t in tmp:
             self.img_paths.append(os.path.join(img_root, t))
             self.pids.append(t.split('_')[0])
@@ -3,7 +3,7 @@ from PIL import Image, ImageDraw
 
 from .reader import Reader
 from .builder import READER
-from ..utils.structures import Meta
+from ..utils.structures import Meta, PolyArray
 from ..utils.common import get_image_size
 
 
@@ -94,7 +94,7 @@ class FondReader(Reader):
             res['point'] = points
             res['point_meta'] = point_meta
         if 'poly' in self.mode:
-            res['poly'] = polys
+            res['poly'] = PolyArray(polys)
             res['poly_meta'] = poly_meta
 
         return res
@@ -2,7 +2,8 @@ import os
 import numpy as np
 from .reader import Reader
 from .builder import READER
-from ..utils.structures import Meta
+from .manifest import listdir
+from ..utils.structures import Meta, PolyArray
 from ..utils.common import get_image_size
 
 
@@ -27,8 +28,8 @@ class ICDARDetReader(Reader):
         assert os.path.exists(self.img_root)
         assert os.path.exists(self.txt_root)
 
-        self.image_paths = sorted(os.listdir(self.img_root))
-        self.txt_paths = sorted(os.listdir(self.txt_root))
+        self.image_paths = sorted(listdir(self.img_root, manifest=self.manifest))
+        self.txt_paths = sorted(listdir(self.txt_root, manifest=self.manifest))
 
         self._info = dict(
             forcat=dict(
@@ -76,7 +77,7 @@ class ICDARDetReader(Reader):
         return dict(
             image=img,
             image_meta=dict(ori_size=(w, h), path=path),
-            poly=polys,
+            poly=PolyArray(polys),
             poly_meta=meta
         )
 
@@ -15,7 +15,7 @@ class ImageReader(Reader):
 
         assert os.path.exists(root)
         self.root = root
-        self.image_paths = read_image_paths(self.root)
+        self.image_paths = read_image_paths(self.root, manifest=self.manifest)
         assert len(self.image_paths) > 0
 
         self._info = dict(forcat=dict(), tag_mapping=dict(image=['image']))
@@ -1,9 +1,11 @@
 import os
+import json
 import numpy as np
 from .reader import Reader
 from .builder import READER
 from ..utils.structures import Meta
 from ..utils.common import get_image_size
+from .utils import group_by_index, load_index_cache, save_index_cache
 
 
 __all__ = ['LVISAPIReader']
@@ -14,11 +16,12 @@ LVIS_V1_CATEGORIES = [{'frequency': 'c', 'synset': 'aerosol.n.02', 'synonyms': [
 
 @READER.register_module()
 class LVISAPIReader(Reader):
-    def __init__(self, set_path, img_root, **kwargs):
+    def __init__(self, set_path, img_root, index_cache=False, **kwargs):
         super(LVISAPIReader, self).__init__(**kwargs)
 
         self.set = set_path
         self.img_root = img_root
+        self.index_cache = index_cache
 
         assert os.path.exists(self.set)
         assert os.path.exists(self.img_root)
@@ -33,7 +36,17 @@ class LVISAPIReader(Reader):
         self.thing_classes = [k["synonyms"][0] for k in lvis_categories]
         self.meta = dict(thing_classes=self.thing_classes)
 
-        self.data_lines = self.load_lvis_json()
+        cache_path = self.set + '.npz'
+        index = load_index_cache(cache_path, self.set) if self.index_cache else None
+        if index is None:
+            index = self.load_lvis_json()
+            if self.index_cache:
+                save_index_cache(cache_path, self.set, index)
+
+        self.file_names = index['file_names']
+        self.offsets = index['offsets']
+        self.boxes = index['boxes']
+        self.class_ids = index['class_ids']
 
         self._info = dict(
             forcat=dict(
@@ -49,128 +62,74 @@ class LVISAPIReader(Reader):
 
     def load_lvis_json(self):
         """
-        Load a json file in LVIS's annotation format.
-        Args:
-            extra_annotation_keys (list[str]): list of per-annotation keys that should also be
-                loaded into the dataset dict (besides "bbox", "bbox_mode", "category_id",
-                "segmentation"). The values for these keys will be returned as-is.
+        Compile a json file in LVIS's annotation format into flat arrays.
         Returns:
-            list[dict]: a list of dicts in Detectron2 standard format. (See
-            `Using Custom Datasets </tutorials/datasets.html>`_ )
+            dict[str, ndarray]: per-image "file_names" (relative to img_root) and "offsets" (CSR style, len(file_names) + 1)
+            and per-annotation "boxes" (xyxy) and "class_ids" (0-indexed), grouped by image.
         Notes:
             1. This function does not read the image files.
-               The results do not have the "image" field.
+            2. No LVIS api object is kept, so dataloader workers only share a few arrays.
         """
-        from lvis import LVIS
-
-        lvis_api = LVIS(self.set)
+        with open(self.set, 'r') as f:
+            dataset = json.load(f)
 
         # sort indices for reproducible results
-        img_ids = sorted(lvis_api.imgs.keys())
-        # imgs is a list of dicts, each looks something like:
-        # {'license': 4,
-        #  'url': 'http://farm6.staticflickr.com/5454/9413846304_881d5e5c3b_z.jpg',
-        #  'file_name': 'COCO_val2014_000000001268.jpg',
-        #  'height': 427,
-        #  'width': 640,
-        #  'date_captured': '2013-11-17 05:57:24',
-        #  'id': 1268}
-        imgs = lvis_api.load_imgs(img_ids)
-        # anns is a list[list[dict]], where each dict is an annotation
-        # record for an object. The inner list enumerates the objects in an image
-        # and the outer list enumerates over images. Example of anns[0]:
-        # [{'segmentation': [[192.81,
-        #     247.09,
-        #     ...
-        #     219.03,
-        #     249.06]],
-        #   'area': 1035.749,
-        #   'image_id': 1268,
-        #   'bbox': [192.81, 224.8, 74.73, 33.43],
-        #   'category_id': 16,
-        #   'id': 42986},
-        #  ...]
-        anns = [lvis_api.img_ann_map[img_id] for img_id in img_ids]
+        imgs = sorted(dataset['images'], key=lambda x: x['id'])
+        img_index = {img['id']: i for i, img in enumerate(imgs)}
+        anns = dataset['annotations']
 
         # Sanity check that each annotation has a unique id
-        ann_ids = [ann["id"] for anns_per_image in anns for ann in anns_per_image]
-        assert len(set(ann_ids)) == len(ann_ids), "Annotation ids in '{}' are not unique".format(
-            json_file
+        ann_ids = np.array([ann["id"] for ann in anns])
+        assert len(np.unique(ann_ids)) == len(ann_ids), "Annotation ids in '{}' are not unique".format(
+            self.set
         )
 
-        imgs_anns = list(zip(imgs, anns))
-
-        extra_annotation_keys = []
-
-        def get_file_name(img_root, img_dict):
+        def get_file_name(img_dict):
             # Determine the path including the split folder ("train2017", "val2017", "test2017") from
             # the coco_url field. Example:
             #   'coco_url': 'http://images.cocodataset.org/train2017/000000155379.jpg'
             split_folder, file_name = img_dict["coco_url"].split("/")[-2:]
-            return os.path.join(img_root, split_folder, file_name)
-
-        dataset_dicts = []
-
-        for (img_dict, anno_dict_list) in imgs_anns:
-            record = dict()
-            record["path"] = get_file_name(self.img_root, img_dict)
-            record['ori_size'] = np.array([img_dict["height"], img_dict["width"]]).astype(np.float32)
-            record["not_exhaustive_category_ids"] = img_dict.get("not_exhaustive_category_ids", [])
-            record["not_exhaustive_category_ids"] = [i - 1 for i in record["not_exhaustive_category_ids"]]
-            record["neg_category_ids"] = img_dict.get("neg_category_ids", [])
-            record["neg_category_ids"] = [i - 1 for i in record["neg_category_ids"]]
-            image_id = record["id"] = img_dict["id"]
-
-            boxes = []
-            classes = []
-            for anno in anno_dict_list:
-                # Check that the image_id in this annotation is the same as
-                # the image_id we're looking at.
-                # This fails only when the data parsing logic or the annotation file is buggy.
-                assert anno["image_id"] == image_id
-                x1, y1, w, h = anno["bbox"]
-                boxes.append([x1, y1, x1 + w, y1 + h])  # Convert 1-indexed to 0-indexed
-                classes.append(anno["category_id"] - 1)
-
-                # segm = anno["segmentation"]  # list[list[float]]
-                # # filter out invalid polygons (< 3 points)
-                # valid_segm = [poly for poly in segm if len(poly) % 2 == 0 and len(poly) >= 6]
-                # assert len(segm) == len(
-                #     valid_segm
-                # ), "Annotation contains an invalid polygon with < 3 points"
-                # assert len(segm) > 0
-                # obj["segmentation"] = segm
-
-            if len(boxes) == 0:
-                record["bbox"] = np.zeros((0, 4)).astype(np.float32)
-            else:
-                record["bbox"] = np.array(boxes)
-            record["class_id"] = np.array(classes).astype(np.int32)
-            dataset_dicts.append(record)
-
-        return dataset_dicts
+            return os.path.join(split_folder, file_name)
+
+        ann_img = np.array([img_index.get(ann['image_id'], -1) for ann in anns], dtype=np.int64)
+        valid = np.nonzero(ann_img >= 0)[0]
+        order, offsets = group_by_index(ann_img[valid], len(imgs))
+        valid = valid[order]
+
+        boxes = np.array([ann['bbox'] for ann in anns], dtype=np.float64).reshape(-1, 4)[valid]
+        boxes[:, 2:] += boxes[:, :2]
+        class_ids = np.array([ann['category_id'] for ann in anns], dtype=np.int64)[valid] - 1
+
+        return dict(
+            file_names=np.array([get_file_name(img) for img in imgs]),
+            offsets=offsets,
+            boxes=boxes.astype(np.float32),
+            class_ids=class_ids.astype(np.int32)
+        )
 
     def __getitem__(self, index):
-        data_line = self.data_lines[index]
+        path = os.path.join(self.img_root, self.file_names[index])
+        s, e = self.offsets[index], self.offsets[index + 1]
 
-        img = self.read_image(data_line['path'])
+        img = self.read_image(path)
         w, h = get_image_size(img)
 
+        bbox = self.boxes[s:e].copy()
         bbox_meta = Meta(
-            class_id=data_line['class_id'],
-            score=np.ones(len(data_line['bbox'])).astype(np.float32),
-            keep=np.ones(len(data_line['bbox'])).astype(np.bool_),
+            class_id=self.class_ids[s:e].copy(),
+            score=np.ones(len(bbox)).astype(np.float32),
+            keep=np.ones(len(bbox)).astype(np.bool_),
         )
 
         return dict(
             image=img,
-            image_meta=dict(ori_size=(w, h), path=data_line['path']),
-            bbox=data_line['bbox'],
+            image_meta=dict(ori_size=(w, h), path=path),
+            bbox=bbox,
             bbox_meta=bbox_meta
         )
 
     def __len__(self):
-        return len(self.data_lines)
+        return len(self.file_names)
 
     def __repr__(self):
-        return 'LVISAPIReader(set_path={}, img_root={}, {})'.format(self.set, self.img_root, super(LVISAPIReader, self).__repr__())
+        return 'LVISAPIReader(set_path={}, img_root={}, index_cache={}, {})'.format(self.set, self.img_root, self.index_cache, super(LVISAPIReader, self).__repr__())
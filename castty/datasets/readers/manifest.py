@@ -0,0 +1,140 @@
+import os
+import time
+import pickle
+import hashlib
+import numpy as np
+
+
+__all__ = ['walk', 'listdir', 'build_manifest', 'load_manifest']
+
+
+def manifest_dir(manifest):
+    # True for the default place, or a directory of its own
+    if isinstance(manifest, str):
+        return manifest
+    return os.environ.get('CASTTY_MANIFEST_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'castty', 'manifest'))
+
+
+def manifest_path(root_dir, followlinks, manifest):
+    key = '{}:{}'.format(os.path.realpath(root_dir), int(followlinks))
+    return os.path.join(manifest_dir(manifest), hashlib.sha1(key.encode()).hexdigest()[:16] + '.pkl')
+
+
+def stat_or_none(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def entry_root(root_dir, d):
+    return root_dir if d == '.' else os.path.join(root_dir, d)
+
+
+def build_manifest(root_dir, followlinks=False, manifest=True):
+    """
+    Walks root_dir once and keeps, per directory, its mtime, subdirectories and files with their
+    sizes and mtimes. Adding, removing or renaming an entry changes the mtime of its directory,
+    so a listing is checked with one stat per directory instead of one per file.
+    """
+    built = time.time_ns()
+    entries = []
+    for root, dirnames, fnames in os.walk(root_dir, followlinks=followlinks):
+        st = os.stat(root)
+        fnames = sorted(fnames)
+        stats = [stat_or_none(os.path.join(root, f)) for f in fnames]
+        entries.append(dict(
+            dir=os.path.relpath(root, root_dir),
+            mtime=st.st_mtime_ns,
+            dirnames=list(dirnames),
+            fnames=fnames,
+            sizes=np.array([-1 if s is None else s.st_size for s in stats], dtype=np.int64),
+            mtimes=np.array([-1 if s is None else s.st_mtime_ns for s in stats], dtype=np.int64),
+        ))
+
+    path = manifest_path(root_dir, followlinks, manifest)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.{}.tmp'.format(os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(dict(root=os.path.realpath(root_dir), followlinks=followlinks, built=built, entries=entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return entries
+
+
+def load_manifest(root_dir, followlinks=False, manifest=True):
+    # None when missing or when a directory changed since it was built
+    path = manifest_path(root_dir, followlinks, manifest)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as f:
+            res = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    for e in res['entries']:
+        st = stat_or_none(entry_root(root_dir, e['dir']))
+        if st is None or st.st_mtime_ns != e['mtime']:
+            return None
+        # on filesystems with coarse mtimes a change right after the walk would keep the same mtime
+        if e['mtime'] >= res['built'] - 2 * 10 ** 9:
+            return None
+    return res['entries']
+
+
+def walk(root_dir, followlinks=False, manifest=False):
+    # os.walk as a list, from the manifest of root_dir when manifest is set
+    if not manifest:
+        return list(os.walk(root_dir, followlinks=followlinks))
+
+    entries = load_manifest(root_dir, followlinks, manifest)
+    if entries is None:
+        entries = build_manifest(root_dir, followlinks, manifest)
+    return [(entry_root(root_dir, e['dir']), list(e['dirnames']), list(e['fnames'])) for e in entries]
+
+
+def listdir(path, manifest=False):
+    if not manifest:
+        return os.listdir(path)
+
+    # the top of a walk is the first entry, its mtime alone covers the listing
+    entries = load_manifest(path, False, manifest)
+    if entries is None:
+        entries = build_manifest(path, False, manifest)
+    return entries[0]['dirnames'] + entries[0]['fnames']
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='rebuild the file listing manifests of dataset directories')
+    parser.add_argument('roots', type=str, nargs='+')
+    parser.add_argument('--manifest_dir', type=str, default='', help='where the manifests live, CASTTY_MANIFEST_DIR or ~/.cache/castty/manifest by default')
+    parser.add_argument('--followlinks', action='store_true')
+    parser.add_argument('--verify', action='store_true', help='only report the files whose size or mtime changed')
+    args = parser.parse_args()
+
+    manifest = args.manifest_dir if args.manifest_dir else True
+    for root in args.roots:
+        if args.verify:
+            path = manifest_path(root, args.followlinks, manifest)
+            if not os.path.exists(path):
+                print('{}: no manifest'.format(root))
+                continue
+            with open(path, 'rb') as f:
+                entries = pickle.load(f)['entries']
+            changed = 0
+            for e in entries:
+                for fname, size, mtime in zip(e['fnames'], e['sizes'], e['mtimes']):
+                    st = stat_or_none(os.path.join(entry_root(root, e['dir']), fname))
+                    if st is None or st.st_size != size or st.st_mtime_ns != mtime:
+                        print(os.path.join(entry_root(root, e['dir']), fname))
+                        changed += 1
+            print('{}: {} changed files, listing {}'.format(root, changed, 'valid' if load_manifest(root, args.followlinks, manifest) is not None else 'stale'))
+        else:
+            entries = build_manifest(root, args.followlinks, manifest)
+            print('{}: {} directories, {} files -> {}'.format(root, len(entries), sum(len(e['fnames']) for e in entries), manifest_path(root, args.followlinks, manifest)))
@@ -2,6 +2,7 @@ import os
 import numpy as np
 from .reader import Reader
 from .builder import READER
+from .manifest import listdir
 
 
 __all__ = ['Market1501AttritubesReader']
@@ -125,7 +126,7 @@ class Market1501AttritubesReader(Reader):
 
         self.pids = []
         self.img_paths = []
-        tmp = sorted(os.listdir(img_root))
+        tmp = sorted(listdir(img_root, manifest=self.manifest))
         for t in tmp:
             if t.startswith('0000') or t.startswith('-1'):
                 continue
@@ -0,0 +1,175 @@
+import os
+import cv2
+import torch
+import pickle
+import numpy as np
+from PIL import Image
+from .reader import Reader
+from .builder import READER
+from ..utils.common import is_pil
+
+
+__all__ = ['PackedReader', 'pack_reader']
+
+
+ENCODINGS = ('png', 'jpg', 'raw')
+
+
+def encode_image(image, encoding):
+    if is_pil(image):
+        image = np.array(image)
+
+    if encoding == 'raw':
+        return image.shape, image.tobytes()
+
+    assert image.dtype == np.uint8, 'only raw encoding keeps {} images'.format(image.dtype)
+    channels = image.shape[2] if image.ndim == 3 else 1
+    assert channels in (1, 3, 4), 'can not encode {} channel images'.format(channels)
+    if channels == 4:
+        assert encoding == 'png', 'jpg drops the alpha channel, use png or raw'
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA)
+    elif channels == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    ok, buf = cv2.imencode('.' + encoding, image)
+    assert ok
+    return image.shape, buf.tobytes()
+
+
+def decode_image(shape, buf, encoding, dtype='uint8'):
+    if encoding == 'raw':
+        return np.frombuffer(buf, dtype=dtype).reshape(shape).copy()
+
+    channels = shape[2] if len(shape) == 3 else 1
+    if channels == 4:
+        image = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA)
+    if channels == 3:
+        image = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_GRAYSCALE).reshape(shape)
+
+
+def pack_reader(reader, root, encoding='png', shard_bytes=1 << 30):
+    assert encoding in ENCODINGS
+    assert shard_bytes > 0
+
+    from tqdm import tqdm
+
+    os.makedirs(root, exist_ok=True)
+
+    index = np.zeros((len(reader), 3), dtype=np.int64)
+    shard_id = 0
+    f = open(os.path.join(root, 'shard_{:05d}.bin'.format(shard_id)), 'wb')
+
+    for i in tqdm(range(len(reader)), desc='packing'):
+        res = dict(reader[i])
+        shape, buf = encode_image(res.pop('image'), encoding)
+        record = pickle.dumps((shape, buf, res), protocol=pickle.HIGHEST_PROTOCOL)
+
+        if f.tell() > 0 and f.tell() + len(record) > shard_bytes:
+            f.close()
+            shard_id += 1
+            f = open(os.path.join(root, 'shard_{:05d}.bin'.format(shard_id)), 'wb')
+
+        index[i] = (shard_id, f.tell(), len(record))
+        f.write(record)
+    f.close()
+
+    info = reader.info
+    np.save(os.path.join(root, 'index.npy'), index)
+    with open(os.path.join(root, 'info.pkl'), 'wb') as f:
+        pickle.dump(
+            dict(
+                encoding=encoding,
+                num_shards=shard_id + 1,
+                source=reader.__repr__(),
+                forcat=info['forcat'],
+                tag_mapping=info['tag_mapping']
+            ),
+            f
+        )
+    return index
+
+
+@READER.register_module()
+class PackedReader(Reader):
+    def __init__(self, root, epoch=None, **kwargs):
+        super(PackedReader, self).__init__(**kwargs)
+
+        assert os.path.exists(os.path.join(root, 'index.npy'))
+        assert os.path.exists(os.path.join(root, 'info.pkl'))
+
+        self.root = root
+        self.index = np.load(os.path.join(root, 'index.npy'))
+        with open(os.path.join(root, 'info.pkl'), 'rb') as f:
+            packed_info = pickle.load(f)
+
+        self.encoding = packed_info['encoding']
+        # exports of augmented samples may hold float or CHW tensor images and several epochs
+        self.dtype = packed_info.get('dtype', 'uint8')
+        self.tensor = packed_info.get('tensor', False)
+        self.epoch = epoch
+        if epoch is not None:
+            epoch_size = packed_info['epoch_size']
+            assert 0 <= epoch < packed_info['num_epochs']
+            self.index = self.index[epoch * epoch_size:(epoch + 1) * epoch_size]
+
+        self.shard_paths = [os.path.join(root, 'shard_{:05d}.bin'.format(i)) for i in range(packed_info['num_shards'])]
+        self.fds = dict()
+
+        self._info = dict(
+            forcat=packed_info['forcat'],
+            tag_mapping=packed_info['tag_mapping']
+        )
+
+    def get_fd(self, shard_id):
+        # fds are opened lazily so that every dataloader worker owns its own
+        if shard_id not in self.fds.keys():
+            self.fds[shard_id] = os.open(self.shard_paths[shard_id], os.O_RDONLY)
+        return self.fds[shard_id]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['fds'] = dict()
+        return state
+
+    def __getitem__(self, index):
+        shard_id, offset, nbytes = self.index[index]
+        record = os.pread(self.get_fd(int(shard_id)), int(nbytes), int(offset))
+        shape, buf, res = pickle.loads(record)
+
+        image = decode_image(shape, buf, self.encoding, self.dtype)
+        if self.tensor:
+            image = torch.from_numpy(image)
+        elif self.use_pil:
+            image = Image.fromarray(image)
+        res['image'] = image
+        return res
+
+    def __len__(self):
+        return len(self.index)
+
+    def __del__(self):
+        for fd in getattr(self, 'fds', dict()).values():
+            os.close(fd)
+
+    def __repr__(self):
+        return 'PackedReader(root={}, encoding={}, epoch={}, {})'.format(self.root, self.encoding, self.epoch, super(PackedReader, self).__repr__())
+
+
+if __name__ == '__main__':
+    import argparse
+    from .builder import build_reader
+    from ...config import load_config_far_away
+
+    parser = argparse.ArgumentParser(description='bake the reader of a config into packed shards')
+    parser.add_argument('config', type=str)
+    parser.add_argument('root', type=str)
+    parser.add_argument('--split', type=str, default='test_data')
+    parser.add_argument('--encoding', type=str, default='png', choices=ENCODINGS)
+    parser.add_argument('--shard_bytes', type=int, default=1 << 30)
+    args = parser.parse_args()
+
+    cfg = load_config_far_away(args.config)
+    reader = build_reader(cfg[args.split].dataset.reader)
+    pack_reader(reader, args.root, args.encoding, args.shard_bytes)
@@ -4,6 +4,7 @@ import numpy as np
 from .reader import Reader
 from .builder import READER
 from .utils import read_image_paths
+from .manifest import walk
 from ..utils.structures import Meta
 from ..utils.common import get_image_size
 from ...utils.bbox_tools import xyxy2xywh
@@ -233,7 +234,7 @@ class PSDParseReader(Reader):
         assert os.path.exists(root)
         self.root = root
 
-        json_paths = self.read_json_paths(root)
+        json_paths = self.read_json_paths(root, self.manifest)
 
         self.json_paths = []
         self.image_paths = []
@@ -267,11 +268,11 @@ class PSDParseReader(Reader):
         )
 
     @staticmethod
-    def read_json_paths(root_dir):
+    def read_json_paths(root_dir, manifest=False):
         jsons = []
         assert os.path.isdir(root_dir), '{}是一个无效的目录'.format(root_dir)
 
-        for root, _, fnames in sorted(os.walk(root_dir)):
+        for root, _, fnames in sorted(walk(root_dir, manifest=manifest)):
             for fname in fnames:
                 if fname.lower().endswith('.json'):
                     path = os.path.join(root, fname)
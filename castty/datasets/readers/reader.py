@@ -9,6 +9,12 @@ class Reader(object):
         else:
             self.use_pil = True
 
+        # file listings from a manifest, see manifest.py
+        if 'manifest' in kwargs.keys():
+            self.manifest = kwargs['manifest']
+        else:
+            self.manifest = False
+
         self._info = dict(tag_mapping=TAG_MAPPING)
 
     @property
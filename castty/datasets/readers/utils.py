@@ -1,6 +1,8 @@
 import os
 import cv2
+import numpy as np
 from PIL import Image, ExifTags
+from .manifest import walk
 
 IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
 
@@ -9,11 +11,11 @@ def is_image_file(filename):
     return any(filename.lower().endswith(extension) for extension in IMG_EXTENSIONS)
 
 
-def read_image_paths(root_dir):
+def read_image_paths(root_dir, manifest=False):
     images = []
     assert os.path.isdir(root_dir), '{}是一个无效的目录'.format(root_dir)
 
-    for root, _, fnames in sorted(os.walk(root_dir)):
+    for root, _, fnames in sorted(walk(root_dir, manifest=manifest)):
         for fname in fnames:
             if is_image_file(fname):
                 path = os.path.join(root, fname)
@@ -44,3 +46,29 @@ def read_image_cv2(path):
     img = cv2.imread(path)
     img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     return img
+
+
+def group_by_index(index, num):
+    order = np.argsort(index, kind='stable')
+    offsets = np.zeros(num + 1, dtype=np.int64)
+    np.cumsum(np.bincount(index, minlength=num), out=offsets[1:])
+    return order, offsets
+
+
+def load_index_cache(cache_path, src_path):
+    if not os.path.exists(cache_path):
+        return None
+
+    st = os.stat(src_path)
+    data = np.load(cache_path)
+    if data['src_stat'].tolist() != [st.st_size, int(st.st_mtime)]:
+        return None
+    return {k: data[k] for k in data.files if k != 'src_stat'}
+
+
+def save_index_cache(cache_path, src_path, arrays):
+    st = os.stat(src_path)
+    try:
+        np.savez(cache_path, src_stat=np.array([st.st_size, int(st.st_mtime)]), **arrays)
+    except OSError:
+        pass
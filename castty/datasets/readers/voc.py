@@ -36,7 +36,7 @@ class VOCReader(Reader):
             assert os.path.exists(id_list_file)
             self.image_paths = [os.path.join(img_root, id_.strip() + '.jpg') for id_ in open(id_list_file)]
         else:
-            self.image_paths = read_image_paths(img_root)
+            self.image_paths = read_image_paths(img_root, manifest=self.manifest)
 
         assert len(self.image_paths) > 0
         self.label_paths = [os.path.join(xml_root, os.path.basename(id_).split('.')[0] + '.xml') for id_ in self.image_paths]
@@ -154,7 +154,7 @@ class VOCSegReader(Reader):
 
         if split is None:
             self.split = None
-            self.image_paths = read_image_paths(img_root)
+            self.image_paths = read_image_paths(img_root, manifest=self.manifest)
         else:
             self.split = split
             id_list_file = os.path.join(self.root, 'ImageSets/Segmentation/{}.txt'.format(self.split))
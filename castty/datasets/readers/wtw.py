@@ -3,8 +3,9 @@ import math
 import numpy as np
 from .reader import Reader
 from .builder import READER
+from .manifest import listdir
 from PIL import Image, ImageDraw
-from ..utils.structures import Meta
+from ..utils.structures import Meta, PolyArray
 from ..utils.common import get_image_size
 from ..bamboo.crop import crop_image, crop_bbox, crop_point
 try:
@@ -25,7 +26,7 @@ class WTWReader(Reader):
         assert os.path.exists(os.path.join(root, 'xml'))
 
         self.root = root
-        self.xml_paths = sorted(os.listdir(os.path.join(root, 'xml')))
+        self.xml_paths = sorted(listdir(os.path.join(root, 'xml'), manifest=self.manifest))
 
         self._info = dict(
             forcat=dict(
@@ -309,7 +310,7 @@ class WTWLineReader(WTWReader):
         return dict(
             image=img,
             image_meta=dict(ori_size=(w, h), path=path),
-            poly=polys,
+            poly=PolyArray(polys),
             poly_meta=meta
         )
 
@@ -1,5 +1,6 @@
 import torch
 from .readers.cat import CatReader
+from .readers.cache import CachedReader
 from ..utils.registry import Registry, build_from_cfg
 from torch.utils.data.sampler import WeightedRandomSampler
 
@@ -15,12 +16,14 @@ def build_sampler(cfg, **default_args):
 class CustomWeightedRandomSampler(WeightedRandomSampler):
     def __init__(self, dataset, weights, num_samples=None, **kwargs):
         reader = dataset.reader
+        if isinstance(reader, CachedReader):
+            reader = reader.reader
 
         assert isinstance(reader, CatReader)
         for w in weights:
             assert w > 0
 
-        groups = reader.groups
+        groups = reader.groups.tolist()
 
         assert len(weights) + 1 == len(groups)
 
@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 from PIL import Image
 from torch import Tensor
+from .structures import PolyArray, as_poly_array
 from ...utils.bbox_tools import xyxy2xywh
 try:
     import pyclipper
@@ -80,30 +81,102 @@ def clip_point(points, img_size):
     return points
 
 
+def is_convex_poly(polys):
+    # simple convex polygons, every turn the same way and once around
+    polys = as_poly_array(polys)
+    data = polys.data.astype(np.float64)
+    nxt = polys.next_index
+    e1 = data[nxt] - data
+    e2 = e1[nxt]
+    cross = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+    turn = np.arctan2(cross, (e1 * e2).sum(axis=1))
+    total = np.bincount(polys.index, weights=turn, minlength=len(polys))
+    return ~(polys.reduce_any(cross > 0) & polys.reduce_any(cross < 0)) & (np.abs(np.abs(total) - 2 * np.pi) < 1e-6)
+
+
+def clip_half_plane(data, offsets, axis, bound, upper):
+    # one Sutherland-Hodgman step for every polygon, each edge gives 0, 1 or 2 points
+    p_in = data[:, axis] <= bound if upper else data[:, axis] >= bound
+    if p_in.all():
+        return data, offsets
+
+    polys = PolyArray(data=data, offsets=offsets)
+    nxt = polys.next_index
+    p, q = data, data[nxt]
+    q_in = p_in[nxt]
+    counts = np.where(q_in, 2 - p_in, p_in).astype(np.int64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (bound - p[:, axis]) / (q[:, axis] - p[:, axis])
+        cross = p + t[:, None] * (q - p)
+    cross[:, axis] = bound
+
+    edge = np.repeat(np.arange(len(p)), counts)
+    first = np.arange(len(edge)) == np.repeat(np.cumsum(counts) - counts, counts)
+    is_cross = first & ~(p_in & q_in)[edge]
+    out = np.where(is_cross[:, None], cross[edge], q[edge])
+
+    # edges run in polygon order, the points of each polygon stay contiguous
+    new_offsets = np.zeros_like(offsets)
+    new_offsets[1:] = np.cumsum(np.bincount(polys.index, weights=counts, minlength=len(polys)).astype(np.int64))
+    return out, new_offsets
+
+
+def clip_convex_poly(polys, img_size):
+    """
+    Clips convex polygons to the image with one Sutherland-Hodgman pass per border over all of
+    them at once. Returns the clipped polygons and whether each of them kept some area.
+    """
+    width, height = img_size
+    polys = as_poly_array(polys)
+    data, offsets = polys.data.astype(np.float64), polys.offsets
+    for axis, bound, upper in ((0, 0, False), (0, width, True), (1, 0, False), (1, height, True)):
+        data, offsets = clip_half_plane(data, offsets, axis, bound, upper)
+
+    # repeated points where a vertex lies on a border
+    polys = PolyArray(data=data, offsets=offsets)
+    keep = (data != data[polys.next_index]).any(axis=1)
+    offsets = np.zeros_like(offsets)
+    offsets[1:] = np.cumsum(np.bincount(polys.index[keep], minlength=len(polys)))
+    polys = PolyArray(data=data[keep], offsets=offsets)
+
+    data, nxt = polys.data.astype(np.float64), polys.next_index
+    area = np.bincount(polys.index, weights=data[:, 0] * data[nxt, 1] - data[nxt, 0] * data[:, 1], minlength=len(polys)) / 2
+    return polys, (polys.lengths >= 3) & (np.abs(area) > 1e-6)
+
+
 def clip_poly(polys, img_size):
     width, height = img_size
     subj = (((0, 0), (width, 0), (width, height), (0, height)),)
 
+    polys = as_poly_array(polys)
+    x, y = polys.data[:, 0], polys.data[:, 1]
+    outside = polys.reduce_any(~((x >= 0) & (x < width) & (y >= 0) & (y < height)))
+    if not outside.any():
+        return polys
+
+    ids = np.nonzero(outside)[0]
+    convex = is_convex_poly(polys[ids])
+    clipped, valid = clip_convex_poly(polys[ids[convex]], img_size)
+    # nothing left of them
+    gone = polys[ids[convex][~valid]]
+    gone.data[:] = -1
+
+    # concave ones, pyclipper
     tmp = []
-    # keep = []
-    for i, poly in enumerate(polys):
-        wf = np.bitwise_and(poly[..., 0] >= 0, poly[..., 0] < width)
-        hf = np.bitwise_and(poly[..., 1] >= 0, poly[..., 1] < height)
-        if np.bitwise_and(wf, hf).all():
-            tmp.append(poly)
-            # keep.append(i)
+    for i in ids[~convex]:
+        pc = pyclipper.Pyclipper()
+        pc.AddPaths(subj, pyclipper.PT_SUBJECT, True)
+        pc.AddPath(polys[i].tolist(), pyclipper.PT_CLIP, True)
+        poly_tmp = pc.Execute(pyclipper.CT_INTERSECTION, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
+        if len(poly_tmp) > 0:
+            tmp.append(np.array(poly_tmp[0]).astype(np.float32))
         else:
-            poly_tmp = poly.tolist()
-            pc = pyclipper.Pyclipper()
-            pc.AddPaths(subj, pyclipper.PT_SUBJECT, True)
-            pc.AddPath(poly_tmp, pyclipper.PT_CLIP, True)
-            poly_tmp = pc.Execute(pyclipper.CT_INTERSECTION, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
-            if len(poly_tmp) > 0:
-                tmp.append(np.array(poly_tmp[0]).astype(np.float32))
-                # keep.append(i)
-            else:
-                tmp.append(np.zeros(poly.shape).astype(np.float32) - 1)
-    return tmp
+            tmp.append(np.zeros(polys[i].shape).astype(np.float32) - 1)
+
+    res = polys[~outside] + clipped[valid] + gone + PolyArray(tmp)
+    order = np.concatenate([np.nonzero(~outside)[0], ids[convex][valid], ids[convex][~valid], ids[~convex]])
+    return res[np.argsort(order)]
 
 
 def filter_bbox_by_length(bboxes, min_w=1, min_h=1):
@@ -146,13 +219,10 @@ def filter_point(points):
 
 
 def filter_poly(polys):
-    res = []
-
-    for poly in polys:
-        x = poly[..., 0] < 0
-        y = poly[..., 1] < 0
-        res.append(~(x | y).any())
-    return np.array(res)
+    polys = as_poly_array(polys)
+    x = polys.data[:, 0] < 0
+    y = polys.data[:, 1] < 0
+    return ~polys.reduce_any(x | y)
 
 
 def filter_list(l, keep):
@@ -58,6 +58,119 @@ class Meta(dict):
             m[key] = v
         return m
 
+
+class PolyArray(object):
+    """
+    Polygons of different lengths packed in one (N, 2) float32 coordinate buffer, polygon i
+    being data[offsets[i]:offsets[i + 1]]. An int index gives a view of one polygon, so code
+    written for a list of (n, 2) arrays keeps working, a bool ndarray or a list of ints gives a
+    new PolyArray, as the values of a Meta are filtered.
+    """
+    def __init__(self, polys=(), data=None, offsets=None):
+        if data is None:
+            polys = [np.asarray(p, dtype=np.float32).reshape(-1, 2) for p in polys]
+            offsets = np.zeros(len(polys) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(p) for p in polys])
+            data = np.concatenate(polys) if len(polys) > 0 else np.zeros((0, 2), dtype=np.float32)
+
+        data = np.asarray(data, dtype=np.float32)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if data.ndim != 2 or data.shape[1] != 2:
+            raise ValueError('data must be (N, 2)')
+        if offsets.ndim != 1 or offsets[0] != 0 or offsets[-1] != len(data):
+            raise ValueError('offsets do not match data')
+
+        self.data = data
+        self.offsets = offsets
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def index(self):
+        # the polygon of each point
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    @property
+    def next_index(self):
+        # the next point of each point, around its polygon
+        nxt = np.arange(1, len(self.data) + 1)
+        nonempty = self.lengths > 0
+        nxt[self.offsets[1:][nonempty] - 1] = self.offsets[:-1][nonempty]
+        return nxt
+
+    @property
+    def bounds(self):
+        # xmin, ymin, xmax, ymax of each polygon, nan for empty ones
+        res = np.full((len(self), 4), np.nan, dtype=np.float32)
+        nonempty = self.lengths > 0
+        if nonempty.any():
+            starts = self.offsets[:-1][nonempty]
+            res[nonempty, :2] = np.minimum.reduceat(self.data, starts, axis=0)
+            res[nonempty, 2:] = np.maximum.reduceat(self.data, starts, axis=0)
+        return res
+
+    def reduce_any(self, flags):
+        # per point flags to per polygon ones
+        return np.bincount(self.index, weights=flags, minlength=len(self)) > 0
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < -len(self) or key >= len(self):
+                raise IndexError('polygon index out of range')
+            key = key % len(self)
+            return self.data[self.offsets[key]:self.offsets[key + 1]]
+
+        if isinstance(key, np.ndarray) and key.dtype == bool and len(key) != len(self):
+            raise ValueError('illegal bool ndarray')
+        keep = np.arange(len(self))[key]
+        lengths = self.lengths[keep]
+        offsets = np.zeros(len(keep) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+        # the points of the kept polygons, in the new order
+        ind = np.arange(offsets[-1]) + np.repeat(self.offsets[keep] - offsets[:-1], lengths)
+        return PolyArray(data=self.data[ind], offsets=offsets)
+
+    def __setitem__(self, key, value):
+        poly = self[key]
+        value = np.asarray(value, dtype=np.float32).reshape(-1, 2)
+        if len(value) != len(poly):
+            raise ValueError('incorrect length')
+        poly[...] = value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def __add__(self, other):
+        other = as_poly_array(other)
+        return PolyArray(
+            data=np.concatenate([self.data, other.data]),
+            offsets=np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]])
+        )
+
+    def __radd__(self, other):
+        return as_poly_array(other) + self
+
+    def copy(self):
+        return PolyArray(data=self.data.copy(), offsets=self.offsets.copy())
+
+    def tolist(self):
+        return [p.copy() for p in self]
+
+    def __repr__(self):
+        return 'PolyArray(num_polys={}, num_points={})'.format(len(self), len(self.data))
+
+
+def as_poly_array(polys):
+    # lists of (n, 2) arrays from older readers and encoders
+    return polys if isinstance(polys, PolyArray) else PolyArray(polys)
+
+
 if __name__ == '__main__':
     # m = Meta(b=2)
     m = Meta(name=np.array([1, 0, 1, 6, 8]), class_id=np.array([1, 0, 1, 0, 0]))
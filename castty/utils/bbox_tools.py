@@ -249,7 +249,6 @@ def calc_iou2(boxes1, boxes2, iou_loss=False):
     inter_section = torch.max(right_down - left_up, torch.zeros_like(right_down))
     inter_area = inter_section[..., 0] * inter_section[..., 1]
     union_area = boxes1_area + boxes2_area - inter_area
-    print(union_area)
     if not iou_loss:
         IOU = inter_area / union_area
     else:
@@ -96,6 +96,112 @@ def gen_gaussian_target(heatmap, center, radius, k=1):
     return out_heatmap
 
 
+_gaussian_kernels = dict()
+
+
+def cached_gaussian2D(radius, dtype=torch.float32):
+    # the kernel gen_gaussian_target builds, kept per radius
+    key = (radius, dtype)
+    if key not in _gaussian_kernels.keys():
+        _gaussian_kernels[key] = gaussian2D(radius, sigma=(2 * radius + 1) / 6, dtype=dtype)
+    return _gaussian_kernels[key]
+
+
+def gen_gaussian_targets(heatmap, channels, centers, radii, k=1):
+    """gen_gaussian_target for many centers at once.
+
+    Args:
+        heatmap (Tensor): (C, H, W) heatmap updated in place.
+        channels (Tensor): Channel of every center, (N,).
+        centers (Tensor): Integer (x, y) of every center, (N, 2).
+        radii (Tensor): Integer radius of every center, (N,).
+        k (int): Coefficient of gaussian kernel. Default: 1.
+
+    Returns:
+        out_heatmap (Tensor): Updated heatmap, the same as calling
+            gen_gaussian_target on every center in any order.
+    """
+    _, height, width = heatmap.shape
+    channels = channels.long()
+    x = centers[:, 0].long()
+    y = centers[:, 1].long()
+    radii = radii.long()
+
+    # centers out of the heatmap clip the kernel in ways only the scalar version reproduces
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    for i in torch.nonzero(~inside).flatten().tolist():
+        gen_gaussian_target(heatmap[channels[i]], [centers[i, 0], centers[i, 1]], int(radii[i]), k)
+
+    flat = heatmap.view(-1)
+    lin = (channels * height + y) * width + x
+    # kernels that lie fully inside need no clipping
+    full = inside & (x >= radii) & (x + radii < width) & (y >= radii) & (y + radii < height)
+    for radius in torch.unique(radii[inside]).tolist():
+        kernel = cached_gaussian2D(radius, heatmap.dtype) * k
+        d = torch.arange(-radius, radius + 1)
+        offset = (d.view(-1, 1) * width + d.view(1, -1)).flatten()
+
+        sel = full & (radii == radius)
+        index = lin[sel].view(-1, 1) + offset.view(1, -1)
+        flat.scatter_reduce_(0, index.flatten(), kernel.flatten().repeat(len(index)), 'amax')
+
+        sel = inside & ~full & (radii == radius)
+        if sel.any():
+            xs = x[sel].view(-1, 1, 1) + d.view(1, 1, -1)
+            ys = y[sel].view(-1, 1, 1) + d.view(1, -1, 1)
+            valid = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            index = (channels[sel].view(-1, 1, 1) * height + ys) * width + xs
+            flat.scatter_reduce_(0, index[valid], kernel.expand(valid.shape)[valid], 'amax')
+    return heatmap
+
+
+def assign_last(target, index, values):
+    """target[index] = values where repeated positions keep the last value, as a loop of
+    scalar assignments would. index is a tuple of integer tensors, one per dim of target.
+    """
+    lin = torch.zeros(values.shape, dtype=torch.int64)
+    for i, size in zip(index, target.shape):
+        i = i.long()
+        i = torch.where(i < 0, i + size, i)
+        if len(i) > 0 and (i.min() < 0 or i.max() >= size):
+            raise IndexError('index out of range for a dim of size {}'.format(size))
+        lin = lin * size + i
+    lin = lin.flatten().numpy()
+
+    _, last = np.unique(lin[::-1], return_index=True)
+    last = len(lin) - 1 - last
+    target.view(-1)[torch.from_numpy(lin[last])] = values.flatten()[torch.from_numpy(last)].to(target.dtype)
+    return target
+
+
+def gaussian_radii(heights, widths, min_overlap):
+    """gaussian_radius on 1d tensors of box sizes, with the same float32 steps and float64 square roots."""
+    height, width = heights, widths
+
+    def sqrt(x):
+        # math.sqrt of the scalar version
+        return x.double().sqrt().to(x.dtype)
+
+    a1 = 1
+    b1 = (height + width)
+    c1 = width * height * (1 - min_overlap) / (1 + min_overlap)
+    sq1 = sqrt(b1**2 - 4 * a1 * c1)
+    r1 = (b1 - sq1) / (2 * a1)
+
+    a2 = 4
+    b2 = 2 * (height + width)
+    c2 = (1 - min_overlap) * width * height
+    sq2 = sqrt(b2**2 - 4 * a2 * c2)
+    r2 = (b2 - sq2) / (2 * a2)
+
+    a3 = 4 * min_overlap
+    b3 = -2 * min_overlap * (height + width)
+    c3 = (min_overlap - 1) * width * height
+    sq3 = sqrt(b3**2 - 4 * a3 * c3)
+    r3 = (b3 + sq3) / (2 * a3)
+    return torch.minimum(torch.minimum(r1, r2), r3)
+
+
 def gaussian_radius(det_size, min_overlap):
     """
     https://github.com/princeton-vl/CornerNet/issues/110
@@ -32,13 +32,21 @@ test_data = dict(
             # dict(type='ListCollateFN', names=('bbox_meta', 'point', 'point_meta')),
             # dict(type='ListCollateFN', names=('bbox_meta', 'ga_bbox', 'ga_index')),
             # dict(type='NanoCollateFN')
-        ]
+        ],
+        # batch_internodes=[
+        #     dict(type='BrightnessEnhancement', brightness=(0.8, 1.2), p=0.5),
+        #     dict(type='Flip', horizontal=True, p=0.5),
+        #     dict(type='WarpPerspective', distortion_scale=0.2, p=0.5),
+        #     dict(type='Normalize', mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
+        # ],
     ),
     dataset=dict(
         # reader=dict(type='LVISAPIReader', set_path='../datasets/coco/annotations/lvis_v1_val.json', img_root='../datasets/coco'),
         # reader=dict(type='COCOAPIReader', set_path='../datasets/coco/annotations/instances_val2017.json', img_root='../datasets/coco/val2017'),
         # reader=dict(type='COCOAPIReader', use_keypoint=True, set_path='../datasets/coco/annotations/person_keypoints_val2017.json', img_root='../datasets/coco/val2017'),
         # reader=dict(type='VOCReader', use_pil=True, root='../datasets/voc/VOCdevkit/VOC2007', split='trainval', filter_difficult=False, classes=classes),
+        # reader=dict(type='VOCReader', use_pil=True, root='../datasets/voc/VOCdevkit/VOC2007', split='trainval', filter_difficult=False, classes=classes, cache=dict(kind='mmap', max_bytes=4 << 30)),
+        # reader=dict(type='VOCReader', use_pil=True, root='../datasets/voc/VOCdevkit/VOC2007', filter_difficult=False, classes=classes, manifest=True),
         reader=dict(type='VOCReader', use_pil=True, root='/Users/liaya/Downloads/project-2-at-2023-09-19-12-10-9c26ec98', filter_difficult=False, classes=['front-back', 'front-back-side', 'side']),
         # reader=dict(
         #     type='CatReader', 
@@ -49,6 +57,8 @@ test_data = dict(
         #     ),
         #     output_gid=True,
         # ),
+        # fuse_warp=True,
+        # profile=dict(trace=False),
         internodes=[
             dict(type='DataSource'),
             # dict(type='MixUp', internodes=[
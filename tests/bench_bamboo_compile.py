@@ -0,0 +1,85 @@
+import copy
+import time
+import random
+import argparse
+import numpy as np
+
+from castty.datasets.readers.reader import Reader
+from castty.datasets.utils.structures import Meta
+from castty.datasets.bamboo.builder import build_bamboo
+
+
+class TinyReader(Reader):
+    def __init__(self, size=8, num_bboxes=4, **kwargs):
+        super(TinyReader, self).__init__(**kwargs)
+        self.image = np.random.randint(0, 255, (size, size, 3), dtype=np.uint8)
+        self.bbox = np.array([[1, 1, 5, 5]] * num_bboxes, dtype=np.float32)
+        self._info = dict(
+            forcat=dict(),
+            tag_mapping=dict(image=['image'], bbox=['bbox'])
+        )
+
+    def __getitem__(self, index):
+        return dict(
+            image=self.image.copy(),
+            image_meta=dict(ori_size=(self.image.shape[1], self.image.shape[0]), path=str(index)),
+            bbox=self.bbox.copy(),
+            bbox_meta=Meta(class_id=np.zeros(len(self.bbox), dtype=np.int32), keep=np.ones(len(self.bbox), dtype=np.bool_))
+        )
+
+    def __len__(self):
+        return 1 << 30
+
+
+internodes = [
+    dict(type='DataSource'),
+    dict(type='BrightnessEnhancement', brightness=(0.9, 1.1)),
+    dict(type='ContrastEnhancement', contrast=(0.9, 1.1)),
+    dict(type='Flip', horizontal=True),
+    dict(type='Flip', horizontal=False),
+    dict(type='BaseInternode'),
+    dict(type='Padding', padding=(1, 1, 1, 1)),
+    dict(type='CenterCrop', size=(8, 8)),
+    dict(type='Rot90', k=[1]),
+    dict(type='Rot90', k=[3]),
+    dict(type='BaseInternode'),
+    dict(type='SwapChannels', swap=(2, 1, 0)),
+    dict(type='SwapChannels', swap=(2, 1, 0)),
+    dict(type='ResizeAndPadding', resize=dict(type='Resize', size=(8, 8))),
+    dict(type='Flip', horizontal=True, p=0.5),
+    dict(type='ChooseOne', branchs=[dict(type='Flip', horizontal=True), dict(type='Flip', horizontal=False)]),
+    dict(type='CopyTag', src_tag='bbox', dst_tag='bbox_copy'),
+    dict(type='EraseTags', tags=['bbox_copy']),
+    dict(type='Rot90', k=[2]),
+    dict(type='BaseInternode'),
+]
+
+
+def bench(bamboo, reader, num):
+    random.seed(0)
+    np.random.seed(0)
+    t = time.perf_counter()
+    for i in range(num):
+        res = bamboo(dict(reader=reader, index=i, len_data_lines=len(reader), intl_branch_id=0))
+    return (time.perf_counter() - t) / num * 1e6, res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20000)
+    args = parser.parse_args()
+
+    reader = TinyReader(use_pil=False)
+    tag_mapping = reader.info['tag_mapping']
+    assert len(internodes) == 20
+
+    plain = build_bamboo(internodes=copy.deepcopy(internodes), tag_mapping=tag_mapping)
+    compiled = build_bamboo(internodes=copy.deepcopy(internodes), tag_mapping=tag_mapping).compile()
+    print('internodes: {}, compiled calls: {}'.format(len(plain.internodes), len(compiled.plan)))
+
+    plain_us, a = bench(plain, reader, args.num)
+    compiled_us, b = bench(compiled, reader, args.num)
+    assert a.keys() == b.keys()
+    assert np.array_equal(a['image'], b['image']) and np.array_equal(a['bbox'], b['bbox'])
+
+    print('plain: {:.1f} us/sample, compiled: {:.1f} us/sample, x{:.2f}'.format(plain_us, compiled_us, plain_us / compiled_us))
@@ -0,0 +1,69 @@
+import copy
+import time
+import random
+import argparse
+import numpy as np
+import torch
+
+from castty.datasets.collator import Collator
+from castty.datasets.utils.structures import Meta
+from castty.datasets.bamboo.builder import build_bamboo
+
+
+internodes = [
+    dict(type='BrightnessEnhancement', brightness=(0.8, 1.2), p=0.5),
+    dict(type='ContrastEnhancement', contrast=(0.8, 1.2), p=0.5),
+    dict(type='Flip', horizontal=True, p=0.5),
+    dict(type='Normalize', mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
+]
+
+collator = [
+    dict(type='BboxCollateFN', names=('bbox',)),
+    dict(type='ListCollateFN', names=('bbox_meta',)),
+]
+
+
+def make_batch(batch_size, size):
+    batch = []
+    for _ in range(batch_size):
+        batch.append(dict(
+            image=torch.rand(3, size, size),
+            bbox=np.array([[10, 20, 100, 120], [50, 60, 200, 180]], dtype=np.float32),
+            bbox_meta=Meta(class_id=np.zeros(2, dtype=np.int32), keep=np.ones(2, dtype=np.bool_)),
+        ))
+    return batch
+
+
+def bench(run, batch_size, size, num):
+    random.seed(0)
+    torch.manual_seed(0)
+    batches = [make_batch(batch_size, size) for _ in range(num)]
+    t = time.perf_counter()
+    for batch in batches:
+        res = run(batch)
+    return (time.perf_counter() - t) / num * 1e3, res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20)
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--size', type=int, default=224)
+    args = parser.parse_args()
+
+    # per sample: the internodes run inside the dataset on every sample before collating
+    bamboo = build_bamboo(internodes=copy.deepcopy(internodes), tag_mapping=dict(image=['image'], bbox=['bbox'])).compile()
+    per_sample = Collator(collator)
+
+    def run_per_sample(batch):
+        return per_sample.collate_fn([bamboo(b) for b in batch])
+
+    batched = Collator(collator, batch_internodes=copy.deepcopy(internodes))
+
+    per_sample_ms, a = bench(run_per_sample, args.batch_size, args.size, args.num)
+    batched_ms, b = bench(batched.collate_fn, args.batch_size, args.size, args.num)
+    assert a['image'].shape == b['image'].shape and len(a['bbox']) == len(b['bbox'])
+
+    print(batched)
+    print('batch {} of {}x{}: per sample {:.2f} ms/batch, batched {:.2f} ms/batch, x{:.2f}'.format(
+        args.batch_size, args.size, args.size, per_sample_ms, batched_ms, per_sample_ms / batched_ms))
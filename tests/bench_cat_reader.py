@@ -0,0 +1,89 @@
+import os
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+
+from castty.datasets.readers import CatReader
+from bench_coco_memory import make_coco
+
+
+class LoopCatReader(CatReader):
+    # a scan of the groups, the reference for bisect
+    def get_offset(self, index):
+        for i in range(len(self.groups) - 1):
+            if self.groups[i] <= index < self.groups[i + 1]:
+                index -= self.groups[i]
+                break
+            elif index < self.groups[i]:
+                raise ValueError
+        return index, i
+
+
+def make_cfgs(root, num_readers, num_images):
+    cfgs = []
+    for i in range(num_readers):
+        sub = os.path.join(root, str(i))
+        set_path = make_coco(sub, np.random.randint(num_images // 2, num_images + 1))
+        cfgs.append(dict(type='COCOAPIReader', set_path=set_path, img_root=os.path.join(sub, 'images')))
+    return cfgs
+
+
+def build(cfgs, reader_type=CatReader, **kwargs):
+    start = time.perf_counter()
+    reader = reader_type([dict(cfg) for cfg in cfgs], use_pil=False, output_gid=True, **kwargs)
+    return reader, time.perf_counter() - start
+
+
+def route(reader, indices):
+    start = time.perf_counter()
+    for i in indices:
+        reader.get_offset(i)
+    return (time.perf_counter() - start) / len(indices) * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_readers', type=int, default=10)
+    parser.add_argument('--num_images', type=int, default=2000)
+    parser.add_argument('--build_workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    tmp = tempfile.mkdtemp()
+    cfgs = make_cfgs(tmp, args.num_readers, args.num_images)
+
+    serial, serial_s = build(cfgs)
+    threads, threads_s = build(cfgs, build_workers=args.build_workers)
+    processes, processes_s = build(cfgs, build_workers=args.build_workers, build_backend='process')
+    loop, _ = build(cfgs, LoopCatReader)
+    print('per reader, serial: ' + ', '.join('{:.2f} s'.format(t) for t in serial.build_times))
+    print('{} readers: serial {:.2f} s, {} threads {:.2f} s, {} processes {:.2f} s'.format(
+        args.num_readers, serial_s, args.build_workers, threads_s, args.build_workers, processes_s))
+
+    assert np.array_equal(serial.groups, loop.groups) and np.array_equal(serial.groups, processes.groups)
+    for i in range(len(serial)):
+        assert serial.get_offset(i) == loop.get_offset(i)
+    for i in np.random.randint(0, len(serial), 200):
+        a, b, c = serial[i], threads[i], processes[i]
+        assert a['intl_group_id'] == b['intl_group_id'] == c['intl_group_id']
+        assert np.array_equal(a['bbox'], b['bbox']) and np.array_equal(a['bbox'], c['bbox'])
+    for index in (-1, len(serial)):
+        try:
+            serial.get_offset(index)
+            assert False
+        except ValueError:
+            pass
+
+    # cached children, the cache is built in the parent around the reader a process sends back
+    cached, _ = build([dict(cfg, cache=dict(kind='mmap', max_bytes=1 << 26)) for cfg in cfgs], build_workers=args.build_workers, build_backend='process')
+    for i in np.random.randint(0, len(serial), 50).tolist() * 2:
+        assert np.array_equal(serial[i]['bbox'], cached[i]['bbox'])
+    assert sum(r.cache.hits for r in cached.readers) > 0
+    print('parity ok')
+
+    indices = np.random.randint(0, len(serial), 100000).tolist()
+    loop_us, bisect_us = route(loop, indices), route(serial, indices)
+    print('routing over {} readers: scan {:.2f} us, bisect {:.2f} us, x{:.1f}'.format(args.num_readers, loop_us, bisect_us, loop_us / bisect_us))
+    shutil.rmtree(tmp)
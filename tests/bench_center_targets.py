@@ -0,0 +1,310 @@
+import time
+import torch
+import argparse
+import numpy as np
+from torch.nn.functional import pairwise_distance
+
+from castty.datasets.utils.structures import Meta
+from castty.datasets.bamboo.misc import CalcCenterNetGrids, CalcPTSGrids
+from castty.datasets.utils.common import get_image_size
+from castty.utils.heatmap_tools import gaussian_radius, gen_gaussian_target
+
+
+class LoopCenterNetGrids(CalcCenterNetGrids):
+    # the per object loop the vectorized targets must reproduce bit for bit
+    def forward(self, data_dict, **kwargs):
+        w, h = get_image_size(data_dict['image'])
+
+        center_heatmap_target = torch.zeros(self.num_classes, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+        gt_bbox = torch.from_numpy(data_dict['bbox'])
+        gt_label = torch.from_numpy(data_dict['bbox_meta']['class_id'])
+        center_x = (gt_bbox[:, [0]] + gt_bbox[:, [2]]) / 2
+        center_y = (gt_bbox[:, [1]] + gt_bbox[:, [3]]) / 2
+        gt_centers = torch.cat((center_x, center_y), dim=1) * self.ratio
+
+        if self.use_bbox:
+            wh_target = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+            wh_target_weight = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+            offset_target = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+            offset_target_weight = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+        if self.use_point:
+            _, n_points, _ = data_dict['point'].shape
+
+            kpt_heatmap_target = torch.zeros(n_points, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+            loc_target = torch.zeros(2 * n_points, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+            loc_target_weight = torch.zeros(2 * n_points, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+            offset_target = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+            offset_target_weight = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+            gt_keypoints = torch.from_numpy(data_dict['point']) * self.ratio
+            visible = data_dict['point_meta']['keep']
+
+        for j, ct in enumerate(gt_centers):
+            ctx_int, cty_int = ct.int()
+            ctx, cty = ct
+            scale_box_h = (gt_bbox[j][3] - gt_bbox[j][1]) * self.ratio
+            scale_box_w = (gt_bbox[j][2] - gt_bbox[j][0]) * self.ratio
+            radius = gaussian_radius([scale_box_h, scale_box_w], min_overlap=0.3)
+            radius = max(0, int(radius))
+            ind = gt_label[j]
+            gen_gaussian_target(center_heatmap_target[ind], [ctx_int, cty_int], radius)
+
+            if self.use_bbox:
+                wh_target[0, cty_int, ctx_int] = scale_box_w
+                wh_target[1, cty_int, ctx_int] = scale_box_h
+
+                offset_target[0, cty_int, ctx_int] = ctx - ctx_int
+                offset_target[1, cty_int, ctx_int] = cty - cty_int
+
+                wh_target_weight[:, cty_int, ctx_int] = 1
+                offset_target_weight[:, cty_int, ctx_int] = 1
+
+            if self.use_point:
+                for k, kpt in enumerate(gt_keypoints[j]):
+                    if not visible[j][k]:
+                        continue
+
+                    kpx_int, kpy_int = kpt.int()
+                    kpx, kpy = kpt
+                    gen_gaussian_target(kpt_heatmap_target[k], [kpx_int, kpy_int], radius)
+
+                    loc_target[2 * k, kpy_int, kpx_int] = kpx - ctx
+                    loc_target[2 * k + 1, kpy_int, kpx_int] = kpy - cty
+
+                    loc_target_weight[2 * k, kpy_int, kpx_int] = 1
+                    loc_target_weight[2 * k + 1, kpy_int, kpx_int] = 1
+
+                    offset_target[0, kpy_int, kpx_int] = kpx - kpx_int
+                    offset_target[1, kpy_int, kpx_int] = kpy - kpy_int
+
+                    offset_target_weight[:, kpy_int, kpx_int] = 1
+                    # print(loc_target.shape)
+                    # print(k, kpx_int, kpy_int, visible[j][k])
+                    # exit()
+
+        data_dict['center_heatmap'] = center_heatmap_target
+
+        if self.use_bbox:
+            data_dict['wh_map'] = wh_target
+            data_dict['wh_weight_map'] = wh_target_weight
+
+            data_dict['offset_map'] = offset_target
+            data_dict['offset_target_weight'] = offset_target_weight
+
+        if self.use_point:
+            data_dict['kpt_heatmap'] = kpt_heatmap_target
+
+            data_dict['loc_map'] = loc_target
+            data_dict['loc_weight_map'] = loc_target_weight
+
+            data_dict['offset_map'] = offset_target
+            data_dict['offset_target_weight'] = offset_target_weight
+        return data_dict
+
+
+class LoopPTSGrids(CalcPTSGrids):
+    def calc_kpt2cen(self, kpt, table_id, cens, all_table_ids):
+        kpx, kpy = kpt
+        centers = cens[all_table_ids == table_id]
+        dis = pairwise_distance(centers, kpt)
+
+        lt = (centers[..., 0] < kpx) & (centers[..., 1] < kpy)
+        rt = (centers[..., 0] >= kpx) & (centers[..., 1] < kpy)
+        rb = (centers[..., 0] >= kpx) & (centers[..., 1] >= kpy)
+        lb = (centers[..., 0] < kpx) & (centers[..., 1] >= kpy)
+
+        res = torch.zeros(8, dtype=torch.float32)
+        res_weights = torch.zeros(8, dtype=torch.float32)
+
+        self.get_value(kpt, centers[lt], dis[lt], res, res_weights, 0)
+        self.get_value(kpt, centers[rt], dis[rt], res, res_weights, 1)
+        self.get_value(kpt, centers[rb], dis[rb], res, res_weights, 2)
+        self.get_value(kpt, centers[lb], dis[lb], res, res_weights, 3)
+
+        return res, res_weights
+
+    def get_value(self, kpt, centers, dis, res, res_weights, k):
+        if len(dis) == 0:
+            return
+        min_id = torch.argmin(dis)
+        ctx, cty = centers[min_id]
+        kpx, kpy = kpt
+
+        res[2 * k] = ctx - kpx
+        res[2 * k + 1] = cty - kpy
+        res_weights[2 * k] = 1
+        res_weights[2 * k + 1] = 1
+
+    def forward(self, data_dict, **kwargs):
+        w, h = get_image_size(data_dict['image'])
+
+        center_heatmap_target = torch.zeros(1, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+        kpt_heatmap_target = torch.zeros(1, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+        cen2kpt_target = torch.zeros(8, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+        cen2kpt_target_weight = torch.zeros(8, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+        kpt2cen_target = torch.zeros(8, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+        kpt2cen_target_weight = torch.zeros(8, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+        cen_offset_target = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+        cen_offset_target_weight = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+        kpt_offset_target = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+        kpt_offset_target_weight = torch.zeros(2, int(h * self.ratio), int(w * self.ratio)).type(torch.float32)
+
+        gt_bbox = torch.from_numpy(data_dict['bbox'])
+        # gt_label = torch.from_numpy(data_dict['bbox_meta']['class_id'])
+        center_x = (gt_bbox[:, [0]] + gt_bbox[:, [2]]) / 2
+        center_y = (gt_bbox[:, [1]] + gt_bbox[:, [3]]) / 2
+        gt_centers = torch.cat((center_x, center_y), dim=1) * self.ratio
+        center_meta = data_dict['bbox_meta']
+
+        gt_keypoints = torch.from_numpy(data_dict['point']) * self.ratio
+        visible = data_dict['point_meta']['keep']
+
+        for j, ct in enumerate(gt_centers):
+            ctx_int, cty_int = ct.int()
+            ctx, cty = ct
+            scale_box_h = (gt_bbox[j][3] - gt_bbox[j][1]) * self.ratio
+            scale_box_w = (gt_bbox[j][2] - gt_bbox[j][0]) * self.ratio
+            radius = gaussian_radius([scale_box_h, scale_box_w], min_overlap=0.3)
+            radius = max(0, int(radius))
+            # ind = gt_label[j]
+            gen_gaussian_target(center_heatmap_target[0], [ctx_int, cty_int], radius)
+
+            for i in range(4):
+                if not visible[j][i]:
+                    continue
+                # 到底是浮点还是取整？
+                kpx, kpy = gt_keypoints[j][i]
+                # 跟论文里图3下面公式1的计算方法不一样
+                cen2kpt_target[2 * i, cty_int, ctx_int] = kpx - ctx
+                cen2kpt_target[2 * i + 1, cty_int, ctx_int] = kpy - cty
+                cen2kpt_target_weight[2 * i, cty_int, ctx_int] = 1
+                cen2kpt_target_weight[2 * i + 1, cty_int, ctx_int] = 1
+
+            cen_offset_target[0, cty_int, ctx_int] = ctx - ctx_int
+            cen_offset_target[1, cty_int, ctx_int] = cty - cty_int
+            cen_offset_target_weight[:, cty_int, ctx_int] = 1
+
+            # table_id = center_meta['table_id'][j]
+            # startcol = center_meta['startcol'][j]
+            # endcol = center_meta['endcol'][j]
+            # startrow = center_meta['startrow'][j]
+            # endrow = center_meta['endrow'][j]
+            # print(j, table_id, startcol, endcol, startrow, endrow)
+            # exit()
+
+            for k, kpt in enumerate(gt_keypoints[j]):
+                if not visible[j][k]:
+                    continue
+
+                kpx_int, kpy_int = kpt.int()
+                kpx, kpy = kpt
+                # print(j, k, kpt)
+                gen_gaussian_target(kpt_heatmap_target[0], [kpx_int, kpy_int], radius)
+
+                res, res_weights = self.calc_kpt2cen(kpt, center_meta['table_id'][j], gt_centers, center_meta['table_id'])
+
+                kpt2cen_target[:, kpy_int, kpx_int] = res
+                kpt2cen_target_weight[:, kpy_int, kpx_int] = res_weights
+
+                kpt_offset_target[0, kpy_int, kpx_int] = kpx - kpx_int
+                kpt_offset_target[1, kpy_int, kpx_int] = kpy - kpy_int
+                kpt_offset_target_weight[:, kpy_int, kpx_int] = 1
+
+        data_dict['center_heatmap'] = center_heatmap_target
+        data_dict['kpt_heatmap'] = kpt_heatmap_target
+
+        data_dict['center_offset_map'] = cen_offset_target
+        data_dict['center_offset_target_weight'] = cen_offset_target_weight
+
+        data_dict['cen2kpt_map'] = cen2kpt_target
+        data_dict['cen2kpt_weight_map'] = cen2kpt_target_weight
+
+        data_dict['kpt2cen_map'] = kpt2cen_target
+        data_dict['kpt2cen_weight_map'] = kpt2cen_target_weight
+
+        data_dict['keypoint_offset_map'] = kpt_offset_target
+        data_dict['keypoint_offset_target_weight'] = kpt_offset_target_weight
+
+        return data_dict
+
+
+def make_sample(num_objs, num_points, size, crowd, low=-3):
+    w, h = size
+    xy = np.random.uniform(low - 1 if low < 0 else 2, (w / 2, h / 2), size=(num_objs, 2))
+    wh = np.random.uniform(1, (w / 4, h / 4), size=(num_objs, 2))
+    bbox = np.concatenate((xy, np.minimum(xy + wh, (w - 1, h - 1))), axis=1).astype(np.float32)
+    if crowd:
+        # objects sharing a center pixel, the last write has to win
+        bbox[1::2] = bbox[::2][:len(bbox[1::2])] + np.random.uniform(0, 0.5, size=(len(bbox[1::2]), 4)).astype(np.float32)
+        bbox = np.minimum(bbox, (w - 1, h - 1, w - 1, h - 1)).astype(np.float32)
+    point = np.random.uniform(bbox[:, None, :2] - 2, bbox[:, None, 2:], size=(num_objs, num_points, 2)).astype(np.float32)
+    point = np.clip(point, low, (w - 1, h - 1)).astype(np.float32)
+    return dict(
+        image=torch.zeros(3, h, w),
+        bbox=bbox,
+        bbox_meta=Meta(class_id=np.random.randint(0, 3, num_objs).astype(np.int32), table_id=np.random.randint(0, 2, num_objs).astype(np.int32)),
+        point=point,
+        point_meta=Meta(keep=np.random.rand(num_objs, num_points) < 0.8),
+    )
+
+
+def copy_sample(data_dict):
+    return dict(
+        image=data_dict['image'],
+        bbox=data_dict['bbox'].copy(),
+        bbox_meta=data_dict['bbox_meta'].copy(),
+        point=data_dict['point'].copy(),
+        point_meta=data_dict['point_meta'].copy(),
+    )
+
+
+def check(a, b):
+    for k in a.keys():
+        if isinstance(a[k], torch.Tensor):
+            assert torch.equal(a[k], b[k]), k
+
+
+def bench(t, samples):
+    start = time.perf_counter()
+    for s in samples:
+        t(copy_sample(s))
+    return (time.perf_counter() - start) / len(samples) * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20)
+    parser.add_argument('--num_objs', type=int, default=200)
+    parser.add_argument('--size', type=int, default=512)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    pairs = [
+        ('CenterNet bbox', dict(ratio=0.25, num_classes=3), 17),
+        ('CenterNet bbox+point', dict(ratio=0.25, num_classes=3, use_point=True), 17),
+        ('CenterNet point', dict(ratio=0.25, num_classes=3, use_bbox=False, use_point=True), 17),
+        ('PTS', dict(ratio=1), 4),
+    ]
+
+    for name, kwargs, num_points in pairs:
+        if name == 'PTS':
+            loop, vec = LoopPTSGrids(**kwargs), CalcPTSGrids(**kwargs)
+        else:
+            loop, vec = LoopCenterNetGrids(**kwargs), CalcCenterNetGrids(**kwargs)
+
+        for i in range(200):
+            s = make_sample(np.random.randint(0, 30), num_points, (8 * np.random.randint(2, 12), 8 * np.random.randint(2, 12)), crowd=i % 2 == 0, low=0 if name == 'PTS' else -3)
+            check(loop(copy_sample(s)), vec(copy_sample(s)))
+
+        samples = [make_sample(args.num_objs, num_points, (args.size, args.size), crowd=False, low=0) for _ in range(args.num)]
+        loop_ms, vec_ms = bench(loop, samples), bench(vec, samples)
+        print('{:<24} {} objects: loop {:.2f} ms, vectorized {:.2f} ms, x{:.1f}'.format(name, args.num_objs, loop_ms, vec_ms, loop_ms / vec_ms))
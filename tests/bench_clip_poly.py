@@ -0,0 +1,118 @@
+import cv2
+import time
+import argparse
+import pyclipper
+import numpy as np
+from shapely.geometry import Polygon, box
+
+from castty.datasets.utils.structures import PolyArray
+from castty.datasets.utils.common import clip_poly, is_convex_poly
+
+
+def loop_clip_poly(polys, img_size):
+    # pyclipper for every polygon leaving the image, the reference
+    width, height = img_size
+    subj = (((0, 0), (width, 0), (width, height), (0, height)),)
+
+    tmp = []
+    for i, poly in enumerate(polys):
+        wf = np.bitwise_and(poly[..., 0] >= 0, poly[..., 0] < width)
+        hf = np.bitwise_and(poly[..., 1] >= 0, poly[..., 1] < height)
+        if np.bitwise_and(wf, hf).all():
+            tmp.append(poly)
+        else:
+            poly_tmp = poly.tolist()
+            pc = pyclipper.Pyclipper()
+            pc.AddPaths(subj, pyclipper.PT_SUBJECT, True)
+            pc.AddPath(poly_tmp, pyclipper.PT_CLIP, True)
+            poly_tmp = pc.Execute(pyclipper.CT_INTERSECTION, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
+            if len(poly_tmp) > 0:
+                tmp.append(np.array(poly_tmp[0]).astype(np.float32))
+            else:
+                tmp.append(np.zeros(poly.shape).astype(np.float32) - 1)
+    return tmp
+
+
+def make_convex(w, h):
+    # rotated boxes, triangles and hulls of random points, around the borders as often as not
+    cx, cy = np.random.uniform(-0.2 * w, 1.2 * w), np.random.uniform(-0.2 * h, 1.2 * h)
+    kind = np.random.randint(3)
+    if kind == 0:
+        poly = cv2.boxPoints(((cx, cy), tuple(np.random.uniform(2, 0.5 * w, 2)), np.random.uniform(-90, 90)))
+    else:
+        points = np.random.uniform(-1, 1, (3 if kind == 1 else 12, 2)) * np.random.uniform(2, 0.4 * w) + (cx, cy)
+        poly = cv2.convexHull(points.astype(np.float32))[:, 0]
+    return poly[::np.random.choice([-1, 1])].astype(np.float32)
+
+
+def make_concave(w, h):
+    # a star, every other point pulled in
+    n = np.random.randint(4, 9)
+    angles = np.sort(np.random.uniform(0, 2 * np.pi, 2 * n))
+    radii = np.where(np.arange(2 * n) % 2 == 0, 1.0, np.random.uniform(0.2, 0.6)) * np.random.uniform(5, 0.4 * w)
+    center = np.random.uniform(-0.2, 1.2, 2) * (w, h)
+    return (np.stack((np.cos(angles), np.sin(angles)), axis=1) * radii[:, None] + center).astype(np.float32)
+
+
+def pyclipper_area(poly, w, h):
+    pc = pyclipper.Pyclipper()
+    pc.AddPaths((((0, 0), (w, 0), (w, h), (0, h)),), pyclipper.PT_SUBJECT, True)
+    try:
+        pc.AddPath(poly.tolist(), pyclipper.PT_CLIP, True)
+    except pyclipper.ClipperException:
+        # too thin for integer points
+        return None
+    res = pc.Execute(pyclipper.CT_INTERSECTION, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
+    return sum(abs(pyclipper.Area(p)) for p in res)
+
+
+def area(poly):
+    return 0 if (poly < 0).any() else Polygon(poly).area
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    for _ in range(200):
+        w, h = np.random.randint(32, 1024, 2)
+        convex = [make_convex(w, h) for _ in range(50)]
+        concave = [make_concave(w, h) for _ in range(10)]
+        assert is_convex_poly(convex).all() and not is_convex_poly(concave).any()
+
+        res = clip_poly(PolyArray(convex + concave), (w, h))
+        for k, (poly, p) in enumerate(zip(convex + concave, res)):
+            assert (p >= 0).all() and (p[:, 0] <= w).all() and (p[:, 1] <= h).all() or (p == -1).all()
+            if k < len(convex):
+                # the exact area of the float polygon, and pyclipper rounding to integer points
+                exact = Polygon(poly).intersection(box(0, 0, w, h)).area
+                assert abs(area(p) - exact) <= 1e-3 * exact + 1e-2, (area(p), exact)
+                rounded = pyclipper_area(poly, w, h)
+                assert rounded is None or abs(area(p) - rounded) <= cv2.arcLength(poly, True) + 4, (area(p), rounded)
+        # concave ones still go through pyclipper
+        ref = loop_clip_poly([p.copy() for p in concave], (w, h))
+        for p, r in zip(res[len(convex):], ref):
+            assert np.array_equal(p, r)
+    print('areas ok')
+
+    for num_polys in (50, 200, 800):
+        samples = []
+        for _ in range(args.num):
+            w, h = np.random.randint(320, 1280, 2)
+            # text quads as in ICDAR, after a crop
+            quads = [cv2.boxPoints(((np.random.uniform(-0.1, 1.1) * w, np.random.uniform(-0.1, 1.1) * h), tuple(np.random.uniform(10, 200, 2)), np.random.uniform(-45, 45))) for _ in range(num_polys)]
+            samples.append((quads, (w, h)))
+
+        start = time.perf_counter()
+        for polys, size in samples:
+            loop_clip_poly([p.copy() for p in polys], size)
+        loop_ms = (time.perf_counter() - start) / len(samples) * 1e3
+
+        samples = [(PolyArray(polys), size) for polys, size in samples]
+        start = time.perf_counter()
+        for polys, size in samples:
+            clip_poly(polys.copy(), size)
+        vectorized_ms = (time.perf_counter() - start) / len(samples) * 1e3
+        print('{} polygons: pyclipper {:.2f} ms, vectorized {:.2f} ms, x{:.1f}'.format(num_polys, loop_ms, vectorized_ms, loop_ms / vectorized_ms))
@@ -0,0 +1,100 @@
+import os
+import cv2
+import json
+import time
+import tempfile
+import argparse
+import numpy as np
+import multiprocessing
+import torch.utils.data
+from addict import Dict
+
+from castty.datasets.dataset import Dataset
+
+
+def make_coco(root, num_images, num_anns=10, num_keypoints=17):
+    os.makedirs(os.path.join(root, 'images'), exist_ok=True)
+    cv2.imwrite(os.path.join(root, 'images', 'img.jpg'), np.zeros((64, 64, 3), dtype=np.uint8))
+
+    images = [dict(id=i, file_name='img.jpg', width=64, height=64) for i in range(num_images)]
+    annotations = []
+    for i in range(num_images * num_anns):
+        x, y = np.random.uniform(0, 32, size=2).tolist()
+        w, h = np.random.uniform(0.5, 32, size=2).tolist()
+        annotations.append(dict(
+            id=i,
+            image_id=int(np.random.randint(num_images)),
+            category_id=1,
+            bbox=[x, y, w, h],
+            area=w * h,
+            iscrowd=int(np.random.rand() < 0.05),
+            segmentation=[[x, y, x + w, y, x + w, y + h]],
+            keypoints=np.random.uniform(0, 64, size=num_keypoints * 3).round(2).tolist(),
+        ))
+
+    path = os.path.join(root, 'annotations.json')
+    with open(path, 'w') as f:
+        json.dump(dict(images=images, annotations=annotations, categories=[dict(id=1, name='person')]), f)
+    return path
+
+
+def pss_kb(pid):
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+    return 0
+
+
+def record_pid(pids):
+    def worker_init_fn(worker_id):
+        pids.append(os.getpid())
+    return worker_init_fn
+
+
+def measure(set_path, img_root, num_workers, keep_api):
+    cfg = Dict(
+        reader=dict(type='COCOAPIReader', set_path=set_path, img_root=img_root, use_keypoint=True, keep_api=keep_api, use_pil=False),
+        internodes=[dict(type='DataSource')],
+    )
+
+    t = time.time()
+    dataset = Dataset(cfg)
+    init_time = time.time() - t
+
+    pids = multiprocessing.Manager().list()
+    dataloader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=None,
+        shuffle=True,
+        num_workers=num_workers,
+        persistent_workers=True,
+        worker_init_fn=record_pid(pids),
+        collate_fn=lambda x: x,
+    )
+
+    t = time.time()
+    for _ in dataloader:
+        pass
+    iter_time = time.time() - t
+
+    main_pss = pss_kb(os.getpid())
+    workers_pss = sum(pss_kb(pid) for pid in pids)
+    del dataloader
+    return init_time, len(dataset) / iter_time, main_pss, workers_pss
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_images', type=int, default=20000)
+    parser.add_argument('--num_workers', type=int, default=8)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    set_path = make_coco(tmp, args.num_images)
+    img_root = os.path.join(tmp, 'images')
+
+    for keep_api in [True, False]:
+        init_time, sps, main_pss, workers_pss = measure(set_path, img_root, args.num_workers, keep_api)
+        print('keep_api={}: init {:.2f}s, {:.1f} samples/s, main PSS {:.1f} MB, {} workers PSS {:.1f} MB'.format(
+            keep_api, init_time, sps, main_pss / 1024, args.num_workers, workers_pss / 1024))
@@ -0,0 +1,176 @@
+import math
+import time
+import random
+import argparse
+import numpy as np
+
+from castty.utils.bbox_tools import calc_iou1
+from castty.datasets.utils.common import filter_bbox_by_center
+from castty.datasets.bamboo.crop import MinIOUCrop, MinIOGCrop, crop_bbox
+
+
+class LoopMinIOUCrop(MinIOUCrop):
+    # one candidate per attempt, the reference for the batched search
+    def calc_cropping(self, data_dict):
+        width, height = data_dict['image'].shape[1], data_dict['image'].shape[0]
+
+        while True:
+            mode = random.choice(self.threshs)
+            if mode is None:
+                return 0, 0, width, height
+
+            min_iou = mode
+
+            for _ in range(self.attempts):
+                w = int(random.uniform(0.3 * width, width))
+                h = int(random.uniform(0.3 * height, height))
+
+                if h / w < 1.0 / self.aspect_ratio or h / w > self.aspect_ratio:
+                    continue
+
+                left = int(random.uniform(0, width - w))
+                top = int(random.uniform(0, height - h))
+
+                rect = np.array([left, top, left + w, top + h]).astype(np.int32)
+
+                overlap = calc_iou1(data_dict['bbox'], rect[np.newaxis, ...])
+
+                if (overlap < min_iou).any():
+                    continue
+
+                boxes = crop_bbox(data_dict['bbox'].copy(), rect[0], rect[1])
+                keep = filter_bbox_by_center(boxes, (w, h))
+
+                if len(keep) == 0:
+                    continue
+
+                return rect[0], rect[1], rect[2], rect[3]
+
+
+class LoopMinIOGCrop(MinIOGCrop):
+    def calc_cropping(self, data_dict):
+        ulw, ulh = data_dict['image'].shape[1], data_dict['image'].shape[0]
+        llw, llh = 0.3 * ulw, 0.3 * ulh
+
+        p_llw = [[llw, p] for p in self.check(llw, llh, ulh)]
+        p_ulh = [[p, ulh] for p in self.check(ulh, llw, ulw)]
+        p_ulw = [[ulw, p] for p in self.check(ulw, llh, ulh)[::-1]]
+        p_llh = [[p, llh] for p in self.check(llh, llw, ulw)[::-1]]
+
+        temp = p_llw + p_ulh + p_ulw + p_llh
+        ps = [temp[0]]
+        for i in range(1, len(temp)):
+            if temp[i] != ps[-1]:
+                ps.append(temp[i])
+        if ps[0] == ps[-1]:
+            ps = ps[:-1]
+        ps = np.array(ps)
+        x = ps[:, 0]
+        y = ps[:, 1]
+
+        while True:
+            mode = random.choice(self.threshs)
+            if mode is None:
+                return 0, 0, ulw, ulh
+
+            min_iou = mode
+
+            r = np.random.rand(1, len(ps))
+            r = r * r
+            rs = np.broadcast_to(np.sum(r, axis=1, keepdims=True), r.shape)
+            r = r / rs
+            xp = np.broadcast_to(x[np.newaxis, ...], r.shape) * r
+            yp = np.broadcast_to(y[np.newaxis, ...], r.shape) * r
+            w = np.sum(xp, axis=1).astype(np.int32)[0]
+            h = np.sum(yp, axis=1).astype(np.int32)[0]
+
+            for _ in range(self.attempts):
+                left = random.uniform(0, ulw - w)
+                top = random.uniform(0, ulh - h)
+                rect = np.array([left, top, left + w, top + h]).astype(np.int32)
+
+                overlap = self.iog_calc(data_dict['bbox'][:, :4], rect[np.newaxis, ...])
+
+                if (overlap < min_iou).any():
+                    continue
+
+                boxes = crop_bbox(data_dict['bbox'].copy(), rect[0], rect[1])
+                keep = filter_bbox_by_center(boxes, (w, h))
+
+                if len(keep) == 0:
+                    continue
+
+                return rect[0], rect[1], rect[2], rect[3]
+
+
+def make_sample(w, h, num_bboxes):
+    # objects of every size, as in VOC or COCO
+    wh = np.random.uniform(0.02, 0.6, (num_bboxes, 2)) * (w, h)
+    xy = np.random.uniform(0, 1, (num_bboxes, 2)) * ((w, h) - wh)
+    return dict(image=np.zeros((h, w, 3), dtype=np.uint8), bbox=np.concatenate((xy, xy + wh), axis=1).astype(np.float32))
+
+
+def satisfies(t, data_dict, rect):
+    # the constraints of the loop, for one rect
+    rect = np.array(rect).astype(np.int32)
+    w, h = rect[2] - rect[0], rect[3] - rect[1]
+    if (rect[:2] == 0).all() and w == data_dict['image'].shape[1] and h == data_dict['image'].shape[0]:
+        return True
+    if isinstance(t, MinIOGCrop):
+        overlap = t.iog_calc(data_dict['bbox'][:, :4], rect[np.newaxis, ...])
+    else:
+        overlap = calc_iou1(data_dict['bbox'], rect[np.newaxis, ...])
+    if (overlap < min(m for m in t.threshs if m is not None)).any():
+        return False
+    # MinIOGCrop crops w x h from the left top of the rect, which can be one pixel wider
+    return len(filter_bbox_by_center(crop_bbox(data_dict['bbox'].copy(), rect[0], rect[1]), (w + 1, h + 1))) > 0
+
+
+def draw(t, data_dict, num):
+    return np.array([t.calc_cropping(data_dict) for _ in range(num)], dtype=np.float64)
+
+
+def bench(t, samples, num):
+    start = time.perf_counter()
+    for s in samples:
+        for _ in range(num):
+            t.calc_cropping(s)
+    return (time.perf_counter() - start) / len(samples) / num * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=200)
+    parser.add_argument('--draws', type=int, default=3000)
+    args = parser.parse_args()
+
+    threshs = (-1, 0.1, 0.3, 0.5, 0.7, 0.9)
+    pairs = [
+        ('MinIOUCrop', LoopMinIOUCrop(threshs=threshs), MinIOUCrop(threshs=threshs)),
+        ('MinIOGCrop', LoopMinIOGCrop(threshs=threshs), MinIOGCrop(threshs=threshs)),
+    ]
+
+    random.seed(0)
+    np.random.seed(0)
+    for name, loop, batched in pairs:
+        for _ in range(5):
+            s = make_sample(np.random.randint(200, 800), np.random.randint(200, 800), np.random.randint(1, 10))
+            size = np.array(s['image'].shape[:2][::-1] * 2, dtype=np.float64)
+
+            a, b = draw(loop, s, args.draws), draw(batched, s, args.draws)
+            assert all(satisfies(batched, s, r) for r in b)
+            # the same distribution, the means of the normalized corners and sides within 5 standard errors
+            a, b = a / size, b / size
+            a, b = np.concatenate((a, a[:, 2:] - a[:, :2]), axis=1), np.concatenate((b, b[:, 2:] - b[:, :2]), axis=1)
+            err = np.sqrt((a.var(axis=0) + b.var(axis=0)) / args.draws) + 1e-9
+            assert (np.abs(a.mean(axis=0) - b.mean(axis=0)) < 5 * err).all(), (name, a.mean(axis=0), b.mean(axis=0))
+            # and the share of whole image crops
+            whole_a, whole_b = (a[:, 4:] == 1).all(axis=1).mean(), (b[:, 4:] == 1).all(axis=1).mean()
+            assert abs(whole_a - whole_b) < 5 * math.sqrt((whole_a + whole_b) / 2 * (1 - (whole_a + whole_b) / 2) * 2 / args.draws) + 1e-9
+    print('distributions ok')
+
+    for num_bboxes in (2, 10, 50):
+        samples = [make_sample(640, 480, num_bboxes) for _ in range(10)]
+        for name, loop, batched in pairs:
+            loop_ms, batched_ms = bench(loop, samples, args.num), bench(batched, samples, args.num)
+            print('{}, {} boxes: loop {:.3f} ms, batched {:.3f} ms, x{:.1f}'.format(name, num_bboxes, loop_ms, batched_ms, loop_ms / batched_ms))
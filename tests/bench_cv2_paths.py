@@ -0,0 +1,46 @@
+import time
+import random
+import argparse
+import numpy as np
+from PIL import Image
+
+from castty.datasets.bamboo.builder import build_bamboo
+
+
+internodes = [
+    dict(type='CenterCrop', size=(384, 384)),
+    dict(type='Padding', padding=(16, 16, 16, 16)),
+    dict(type='BrightnessEnhancement', brightness=(0.8, 1.2)),
+    dict(type='ContrastEnhancement', contrast=(0.8, 1.2)),
+    dict(type='SaturationEnhancement', saturation=(0.8, 1.2)),
+    dict(type='HueEnhancement', hue=(-0.1, 0.1)),
+    dict(type='RandomErasing'),
+    dict(type='GridMask'),
+    dict(type='SwapChannels', swap=(2, 1, 0)),
+    dict(type='RandomSwapChannels'),
+]
+
+
+def bench(bamboo, image, num):
+    random.seed(0)
+    np.random.seed(0)
+    t = time.perf_counter()
+    for _ in range(num):
+        bamboo(dict(image=image.copy()))
+    return num / (time.perf_counter() - t)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=200)
+    parser.add_argument('--size', type=int, default=512)
+    args = parser.parse_args()
+
+    image = np.random.randint(0, 255, (args.size, args.size, 3), dtype=np.uint8)
+
+    print('{:<24}{:>12}{:>12}'.format('internode', 'pil it/s', 'cv2 it/s'))
+    for cfg in internodes:
+        bamboo = build_bamboo(internodes=[cfg], tag_mapping=dict(image=['image']))
+        pil = bench(bamboo, Image.fromarray(image), args.num)
+        cv2 = bench(bamboo, image, args.num)
+        print('{:<24}{:>12.1f}{:>12.1f}'.format(cfg['type'], pil, cv2))
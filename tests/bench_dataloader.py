@@ -0,0 +1,282 @@
+import os
+import sys
+import cv2
+import json
+import time
+import torch
+import resource
+import platform
+import tempfile
+import argparse
+import itertools
+import subprocess
+import numpy as np
+
+from castty.datasets import DataManager
+from castty.config import load_config_far_away
+from bench_packed import make_voc
+
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configs')
+CHARACTER = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def random_image(size):
+    w, h = size
+    return np.random.randint(0, 255, (h, w, 3), dtype=np.uint8)
+
+
+def make_voc_seg(root, num, size=(320, 240), num_classes=3):
+    img_root = os.path.join(root, 'JPEGImages')
+    mask_root = os.path.join(root, 'SegmentationClass')
+    os.makedirs(img_root, exist_ok=True)
+    os.makedirs(mask_root, exist_ok=True)
+
+    w, h = size
+    for i in range(num):
+        cv2.imwrite(os.path.join(img_root, '{:06d}.jpg'.format(i)), random_image(size))
+        mask = np.zeros((h, w), dtype=np.uint8)
+        for c in range(1, num_classes):
+            x1, y1 = np.random.randint(0, w // 2), np.random.randint(0, h // 2)
+            mask[y1:y1 + np.random.randint(2, h // 2), x1:x1 + np.random.randint(2, w // 2)] = c
+        cv2.imwrite(os.path.join(mask_root, '{:06d}.png'.format(i)), mask)
+    return ['__background__'] + ['c{}'.format(c) for c in range(1, num_classes)]
+
+
+def make_wflw(root, num, size=(320, 240)):
+    img_root = os.path.join(root, 'WFLW_images')
+    os.makedirs(img_root, exist_ok=True)
+
+    w, h = size
+    lines = []
+    for i in range(num):
+        name = '{:06d}.jpg'.format(i)
+        cv2.imwrite(os.path.join(img_root, name), random_image(size))
+        x1, y1 = np.random.randint(0, w // 2), np.random.randint(0, h // 2)
+        x2, y2 = x1 + np.random.randint(16, w // 2), y1 + np.random.randint(16, h // 2)
+        landmark = np.random.uniform((x1, y1), (x2, y2), size=(98, 2)).round(3)
+        lines.append(' '.join(map(str, landmark.flatten().tolist() + [x1, y1, x2, y2] + [0] * 6 + [name])))
+
+    txt_path = 'list_98pt_train.txt'
+    with open(os.path.join(root, txt_path), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return txt_path
+
+
+def make_icdar(root, num, size=(320, 240), num_texts=8):
+    img_root = os.path.join(root, 'ch4_training_images')
+    txt_root = os.path.join(root, 'ch4_training_localization_transcription_gt')
+    os.makedirs(img_root, exist_ok=True)
+    os.makedirs(txt_root, exist_ok=True)
+
+    w, h = size
+    for i in range(num):
+        cv2.imwrite(os.path.join(img_root, 'img_{}.jpg'.format(i)), random_image(size))
+        lines = []
+        for j in range(num_texts):
+            x1, y1 = np.random.randint(0, w - 40), np.random.randint(0, h - 16)
+            x2, y2 = x1 + np.random.randint(8, 40), y1 + np.random.randint(4, 16)
+            text = '###' if j == 0 else 'text'
+            lines.append('{},{},{},{},{},{},{},{},{}'.format(x1, y1, x2, y1, x2, y2, x1, y2, text))
+        with open(os.path.join(txt_root, 'gt_img_{}.txt'.format(i)), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+
+
+def make_lmdb(root, num, size=(100, 32)):
+    import lmdb
+    os.makedirs(root, exist_ok=True)
+
+    env = lmdb.open(root, map_size=1 << 30)
+    with env.begin(write=True) as txn:
+        for i in range(1, num + 1):
+            label = ''.join(np.random.choice(list(CHARACTER), np.random.randint(1, 12)))
+            txn.put('image-{:0>9d}'.format(i).encode(), cv2.imencode('.jpg', random_image(size))[1].tobytes())
+            txn.put('label-{:0>9d}'.format(i).encode(), label.encode())
+        txn.put('num-samples'.encode(), str(num).encode())
+    env.close()
+
+    char_path = os.path.join(root, 'character.txt')
+    with open(char_path, 'w') as f:
+        f.write(CHARACTER)
+    return char_path
+
+
+def make_coco_keypoints(root, num, size=(320, 240), num_persons=3, num_keypoints=17):
+    img_root = os.path.join(root, 'images')
+    os.makedirs(img_root, exist_ok=True)
+
+    w, h = size
+    images = []
+    annotations = []
+    for i in range(num):
+        name = '{:06d}.jpg'.format(i)
+        cv2.imwrite(os.path.join(img_root, name), random_image(size))
+        images.append(dict(id=i, file_name=name, width=w, height=h))
+        for _ in range(num_persons):
+            x, y = np.random.uniform(0, w / 2), np.random.uniform(0, h / 2)
+            bw, bh = np.random.uniform(8, w / 2), np.random.uniform(8, h / 2)
+            keypoints = np.concatenate((np.random.uniform((x, y), (x + bw, y + bh), size=(num_keypoints, 2)).round(2), np.full((num_keypoints, 1), 2)), axis=1)
+            annotations.append(dict(
+                id=len(annotations), image_id=i, category_id=1, bbox=[x, y, bw, bh], area=bw * bh, iscrowd=0,
+                keypoints=keypoints.flatten().tolist(), num_keypoints=num_keypoints,
+            ))
+
+    set_path = os.path.join(root, 'person_keypoints.json')
+    with open(set_path, 'w') as f:
+        json.dump(dict(images=images, annotations=annotations, categories=[dict(id=1, name='person')]), f)
+    return set_path
+
+
+def make_datasets(root, num):
+    # config name -> reader on a synthetic dataset shaped like the one the config was written for,
+    # plus the collate functions needed to batch what the config only collates at batch size 1
+    np.random.seed(0)
+    readers = dict()
+
+    classes = make_voc(os.path.join(root, 'voc'), num)
+    readers['bbox'] = dict(type='VOCReader', root=os.path.join(root, 'voc'), filter_difficult=False, classes=classes)
+
+    classes = make_voc_seg(os.path.join(root, 'voc_seg'), num)
+    readers['mask'] = dict(type='VOCSegReader', root=os.path.join(root, 'voc_seg'), classes=classes)
+
+    txt_path = make_wflw(os.path.join(root, 'wflw'), num)
+    readers['point'] = dict(type='WFLWReader', root=os.path.join(root, 'wflw'), txt_path=txt_path)
+
+    make_icdar(os.path.join(root, 'icdar'), num)
+    readers['poly'] = dict(type='ICDARDetReader', root=os.path.join(root, 'icdar'))
+
+    char_path = make_lmdb(os.path.join(root, 'lmdb'), num)
+    readers['seq'] = dict(type='LmdbDTRBReader', root=os.path.join(root, 'lmdb'), char_path=char_path)
+
+    set_path = make_coco_keypoints(os.path.join(root, 'coco'), num)
+    readers['heatmap'] = dict(type='COCOAPIReader', use_keypoint=True, set_path=set_path, img_root=os.path.join(root, 'coco', 'images'))
+
+    collators = dict(
+        point=[dict(type='ListCollateFN', names=('point',))],
+        heatmap=[dict(type='ListCollateFN', names=('point',))],
+    )
+    return {k: dict(reader=v, collator=collators.get(k, [])) for k, v in readers.items()}
+
+
+def build_cfg(job):
+    cfg = load_config_far_away(os.path.join(CONFIG_DIR, job['config'] + '.py'))[job['split']]
+    cfg.dataset.reader = dict(job['dataset']['reader'], use_pil=job['use_pil'])
+
+    internodes = []
+    for internode in cfg.dataset.internodes:
+        if internode['type'] == 'ToTensor':
+            if not job['use_pil']:
+                # ToTensor only takes PIL images, the conversion is part of what a cv2 reader costs
+                internodes.append(dict(type='ToPILImage'))
+            if job['size'] > 0:
+                internodes.append(dict(type='Resize', size=(job['size'], job['size']), keep_ratio=False))
+        internodes.append(internode)
+    cfg.dataset.internodes = internodes
+
+    cfg.data_loader.collator = list(cfg.data_loader.collator) + job['dataset']['collator']
+    cfg.data_loader.num_threads = job['num_threads']
+    cfg.data_loader.batch_size = job['batch_size']
+    cfg.data_loader.serial_batches = True
+    return cfg
+
+
+def peak_rss_mb(who):
+    # ru_maxrss is in KB on linux, children are the DataLoader workers that already exited
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def batches(dataloader):
+    # start over when the synthetic dataset is shorter than the run
+    while True:
+        for batch in dataloader:
+            yield batch
+
+
+def run(job):
+    torch.manual_seed(0)
+    np.random.seed(0)
+
+    t = time.perf_counter()
+    data_manager = DataManager(build_cfg(job))
+    build_ms = (time.perf_counter() - t) * 1e3
+
+    latency = []
+    num_samples = 0
+    it = batches(data_manager.load_data())
+    t = time.perf_counter()
+    for i in range(job['num_batches'] + job['warmup']):
+        batch = next(it)
+        end = time.perf_counter()
+        if i >= job['warmup']:
+            latency.append(end - t)
+            num_samples += len(batch['image'])
+        t = end
+    it.close()
+    del it, data_manager
+
+    latency = np.array(latency) * 1e3
+    return dict(
+        build_ms=build_ms,
+        samples_per_s=num_samples / latency.sum() * 1e3,
+        p50_ms=float(np.percentile(latency, 50)),
+        p99_ms=float(np.percentile(latency, 99)),
+        peak_rss_mb=peak_rss_mb(resource.RUSAGE_SELF),
+        peak_worker_rss_mb=peak_rss_mb(resource.RUSAGE_CHILDREN) if job['num_threads'] > 0 else None,
+    )
+
+
+def sweep(args, datasets):
+    results = []
+    for config, num_threads, batch_size, use_pil in itertools.product(args.configs, args.num_threads, args.batch_size, args.use_pil):
+        record = dict(config=config, reader=datasets[config]['reader']['type'], num_threads=num_threads, batch_size=batch_size, use_pil=use_pil)
+        job = dict(record, split=args.split, dataset=datasets[config], size=args.size, num_batches=args.num_batches, warmup=args.warmup)
+        # one process per point so that peak RSS and worker startup do not leak between points
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--job', json.dumps(job)], capture_output=True, text=True)
+        if proc.returncode == 0:
+            record.update(json.loads(proc.stdout.strip().split('\n')[-1]))
+        else:
+            record['error'] = proc.stderr.strip().split('\n')[-1]
+        print(json.dumps(record), file=sys.stderr)
+        results.append(record)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='samples/s, batch latency and peak RSS of DataManager for each config on synthetic data')
+    parser.add_argument('--configs', type=str, nargs='+', default=['bbox', 'mask', 'point', 'poly', 'seq', 'heatmap'])
+    parser.add_argument('--split', type=str, default='test_data')
+    parser.add_argument('--num_threads', type=int, nargs='+', default=[0, 2, 4])
+    parser.add_argument('--batch_size', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--use_pil', type=int, nargs='+', default=[1, 0])
+    parser.add_argument('--size', type=int, default=256, help='resize before ToTensor so that images stack, 0 keeps the config as is')
+    parser.add_argument('--num', type=int, default=256, help='number of synthetic samples per dataset')
+    parser.add_argument('--num_batches', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--root', type=str, default='', help='where to write the synthetic datasets, a temp dir by default')
+    parser.add_argument('--out', type=str, default='', help='path of the json report, stdout by default')
+    parser.add_argument('--job', type=str, default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.job:
+        print(json.dumps(run(json.loads(args.job))))
+        sys.exit(0)
+
+    args.use_pil = [bool(u) for u in args.use_pil]
+    datasets = make_datasets(args.root if args.root else tempfile.mkdtemp(), args.num)
+
+    report = dict(
+        time=time.strftime('%Y-%m-%d %H:%M:%S'),
+        python=platform.python_version(),
+        torch=torch.__version__,
+        cpu_count=os.cpu_count(),
+        size=args.size,
+        num_samples=args.num,
+        num_batches=args.num_batches,
+        results=sweep(args, datasets),
+    )
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,207 @@
+import cv2
+import math
+import time
+import torch
+import random
+import argparse
+import numpy as np
+from PIL import Image, ImageOps, ImageDraw
+
+from castty.datasets.bamboo import RandomErasing, GridMask
+from castty.datasets.utils.common import get_image_size, is_pil, is_cv2
+
+
+# PIL masks and full-size backgrounds, the reference for the array masks
+class LoopErasing(object):
+    def forward_image(self, image, meta, intl_erase_mask, intl_erase_bgd, **kwargs):
+        if intl_erase_mask is None:
+            return image, meta
+
+        if is_pil(image):
+            image = Image.composite(image, intl_erase_bgd, intl_erase_mask)
+        elif is_cv2(image):
+            # the erase masks are binary, composite is a masked write
+            erase = cv2.compare(np.asarray(intl_erase_mask), 0, cv2.CMP_EQ)
+            if not image.flags.writeable or not image.flags.c_contiguous:
+                image = image.copy()
+            cv2.copyTo(np.asarray(intl_erase_bgd), erase, image)
+        else:
+            intl_erase_mask = torch.from_numpy((np.array(intl_erase_mask) > 0).astype(np.int32))
+            intl_erase_mask = intl_erase_mask.unsqueeze(0).repeat(3, 1, 1)
+            w, h = get_image_size(image)
+            intl_erase_bgd = torch.from_numpy(np.array(intl_erase_bgd))
+            intl_erase_bgd = intl_erase_bgd.permute(2, 0, 1)
+            image = image * intl_erase_mask + intl_erase_bgd * (1 - intl_erase_mask)
+
+        return image, meta
+
+    def forward_mask(self, mask, meta, intl_erase_mask, intl_erase_bgd, **kwargs):
+        if intl_erase_mask is None:
+            return mask, meta
+
+        if is_cv2(mask):
+            intl_erase_mask = (np.array(intl_erase_mask) > 0).astype(np.int32)
+            w, h = get_image_size(mask)
+            bgd = np.zeros((h, w), np.int32)
+            mask = mask * intl_erase_mask + bgd * (1 - intl_erase_mask)
+        else:
+            intl_erase_mask = torch.from_numpy((np.array(intl_erase_mask) > 0).astype(np.int32))
+            h, w = mask.shape
+            bgd = torch.zeros(mask.shape, dtype=mask.dtype)
+            mask = mask * intl_erase_mask + bgd * (1 - intl_erase_mask)
+
+        return mask, meta
+
+
+class LoopRandomErasing(LoopErasing, RandomErasing):
+    def calc_intl_param_forward(self, data_dict):
+        assert 'point' not in data_dict.keys() and 'bbox' not in data_dict.keys()
+
+        param = dict(intl_erase_mask=None, intl_erase_bgd=None)
+
+        w, h = get_image_size(data_dict['image'])
+        area = w * h
+        for attempt in range(10):
+            erase_area = random.uniform(self.scale[0], self.scale[1]) * area
+            aspect_ratio = random.uniform(self.ratio[0], self.ratio[1])
+
+            new_h = int(round(math.sqrt(erase_area * aspect_ratio)))
+            new_w = int(round(math.sqrt(erase_area / aspect_ratio)))
+
+            if new_h < h and new_w < w:
+                y = random.randint(0, h - new_h)
+                x = random.randint(0, w - new_w)
+
+                param['intl_erase_mask'] = Image.new("L", get_image_size(data_dict['image']), 255)
+                draw = ImageDraw.Draw(param['intl_erase_mask'])
+                draw.rectangle((x, y, x + new_w, y + new_h), fill=0)
+
+                if 'image' in data_dict.keys():
+                    if self.offset:
+                        offset = 2 * (np.random.rand(h, w) - 0.5)
+                        offset = np.uint8(offset * 255)
+                        param['intl_erase_bgd'] = Image.fromarray(offset).convert('RGB')
+                    else:
+                        param['intl_erase_bgd'] = Image.new('RGB', get_image_size(data_dict['image']), self.value)
+                break
+
+        return param
+
+
+class LoopGridMask(LoopErasing, GridMask):
+    def calc_intl_param_forward(self, data_dict):
+        assert 'point' not in data_dict.keys()
+
+        w, h = get_image_size(data_dict['image'])
+
+        hh = int(1.5 * h)
+        ww = int(1.5 * w)
+        d = np.random.randint(2, min(h, w))
+
+        if self.ratio == 1:
+            l = np.random.randint(1, d)
+        else:
+            l = min(max(int(d * self.ratio + 0.5), 1), d - 1)
+
+        mask = np.ones((hh, ww), np.float32)
+
+        st_h = np.random.randint(d)
+        st_w = np.random.randint(d)
+
+        if self.use_h:
+            for i in range(hh // d):
+                s = d * i + st_h
+                t = min(s + l, hh)
+                mask[s:t, :] = 0
+
+        if self.use_w:
+            for i in range(ww // d):
+                s = d * i + st_w
+                t = min(s + l, ww)
+                mask[:, s:t] = 0
+
+        mask = Image.fromarray(np.uint8(mask * 255))
+        if not self.invert:
+            mask = ImageOps.invert(mask)
+
+        if self.rotate != 0:
+            r = np.random.randint(self.rotate)
+            mask = mask.rotate(r)
+
+        param = dict()
+        param['intl_erase_mask'] = mask.crop(((ww - w) // 2, (hh - h) // 2, (ww - w) // 2 + w, (hh - h) // 2 + h))
+
+        if 'image' in data_dict.keys():
+            if self.offset:
+                offset = 2 * (np.random.rand(h, w) - 0.5)
+                offset = np.uint8(offset * 255)
+                param['intl_erase_bgd'] = Image.fromarray(offset).convert('RGB')
+            else:
+                param['intl_erase_bgd'] = Image.new('RGB', get_image_size(data_dict['image']), 0)
+
+        return param
+
+
+def run(t, data_dict, seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    return t(data_dict)
+
+
+def as_array(image):
+    return image.permute(1, 2, 0).numpy() if isinstance(image, torch.Tensor) else np.asarray(image)
+
+
+def make_inputs(w, h):
+    image = np.random.randint(0, 256, (h, w, 3), dtype=np.uint8)
+    mask = np.random.randint(0, 21, (h, w)).astype(np.int32)
+    yield 'pil', lambda: dict(image=Image.fromarray(image), mask=mask.copy())
+    yield 'cv2', lambda: dict(image=image.copy(), mask=mask.copy())
+    yield 'tensor', lambda: dict(image=torch.from_numpy(image).permute(2, 0, 1).float() / 255, mask=torch.from_numpy(mask))
+
+
+def bench(t, make, num):
+    data_dicts = [make() for _ in range(num)]
+    start = time.perf_counter()
+    for i, data_dict in enumerate(data_dicts):
+        run(t, data_dict, i)
+    return (time.perf_counter() - start) / num * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=50)
+    parser.add_argument('--size', type=int, default=512)
+    args = parser.parse_args()
+
+    cases = [
+        (LoopRandomErasing(), RandomErasing()),
+        (LoopRandomErasing(offset=True), RandomErasing(offset=True)),
+        (LoopRandomErasing(value=(124, 116, 104)), RandomErasing(value=(124, 116, 104))),
+        (LoopGridMask(), GridMask()),
+        (LoopGridMask(invert=True, offset=True, ratio=0.6), GridMask(invert=True, offset=True, ratio=0.6)),
+        (LoopGridMask(use_w=False), GridMask(use_w=False)),
+        (LoopGridMask(rotate=45), GridMask(rotate=45)),
+    ]
+
+    np.random.seed(0)
+    for loop, array in cases:
+        worst = 0
+        for seed in range(50):
+            w, h = np.random.randint(16, 400), np.random.randint(16, 400)
+            for kind, make in make_inputs(w, h):
+                a, b = run(loop, make(), seed), run(array, make(), seed)
+                image_diff = np.mean(np.any(as_array(a['image']) != as_array(b['image']), axis=-1))
+                mask_diff = np.mean(np.asarray(a['mask']) != np.asarray(b['mask']))
+                if loop.rotate if isinstance(loop, GridMask) else False:
+                    # nearest sampling of cv2 and PIL may differ along the stripe borders
+                    worst = max(worst, image_diff, mask_diff)
+                else:
+                    assert image_diff == 0 and mask_diff == 0, (array, kind)
+        print('{}: {}'.format(array, 'exact' if worst == 0 else '{:.4%} pixels differ at most'.format(worst)))
+
+    print('{:<80}{:>10}{:>12}{:>12}'.format('internode', 'input', 'loop ms', 'array ms'))
+    for loop, array in cases:
+        for kind, make in make_inputs(args.size, args.size):
+            loop_ms, array_ms = bench(loop, make, args.num), bench(array, make, args.num)
+            print('{:<80}{:>10}{:>12.3f}{:>12.3f}'.format(str(array), kind, loop_ms, array_ms))
@@ -0,0 +1,59 @@
+import os
+import time
+import shutil
+import tempfile
+import argparse
+from addict import Dict
+
+from castty.datasets.export import export_dataset
+from castty.datasets.readers import PackedReader
+from bench_packed import make_voc, compare
+
+
+internodes = [
+    dict(type='DataSource'),
+    dict(type='MinIOUCrop', threshs=[0.1, 0.3, 0.5, 0.7, 0.9]),
+    dict(type='Flip', horizontal=True, p=0.5),
+    dict(type='Resize', size=(256, 256), keep_ratio=False),
+    dict(type='BrightnessEnhancement', brightness=(0.8, 1.2), p=0.5),
+]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=200)
+    parser.add_argument('--num_epochs', type=int, default=2)
+    parser.add_argument('--num_workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    classes = make_voc(os.path.join(tmp, 'voc'), args.num)
+    cfg = Dict(reader=dict(type='VOCReader', root=os.path.join(tmp, 'voc'), classes=classes, use_pil=False), internodes=internodes)
+
+    readers = []
+    for num_workers in args.num_workers:
+        root = os.path.join(tmp, 'export_{}'.format(num_workers))
+        t = time.perf_counter()
+        export_dataset(cfg, root, args.num_epochs, num_workers, encoding='png', shard_size=64)
+        print('{} workers: {:.1f} samples/s'.format(num_workers, args.num * args.num_epochs / (time.perf_counter() - t)))
+        readers.append(PackedReader(root, use_pil=False))
+
+    # the same seeds whatever the number of workers
+    for reader in readers[1:]:
+        for i in range(len(reader)):
+            compare(readers[0][i], reader[i])
+
+    # resume after losing the last shards
+    root = os.path.join(tmp, 'export_{}'.format(args.num_workers[0]))
+    for name in sorted(os.listdir(root))[-4:]:
+        if name.endswith('.pkl') and name.startswith('shard'):
+            os.remove(os.path.join(root, name))
+    export_dataset(cfg, root, args.num_epochs, args.num_workers[0], encoding='png', shard_size=64)
+    resumed = PackedReader(root, use_pil=False)
+    for i in range(len(resumed)):
+        compare(readers[-1][i], resumed[i])
+    print('deterministic and resumable ok')
+
+    epoch = PackedReader(root, epoch=args.num_epochs - 1, use_pil=False)
+    compare(epoch[0], resumed[(args.num_epochs - 1) * args.num])
+    shutil.rmtree(tmp)
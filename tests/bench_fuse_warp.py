@@ -0,0 +1,126 @@
+import copy
+import time
+import itertools
+import random
+import argparse
+import numpy as np
+
+from castty.datasets.bamboo.builder import build_bamboo
+from bench_bamboo_compile import TinyReader
+
+
+chains = dict(
+    rotate_resize_pad=[
+        dict(type='WarpRotate', angle=(-30, 30), expand=True, ccs=True),
+        dict(type='ResizeAndPadding',
+            resize=dict(type='Resize', size=(512, 512), keep_ratio=True, short=False),
+            padding=dict(type='PaddingBySize', size=(512, 512), center=True)
+        ),
+    ],
+    perspective_rotate_resize=[
+        dict(type='WarpPerspective', distortion_scale=0.3, expand=True, ccs=True),
+        dict(type='WarpRotate', angle=(-30, 30), expand=True, ccs=True),
+        dict(type='Resize', size=(512, 512), keep_ratio=True, short=False),
+    ],
+    crop_flip_rot90_rescale_resize_pad=[
+        dict(type='MinIOUCrop', threshs=[0.1, 0.3, 0.5, 0.7, 0.9]),
+        dict(type='Flip', horizontal=True, p=0.5),
+        dict(type='Rot90', k=[1, 2, 3], p=0.5),
+        dict(type='Rescale', ratio_range=(0.8, 1.2)),
+        dict(type='ResizeAndPadding',
+            resize=dict(type='Resize', size=(512, 512), keep_ratio=True, short=False),
+            padding=dict(type='PaddingBySize', size=(512, 512), center=True)
+        ),
+    ],
+)
+
+
+# every internode a FusedWarp takes, resizes around a pair make a run and keep a warp pending, so the pair is folded into it
+foldable = [
+    dict(type='CenterCrop', size=(30, 24)),
+    dict(type='RandomCenterCropPad', size=(64, 64), ratios=[0.6, 1.0, 1.4], border=16),
+    dict(type='MinIOUCrop', threshs=[0.1, 0.3, 0.5]),
+    dict(type='RandomAreaCrop', scale=(0.4, 1.0)),
+    dict(type='Padding', padding=(3, 5, 7, 9)),
+    dict(type='PaddingBySize', size=(128, 128), center=True),
+    dict(type='Flip', horizontal=True),
+    dict(type='Rot90', k=[1, 2, 3]),
+    dict(type='Resize', size=(64, 64), keep_ratio=True, short=False),
+    dict(type='Rescale', ratio_range=(0.7, 1.3)),
+    dict(type='ResizeAndPadding',
+        resize=dict(type='Resize', size=(64, 64), keep_ratio=True, short=False),
+        padding=dict(type='PaddingBySize', size=(64, 64), center=True)
+    ),
+    dict(type='WarpRotate', angle=(-30, 30)),
+    dict(type='WarpRotate', angle=(-30, 30), expand=True, ccs=True),
+    dict(type='WarpPerspective', distortion_scale=0.3, ccs=True),
+]
+
+
+def run_both(cfgs, reader, tag_mapping, seed):
+    plain = build_bamboo(internodes=copy.deepcopy(cfgs), tag_mapping=tag_mapping).compile()
+    fused = build_bamboo(internodes=copy.deepcopy(cfgs), tag_mapping=tag_mapping).compile(fuse_warp=True)
+    res = []
+    for bamboo in (plain, fused):
+        random.seed(seed)
+        np.random.seed(seed)
+        res.append(bamboo(dict(reader=reader, index=0, len_data_lines=len(reader), intl_branch_id=0)))
+    return res, fused.plan
+
+
+def parity(reader, tag_mapping, num=3):
+    # a smooth image with no zeros, a border that shows image content instead of the fill is far off
+    x, y = np.meshgrid(np.arange(reader.image.shape[1]), np.arange(reader.image.shape[0]))
+    reader.image = np.stack([20 + x + y, 20 + x, 20 + y], axis=-1).astype(np.uint8)
+    reader.bbox = np.array([[10, 12, 40, 50], [30, 20, 80, 70]], dtype=np.float32)
+
+    for a, b in itertools.product(foldable, repeat=2):
+        name = '{} -> {}'.format(a['type'], b['type'])
+        cfgs = [dict(type='DataSource'), dict(type='Resize', size=(88, 88), keep_ratio=True, short=False), a, b, dict(type='Resize', size=(80, 80), keep_ratio=True, short=False)]
+        for seed in range(num):
+            (x, y), plan = run_both(cfgs, reader, tag_mapping, seed)
+            assert any(type(t).__name__ == 'FusedWarp' for t in plan), name
+            assert x['image'].shape == y['image'].shape, name
+            assert np.array_equal(x['bbox'], y['bbox']), name
+            # resampling once instead of twice differs at the edges, most of all on small crops blown up, and by a few levels inside
+            diff = np.abs(x['image'].astype(np.int32) - y['image'].astype(np.int32))
+            assert (diff > 32).mean() < 0.05 and diff.mean() < 4, '{}: {:.4f} off, mean {:.2f}'.format(name, (diff > 32).mean(), diff.mean())
+
+    # a single resize among whole pixel steps is left to the sequential path
+    cfgs = [dict(type='DataSource')] + chains['crop_flip_rot90_rescale_resize_pad'][:3] + chains['crop_flip_rot90_rescale_resize_pad'][4:]
+    _, plan = run_both(cfgs, reader, tag_mapping, 0)
+    assert not any(type(t).__name__ == 'FusedWarp' for t in plan)
+
+
+def bench(bamboo, reader, num):
+    random.seed(0)
+    np.random.seed(0)
+    t = time.perf_counter()
+    for i in range(num):
+        res = bamboo(dict(reader=reader, index=i, len_data_lines=len(reader), intl_branch_id=0))
+    return (time.perf_counter() - t) / num * 1e3, res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=200)
+    parser.add_argument('--size', type=int, default=800)
+    args = parser.parse_args()
+
+    parity(TinyReader(size=96, use_pil=False), TinyReader(use_pil=False).info['tag_mapping'])
+    print('parity ok')
+
+    reader = TinyReader(size=args.size, use_pil=False)
+    reader.bbox = np.array([[50, 60, 300, 400], [200, 100, 700, 500]], dtype=np.float32)
+    tag_mapping = reader.info['tag_mapping']
+
+    for name, chain in chains.items():
+        cfgs = [dict(type='DataSource')] + chain
+        plain = build_bamboo(internodes=copy.deepcopy(cfgs), tag_mapping=tag_mapping).compile()
+        fused = build_bamboo(internodes=copy.deepcopy(cfgs), tag_mapping=tag_mapping).compile(fuse_warp=True)
+
+        plain_ms, a = bench(plain, reader, args.num)
+        fused_ms, b = bench(fused, reader, args.num)
+        assert np.array_equal(a['bbox'], b['bbox'])
+        assert a['image'].shape == b['image'].shape
+        print('{}: sequential {:.2f} ms/sample, fused {:.2f} ms/sample, x{:.2f}'.format(name, plain_ms, fused_ms, plain_ms / fused_ms))
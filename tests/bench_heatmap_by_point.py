@@ -0,0 +1,123 @@
+import time
+import torch
+import argparse
+import numpy as np
+from torch.nn.functional import affine_grid, grid_sample
+
+from castty.datasets.utils.structures import Meta
+from castty.datasets.bamboo.misc import CalcHeatmapByPoint
+from castty.datasets.utils.common import get_image_size
+
+
+class LoopHeatmapByPoint(CalcHeatmapByPoint):
+    # one full frame and one grid_sample per keypoint, the reference for the batched version
+    def calc_heatmap(self, size, pt, vis):
+        w, h = size
+        w = int(self.ratio * w)
+        h = int(self.ratio * h)
+        x, y = self.ratio * pt
+        cx, cy = round(x), round(y)
+
+        img = torch.zeros(h, w)
+
+        if not vis or not (0 <= cx < w) or not (0 <= cy < h):
+            return img, False
+
+        if self.resample:
+            offset_x = x - cx
+            offset_y = y - cy
+
+            theta = torch.zeros(1, 2, 3)
+            theta[0, 0, 0] = 1
+            theta[0, 1, 1] = 1
+            theta[0, 0, 2] = float(offset_x * self.a)
+            theta[0, 1, 2] = float(offset_y * self.a)
+
+            grid = affine_grid(theta, self.w.size(), align_corners=False)
+            warp_w = grid_sample(self.w, grid, align_corners=False).squeeze()
+
+            radius = (warp_w.shape[-1] - 1) / 2
+        else:
+
+            radius = 3 * self.sigma
+            warp_w = self.w
+
+        l = max(0, int(cx - radius))
+        t = max(0, int(cy - radius))
+        r = min(int(cx + radius) + 1, w)
+        b = min(int(cy + radius) + 1, h)
+
+        lo = int(radius - cx) if radius > cx else 0
+        to = int(radius - cy) if radius > cy else 0
+        ro = int(cx + radius + 1 - w) if cx + radius + 1 > w else 0
+        bo = int(cy + radius + 1 - h) if cy + radius + 1 > h else 0
+
+        wh, ww = warp_w.shape
+
+        img[t:b, l:r] = warp_w[to:(wh - bo), lo:(ww - ro)]
+
+        return img, True
+
+    def forward(self, data_dict, **kwargs):
+        w, h = get_image_size(data_dict['image'])
+        heatmaps_per_img = []
+        visible_per_img = []
+
+        visible = data_dict['point_meta']['keep']
+
+        for points, vises in zip(data_dict['point'], visible):
+            for point, vis in zip(points, vises):
+                heatmap, new_vis = self.calc_heatmap((w, h), point, vis)
+                heatmaps_per_img.append(heatmap.unsqueeze(0))
+                visible_per_img.append(new_vis)
+
+        visible_per_img = np.array(visible_per_img).reshape(visible.shape)
+        data_dict['heatmap'] = torch.cat(heatmaps_per_img, dim=0)
+
+        data_dict['point_meta']['keep'] = visible_per_img
+
+        return data_dict
+
+
+def make_sample(size, num_points=98):
+    w, h = size
+    # a WFLW face crop, a few landmarks fall outside or are hidden
+    point = np.random.uniform((-0.05 * w, -0.05 * h), (1.05 * w, 1.05 * h), size=(1, num_points, 2)).astype(np.float32)
+    return dict(
+        image=torch.zeros(3, h, w),
+        point=point,
+        point_meta=Meta(keep=np.random.rand(1, num_points) < 0.95),
+    )
+
+
+def copy_sample(data_dict):
+    return dict(image=data_dict['image'], point=data_dict['point'], point_meta=Meta(keep=data_dict['point_meta']['keep'].copy()))
+
+
+def bench(t, samples):
+    start = time.perf_counter()
+    for s in samples:
+        t(copy_sample(s))
+    return (time.perf_counter() - start) / len(samples) * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=50)
+    parser.add_argument('--size', type=int, default=256)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    for kwargs in [dict(ratio=0.25, sigma=1), dict(ratio=0.25, sigma=2, resample=True), dict(ratio=1, sigma=2), dict(ratio=1, sigma=3, resample=True)]:
+        loop, batched = LoopHeatmapByPoint(**kwargs), CalcHeatmapByPoint(**kwargs)
+
+        for _ in range(50):
+            s = make_sample((np.random.randint(16, 300), np.random.randint(16, 300)))
+            a, b = loop(copy_sample(s)), batched(copy_sample(s))
+            assert torch.equal(a['heatmap'], b['heatmap'])
+            assert np.array_equal(a['point_meta']['keep'], b['point_meta']['keep'])
+
+        samples = [make_sample((args.size, args.size)) for _ in range(args.num)]
+        loop_ms, batched_ms = bench(loop, samples), bench(batched, samples)
+        print('{:<48} 98 points on {}x{}: loop {:.2f} ms, batched {:.2f} ms, x{:.1f}'.format(
+            str(kwargs), args.size, args.size, loop_ms, batched_ms, loop_ms / batched_ms))
@@ -0,0 +1,86 @@
+import os
+import time
+import shutil
+import tempfile
+import argparse
+
+from castty.datasets.readers import ImageFolderReader, ImageReader, ICDARDetReader
+from castty.datasets.readers.manifest import walk, listdir, build_manifest, load_manifest
+
+
+def make_tree(root, num_classes, num_files):
+    # an image folder tree of empty files, only the listing matters here
+    for c in range(num_classes):
+        d = os.path.join(root, 'class_{:04d}'.format(c), 'sub' if c % 3 == 0 else '')
+        os.makedirs(d, exist_ok=True)
+        for i in range(num_files):
+            open(os.path.join(d, '{:06d}.jpg'.format(i)), 'w').close()
+        open(os.path.join(d, 'notes.txt'), 'w').close()
+
+
+def age(root, seconds=3600):
+    # manifests do not trust directories changed within two seconds of their walk
+    t = time.time() - seconds
+    for d, _, _ in os.walk(root):
+        os.utime(d, (t, t))
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    res = f(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_classes', type=int, default=100)
+    parser.add_argument('--num_files', type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    root, cache = os.path.join(tmp, 'data'), os.path.join(tmp, 'manifest')
+    make_tree(root, args.num_classes, args.num_files)
+    age(root)
+
+    plain, walk_s = timed(ImageFolderReader, root)
+    build_manifest(root, True, cache)
+    cached, manifest_s = timed(ImageFolderReader, root, manifest=cache)
+    assert plain.samples == cached.samples and plain.classes == cached.classes
+    print('ImageFolderReader, {} files: walk {:.3f} s, manifest {:.3f} s, x{:.1f}'.format(len(plain.samples), walk_s, manifest_s, walk_s / manifest_s))
+
+    plain, walk_s = timed(ImageReader, root)
+    build_manifest(root, False, cache)
+    cached, manifest_s = timed(ImageReader, root, manifest=cache)
+    assert plain.image_paths == cached.image_paths
+    print('ImageReader, {} files: walk {:.3f} s, manifest {:.3f} s, x{:.1f}'.format(len(plain.image_paths), walk_s, manifest_s, walk_s / manifest_s))
+
+    d = os.path.join(root, 'class_0001')
+    assert sorted(listdir(d, manifest=cache)) == sorted(os.listdir(d))
+    assert sorted((r, sorted(ds), fs) for r, ds, fs in walk(root, manifest=cache)) == sorted((r, sorted(ds), sorted(fs)) for r, ds, fs in os.walk(root))
+
+    # adding, removing and renaming change the mtime of the directory, the listing is walked again
+    open(os.path.join(d, 'new.jpg'), 'w').close()
+    assert load_manifest(root, False, cache) is None
+    assert os.path.join(d, 'new.jpg') in ImageReader(root, manifest=cache).image_paths
+    age(root)
+    build_manifest(root, False, cache)
+    os.rename(os.path.join(d, 'new.jpg'), os.path.join(d, 'renamed.jpg'))
+    assert ImageReader(root, manifest=cache).image_paths == ImageReader(root).image_paths
+    age(root)
+    build_manifest(root, False, cache)
+    os.remove(os.path.join(d, 'renamed.jpg'))
+    assert ImageReader(root, manifest=cache).image_paths == ImageReader(root).image_paths
+    # a change right after the walk keeps the mtime on coarse filesystems, so a fresh directory is not trusted
+    assert load_manifest(root, False, cache) is None
+
+    # os.listdir readers
+    icdar = os.path.join(tmp, 'icdar')
+    for sub, ext in (('ch4_training_images', 'jpg'), ('ch4_training_localization_transcription_gt', 'txt')):
+        os.makedirs(os.path.join(icdar, sub))
+        for i in range(100):
+            open(os.path.join(icdar, sub, '{}_{}.{}'.format('img' if ext == 'jpg' else 'gt_img', i, ext)), 'w').close()
+    age(icdar)
+    a, b = ICDARDetReader(icdar), ICDARDetReader(icdar, manifest=cache)
+    assert a.image_paths == b.image_paths and a.txt_paths == b.txt_paths
+    print('parity ok')
+    shutil.rmtree(tmp)
@@ -0,0 +1,155 @@
+import time
+import torch
+import argparse
+import numpy as np
+
+from castty.datasets.utils.structures import Meta
+from castty.datasets.bamboo.misc import CalcNanoGrids
+from castty.datasets.utils.common import get_image_size
+from castty.utils.bbox_tools import xyxy2xywh, get_grid2, calc_iou2
+
+
+class LoopNanoGrids(CalcNanoGrids):
+    # grids rebuilt per sample and the dense grids x gts iou, the reference for the cached version
+    def forward(self, data_dict, **kwargs):
+        w, h = get_image_size(data_dict['image'])
+        featmap_sizes = [(h // s, w // s) for s in self.strides]
+
+        grids = []
+        num_grids = []
+        for i, (fh, fw) in enumerate(featmap_sizes):
+            y, x = get_grid2(fh, fw)
+            y, x = y.flatten() * self.strides[i], x.flatten() * self.strides[i]
+            cell_size = self.strides[i] * self.scale
+
+            grid = torch.stack(
+                [x - 0.5 * cell_size, y - 0.5 * cell_size,
+                 x + 0.5 * cell_size, y + 0.5 * cell_size], dim=-1
+            )
+            num_grids.append(grid.shape[0])
+            grids.append(grid)
+
+        grids = torch.cat(grids)
+
+        bboxes = torch.from_numpy(data_dict['bbox'])
+        labels = torch.from_numpy(data_dict['bbox_meta']['class_id']).unsqueeze(-1).type(torch.float32)
+        weights = torch.from_numpy(data_dict['bbox_meta']['score']).unsqueeze(-1).type(torch.float32)
+
+        overlaps = calc_iou2(grids.unsqueeze(1), bboxes.unsqueeze(0))
+
+        assigned_gt_inds = overlaps.new_full((grids.shape[0],), 0, dtype=torch.long)
+
+        if bboxes.shape[0] > 0:
+            gt_center = xyxy2xywh(bboxes.clone())[:, :2]
+            grids_center = xyxy2xywh(grids.clone())[:, :2]
+
+            distances = (grids_center.unsqueeze(1) -
+                         gt_center.unsqueeze(0)).pow(2).sum(-1).sqrt()
+
+            distances = torch.split(distances, num_grids, dim=0)
+            start_ids = [0] + np.array(num_grids[:-1]).cumsum().tolist()
+
+            candidate_ids = []
+            for sid, d in zip(start_ids, distances):
+                _, topk_ids_per_level = d.topk(self.top_k, dim=0, largest=False)
+                candidate_ids.append(topk_ids_per_level + sid)
+            candidate_ids = torch.cat(candidate_ids, dim=0)
+
+            candidate_overlaps = overlaps[candidate_ids, torch.arange(bboxes.shape[0])]
+            overlaps_mean_per_gt = candidate_overlaps.mean(0)
+            overlaps_std_per_gt = candidate_overlaps.std(0)
+            overlaps_thr_per_gt = overlaps_mean_per_gt + overlaps_std_per_gt
+
+            is_pos = candidate_overlaps >= overlaps_thr_per_gt.unsqueeze(0)
+
+            for gt_idx in range(bboxes.shape[0]):
+                candidate_ids[:, gt_idx] += gt_idx * grids.shape[0]
+            candidate_ids = candidate_ids.view(-1)
+
+            ep_bboxes_cx = grids_center[:, 0].view(1, -1).expand(bboxes.shape[0], grids.shape[0]).contiguous().view(-1)
+            ep_bboxes_cy = grids_center[:, 1].view(1, -1).expand(bboxes.shape[0], grids.shape[0]).contiguous().view(-1)
+
+            l_ = ep_bboxes_cx[candidate_ids].view(-1, bboxes.shape[0]) - bboxes[:, 0]
+            t_ = ep_bboxes_cy[candidate_ids].view(-1, bboxes.shape[0]) - bboxes[:, 1]
+            r_ = bboxes[:, 2] - ep_bboxes_cx[candidate_ids].view(-1, bboxes.shape[0])
+            b_ = bboxes[:, 3] - ep_bboxes_cy[candidate_ids].view(-1, bboxes.shape[0])
+            is_in_gts = torch.stack([l_, t_, r_, b_], dim=1).min(dim=1)[0] > 0.01
+            is_pos = is_pos & is_in_gts
+
+            overlaps_inf = torch.full_like(overlaps, -self.INF).t().contiguous().view(-1)
+            index = candidate_ids.view(-1)[is_pos.view(-1)]
+            overlaps_inf[index] = overlaps.t().contiguous().view(-1)[index]
+            overlaps_inf = overlaps_inf.view(bboxes.shape[0], -1).t()
+
+            max_overlaps, argmax_overlaps = overlaps_inf.max(dim=1)
+            assigned_gt_inds[max_overlaps != -self.INF] = argmax_overlaps[max_overlaps != -self.INF] + 1  # background 0
+
+        pos_inds = torch.nonzero(assigned_gt_inds > 0, as_tuple=False).squeeze(-1)
+        neg_inds = torch.nonzero(assigned_gt_inds == 0, as_tuple=False).squeeze(-1)
+        pos_assigned_gt_inds = assigned_gt_inds[pos_inds] - 1
+
+        pos_gt_bboxes = bboxes[pos_assigned_gt_inds, :]
+
+        targets = torch.zeros(grids.shape[0], 8).type(torch.float)
+        targets[:, 4] = self.num_classes
+        targets[:, 7] = 1.0
+
+        targets[pos_inds, :4] = bboxes[pos_assigned_gt_inds, :]
+        targets[pos_inds, 4:5] = labels[pos_assigned_gt_inds]
+        targets[pos_inds, 5:6] = weights[pos_assigned_gt_inds]
+        targets[pos_inds, 6:7] = 1.0
+
+        data_dict['nano_target'] = targets
+        data_dict['num_pos'] = pos_inds.numel()
+        data_dict['num_neg'] = neg_inds.numel()
+        data_dict['nano_grid'] = grids
+        data_dict['nano_fs'] = featmap_sizes
+        return data_dict
+
+
+def make_sample(size, num_boxes, num_classes=80):
+    w, h = size
+    xy = np.random.uniform(-16, (w, h), size=(num_boxes, 2))
+    wh = np.exp(np.random.uniform(np.log(4), np.log(max(w, h) / 2), size=(num_boxes, 2)))
+    # a few duplicated boxes for ties
+    bbox = np.concatenate((xy, xy + wh), axis=1).astype(np.float32)
+    if num_boxes > 1:
+        bbox[-1] = bbox[0]
+    return dict(
+        image=torch.zeros(3, h, w),
+        bbox=bbox,
+        bbox_meta=Meta(class_id=np.random.randint(0, num_classes, num_boxes), score=np.ones(num_boxes, dtype=np.float32)),
+    )
+
+
+def bench(t, samples):
+    start = time.perf_counter()
+    for s in samples:
+        t(dict(s))
+    return (time.perf_counter() - start) / len(samples) * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    kwargs = dict(scale=5, top_k=9, strides=(8, 16, 32), num_classes=80)
+    loop, cached = LoopNanoGrids(**kwargs), CalcNanoGrids(**kwargs)
+
+    for _ in range(200):
+        size = (32 * np.random.randint(4, 21), 32 * np.random.randint(4, 21))
+        s = make_sample(size, np.random.randint(0, 150))
+        a, b = loop(dict(s)), cached(dict(s))
+        assert torch.equal(a['nano_target'], b['nano_target'])
+        assert torch.equal(a['nano_grid'], b['nano_grid'])
+        assert a['num_pos'] == b['num_pos'] and a['num_neg'] == b['num_neg'] and a['nano_fs'] == b['nano_fs']
+    print('parity ok')
+
+    for size in (416, 640):
+        for num_boxes in (10, 100, 300):
+            samples = [make_sample((size, size), num_boxes) for _ in range(args.num)]
+            loop_ms, cached_ms = bench(loop, samples), bench(cached, samples)
+            print('{} boxes on {}x{}: loop {:.2f} ms, cached {:.2f} ms, x{:.1f}'.format(
+                num_boxes, size, size, loop_ms, cached_ms, loop_ms / cached_ms))
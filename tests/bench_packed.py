@@ -0,0 +1,87 @@
+import os
+import cv2
+import time
+import tempfile
+import numpy as np
+from tqdm import tqdm
+
+from castty.datasets.readers import VOCReader, FondReader, PackedReader, pack_reader
+from castty.datasets.readers.packed import encode_image, decode_image
+
+
+def make_voc(root, num, size=(320, 240), num_objs=5, classes=('cat', 'dog')):
+    img_root = os.path.join(root, 'JPEGImages')
+    xml_root = os.path.join(root, 'Annotations')
+    os.makedirs(img_root, exist_ok=True)
+    os.makedirs(xml_root, exist_ok=True)
+
+    w, h = size
+    for i in range(num):
+        img = np.random.randint(0, 255, (h, w, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(img_root, '{:06d}.jpg'.format(i)), img)
+
+        objs = ''
+        for _ in range(num_objs):
+            x1, y1 = np.random.randint(0, w // 2), np.random.randint(0, h // 2)
+            x2, y2 = x1 + np.random.randint(2, w // 2), y1 + np.random.randint(2, h // 2)
+            objs += '<object><name>{}</name><difficult>0</difficult><bndbox><xmin>{}</xmin><ymin>{}</ymin><xmax>{}</xmax><ymax>{}</ymax></bndbox></object>'.format(
+                classes[np.random.randint(len(classes))], x1, y1, x2, y2)
+        with open(os.path.join(xml_root, '{:06d}.xml'.format(i)), 'w') as f:
+            f.write('<annotation><size><width>{}</width><height>{}</height></size>{}</annotation>'.format(w, h, objs))
+    return classes
+
+
+def compare(a, b):
+    assert a.keys() == b.keys(), (a.keys(), b.keys())
+    for k in a.keys():
+        if isinstance(a[k], dict):
+            compare(a[k], b[k])
+        elif isinstance(a[k], list):
+            assert len(a[k]) == len(b[k])
+            for x, y in zip(a[k], b[k]):
+                assert np.array_equal(np.asarray(x), np.asarray(y)), k
+        else:
+            assert np.array_equal(np.asarray(a[k]), np.asarray(b[k])), k
+
+
+def bench(reader, desc):
+    t = time.time()
+    for i in tqdm(range(len(reader)), desc=desc):
+        reader[i]
+    return len(reader) / (time.time() - t)
+
+
+if __name__ == '__main__':
+    tmp = tempfile.mkdtemp()
+
+    # round trip of every tag type
+    fond = FondReader(
+        mode=['label', 'bbox', 'mask', 'point', 'poly'],
+        image='images/test900.jpg',
+        label=[[1, 0], [1, 0], [0, 1], [1, 0], [1, 0], [1, 0]],
+        bbox=[306, 308, 696, 870],
+        mask=[[459.8, 566.8], [472.9, 552.1], [491.2, 545.2], [516.5, 549.7]],
+        point=[[307.17, 508.88], [584.07, 506.65], [365.90, 687.26], [451.50, 684.04], [431.55, 870.59]],
+        poly=[[321.9, 570.9], [323.7, 556.6], [334.5, 548.2], [360.3, 551.5]],
+        use_pil=False
+    )
+    pack_reader(fond, os.path.join(tmp, 'fond'))
+    compare(fond[0], PackedReader(os.path.join(tmp, 'fond'), use_pil=False)[0])
+    for shape in [(8, 8, 4), (8, 8, 3), (8, 8)]:
+        image = np.random.randint(0, 256, shape, dtype=np.uint8)
+        assert np.array_equal(decode_image(*encode_image(image, 'png'), 'png'), image), shape
+    print('round trip ok')
+
+    classes = make_voc(os.path.join(tmp, 'voc'), 500)
+    voc = VOCReader(os.path.join(tmp, 'voc'), classes, use_pil=False)
+
+    for encoding in ['raw', 'png', 'jpg']:
+        root = os.path.join(tmp, 'voc_' + encoding)
+        pack_reader(voc, root, encoding=encoding, shard_bytes=64 << 20)
+        packed = PackedReader(root, use_pil=False)
+        if encoding != 'jpg':
+            compare(voc[7], packed[7])
+
+        src_sps = bench(voc, 'VOCReader')
+        packed_sps = bench(packed, 'PackedReader[{}]'.format(encoding))
+        print('{}: source {:.1f} samples/s, packed {:.1f} samples/s, x{:.2f}'.format(encoding, src_sps, packed_sps, packed_sps / src_sps))
@@ -0,0 +1,152 @@
+import os
+import cv2
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+
+from castty.datasets.readers import ICDARDetReader
+from castty.datasets.utils.structures import PolyArray
+from castty.datasets.utils.common import clip_poly, filter_poly, filter_list
+from castty.datasets.utils.warp_tools import warp_point
+from castty.datasets.bamboo.resize import resize_poly
+from castty.datasets.bamboo.crop import crop_poly
+from castty.datasets.bamboo.pad import pad_poly
+
+
+# the list of arrays versions, the reference for PolyArray, clip_poly has its own in bench_clip_poly
+
+def loop_resize_poly(polys, scale):
+    for i in range(len(polys)):
+        polys[i][..., 0] *= scale[0]
+        polys[i][..., 1] *= scale[1]
+    return polys
+
+
+def loop_crop_poly(polys, x1, y1):
+    for i in range(len(polys)):
+        polys[i][..., 0] -= x1
+        polys[i][..., 1] -= y1
+    return polys
+
+
+def loop_pad_poly(polys, left, top):
+    for i in range(len(polys)):
+        polys[i][..., 0] += left
+        polys[i][..., 1] += top
+    return polys
+
+
+def loop_flip_poly(polys, w):
+    for i in range(len(polys)):
+        polys[i][:, 0] = w - polys[i][:, 0]
+    return polys
+
+
+def loop_filter_poly(polys):
+    res = []
+    for poly in polys:
+        x = poly[..., 0] < 0
+        y = poly[..., 1] < 0
+        res.append(~(x | y).any())
+    return np.array(res)
+
+
+def rotation(w, h):
+    M = np.eye(3)
+    M[:2] = cv2.getRotationMatrix2D((w / 2, h / 2), np.random.uniform(-30, 30), np.random.uniform(0.8, 1.2))
+    return M
+
+
+def loop_pipeline(polys, w, h, params):
+    (scale, M, crop, padding) = params
+    polys = loop_resize_poly(polys, scale)
+    w, h = int(w * scale[0]), int(h * scale[1])
+    polys = [warp_point(p, M) for p in polys]
+    polys = list(clip_poly(polys, (w, h)))
+    polys = filter_list(polys, loop_filter_poly(polys))
+    polys = loop_flip_poly(polys, w)
+    polys = loop_crop_poly(polys, crop[0], crop[1])
+    polys = list(clip_poly(polys, (crop[2] - crop[0], crop[3] - crop[1])))
+    polys = filter_list(polys, loop_filter_poly(polys))
+    polys = loop_pad_poly(polys, *padding)
+    return polys + polys
+
+
+def pipeline(polys, w, h, params):
+    (scale, M, crop, padding) = params
+    polys = resize_poly(polys, scale)
+    w, h = int(w * scale[0]), int(h * scale[1])
+    polys = PolyArray(data=warp_point(polys.data, M), offsets=polys.offsets)
+    polys = clip_poly(polys, (w, h))
+    polys = polys[filter_poly(polys)]
+    polys.data[:, 0] = w - polys.data[:, 0]
+    polys = crop_poly(polys, crop[0], crop[1])
+    polys = clip_poly(polys, (crop[2] - crop[0], crop[3] - crop[1]))
+    polys = polys[filter_poly(polys)]
+    polys = pad_poly(polys, *padding)
+    return polys + polys
+
+
+def make_params(w, h):
+    scale = np.random.uniform(0.5, 1.5, 2)
+    w, h = int(w * scale[0]), int(h * scale[1])
+    x1, y1 = np.random.randint(0, w // 4), np.random.randint(0, h // 4)
+    crop = (x1, y1, x1 + np.random.randint(w // 2, w - x1), y1 + np.random.randint(h // 2, h - y1))
+    return tuple(scale), rotation(w, h), crop, tuple(np.random.randint(0, 64, 2))
+
+
+def make_icdar(root, num, num_polys, size=(1280, 720)):
+    # ch4 layout, quads with a few ### ones
+    w, h = size
+    os.makedirs(os.path.join(root, 'ch4_training_images'))
+    os.makedirs(os.path.join(root, 'ch4_training_localization_transcription_gt'))
+    for i in range(num):
+        lines = []
+        for _ in range(num_polys):
+            cx, cy = np.random.uniform(0, w), np.random.uniform(0, h)
+            box = cv2.boxPoints(((cx, cy), (np.random.uniform(10, 200), np.random.uniform(8, 40)), np.random.uniform(-45, 45)))
+            text = '###' if np.random.rand() < 0.1 else 'text'
+            lines.append(','.join(str(int(round(v))) for v in box.flatten()) + ',' + text)
+        with open(os.path.join(root, 'ch4_training_localization_transcription_gt', 'gt_img_{}.txt'.format(i + 1)), 'w') as f:
+            f.write('\n'.join(lines))
+        cv2.imwrite(os.path.join(root, 'ch4_training_images', 'img_{}.jpg'.format(i + 1)), np.zeros((h, w, 3), dtype=np.uint8))
+
+
+def bench(f, samples, params, copy):
+    start = time.perf_counter()
+    for s, p in zip(samples, params):
+        f(copy(s[0]), s[1], s[2], p)
+    return (time.perf_counter() - start) / len(samples) * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    for num_polys in (50, 200, 800):
+        tmp = tempfile.mkdtemp()
+        make_icdar(tmp, args.num, num_polys)
+        reader = ICDARDetReader(tmp, use_pil=False)
+        samples = []
+        for i in range(len(reader)):
+            res = reader[i]
+            samples.append((res['poly'], res['image'].shape[1], res['image'].shape[0]))
+        shutil.rmtree(tmp)
+        params = [make_params(w, h) for _, w, h in samples]
+
+        for (polys, w, h), p in zip(samples, params):
+            a = loop_pipeline(polys.tolist(), w, h, p)
+            b = pipeline(polys.copy(), w, h, p)
+            assert len(a) == len(b)
+            for x, y in zip(a, b):
+                assert np.array_equal(x, y)
+
+        loop_samples = [(polys.tolist(), w, h) for polys, w, h in samples]
+        loop_ms = bench(loop_pipeline, loop_samples, params, lambda polys: [p.copy() for p in polys])
+        packed_ms = bench(pipeline, samples, params, lambda polys: polys.copy())
+        print('{} polygons: list {:.2f} ms, PolyArray {:.2f} ms, x{:.1f}'.format(num_polys, loop_ms, packed_ms, loop_ms / packed_ms))
+    print('parity ok')
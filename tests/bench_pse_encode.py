@@ -0,0 +1,152 @@
+import cv2
+import sys
+import time
+import torch
+import argparse
+import numpy as np
+import pyclipper
+from shapely.geometry import Polygon as plg
+
+from castty.datasets.bamboo.misc import PSEEncode, PSECrop, DBEncode
+from castty.datasets.bamboo.misc.psenet import generate_effective_mask
+from castty.datasets.utils.common import get_image_size
+from bench_db_encode import make_sample, copy_sample, bench
+
+
+def generate_kernel(img_size, polys, shrink_ratio, max_shrink=sys.maxsize, ignore_flags=None):
+    # one ratio at a time, the reference for generate_kernels
+    w, h = img_size
+    text_kernel = np.zeros((h, w), dtype=np.float32)
+
+    if ignore_flags is None:
+        ignore_flags = np.array([False] * len(polys))
+
+    for text_ind, poly in enumerate(polys):
+        instance = poly.reshape(-1, 2).astype(np.int32)
+        area = plg(instance).area
+        peri = cv2.arcLength(instance, True)
+        distance = min(
+            int(area * (1 - shrink_ratio * shrink_ratio) / (peri + 0.001) +
+                0.5), max_shrink)
+        pco = pyclipper.PyclipperOffset()
+        pco.AddPath(instance, pyclipper.JT_ROUND,
+                    pyclipper.ET_CLOSEDPOLYGON)
+        # a list, split kernels are ragged
+        shrunk = pco.Execute(-distance)
+
+        if len(shrunk) == 0 or len(shrunk[0]) == 0:
+            ignore_flags[text_ind] = True
+            continue
+        shrunk = np.array(shrunk[0]).reshape(-1, 2)
+
+        if not ignore_flags[text_ind]:
+            cv2.fillPoly(text_kernel, [shrunk.astype(np.int32)], 1)
+    return text_kernel, ignore_flags
+
+
+class LoopPSEEncode(PSEEncode):
+    def forward(self, data_dict, **kwargs):
+        labels = data_dict['poly_meta']['class_id']
+        w, h = get_image_size(data_dict['image'])
+        ignore_flags = np.logical_not(data_dict['poly_meta']['keep'])
+
+        kernels = []
+        for i in range(self.num_classes):
+            keep = np.nonzero(labels == i)[0].tolist()
+            tmp_polys = [data_dict['poly'][k] for k in keep]
+            tmp_flags = [ignore_flags[k] for k in keep]
+
+            for s in self.shrink_ratio:
+                kernel, tmp_flags = generate_kernel((w, h), tmp_polys, s, self.max_shrink, tmp_flags)
+                kernels.append(kernel[np.newaxis, ...])
+
+            for j, k in enumerate(keep):
+                ignore_flags[k] = tmp_flags[j]
+
+        data_dict['pse_kernel'] = torch.from_numpy(np.concatenate(kernels))
+        data_dict['pse_mask'] = torch.from_numpy(generate_effective_mask((w, h), data_dict['poly'], ignore_flags))
+        data_dict['poly_meta']['keep'] = np.logical_not(ignore_flags)
+        return data_dict
+
+
+class LoopDBShrink(DBEncode):
+    # only the shrink map part of DBEncode.forward
+    def forward(self, data_dict, **kwargs):
+        labels = data_dict['poly_meta']['class_id']
+        w, h = get_image_size(data_dict['image'])
+        ignore_flags = np.logical_not(data_dict['poly_meta']['keep'])
+        ignore_flags = self.find_invalid(data_dict['poly'], ignore_flags)
+
+        data_dict['db_shrink_map'] = []
+        for i in range(self.num_classes):
+            keep = np.nonzero(labels == i)[0].tolist()
+            tmp_polys = [data_dict['poly'][k] for k in keep]
+            tmp_flags = [ignore_flags[k] for k in keep]
+
+            shrink_map, tmp_flags = generate_kernel((w, h), tmp_polys, self.shrink_ratio, ignore_flags=tmp_flags)
+            data_dict['db_shrink_map'].append(shrink_map)
+
+            for j, k in enumerate(keep):
+                ignore_flags[k] = tmp_flags[j]
+
+        data_dict['db_shrink_map'] = torch.from_numpy(np.array(data_dict['db_shrink_map']))
+        data_dict['poly_meta']['keep'] = np.logical_not(ignore_flags)
+        return data_dict
+
+
+class LoopPSECrop(PSECrop):
+    def calc_cropping(self, data_dict):
+        w, h = get_image_size(data_dict['image'])
+        img_gt = (data_dict['pse_kernel'].sum(dim=0) > 0).type(torch.int32)
+
+        t_h, t_w = self.size
+        t_h = t_h if t_h < h else h
+        t_w = t_w if t_w < w else w
+        if torch.max(img_gt) > 0 and np.random.random_sample() < self.positive_sample_ratio:
+            tl = torch.min(torch.vstack(torch.where(img_gt > 0)), dim=1)[0] - torch.tensor([t_h, t_w])
+            tl[tl < 0] = 0
+            br = torch.max(torch.vstack(torch.where(img_gt > 0)), dim=1)[0] - torch.tensor([t_h, t_w])
+            br[br < 0] = 0
+            br[0] = min(br[0], h - t_h)
+            br[1] = min(br[1], w - t_w)
+            top = np.random.randint(tl[0], br[0]) if tl[0] < br[0] else 0
+            left = np.random.randint(tl[1], br[1]) if tl[1] < br[1] else 0
+        else:
+            top = np.random.randint(0, h - t_h) if h - t_h > 0 else 0
+            left = np.random.randint(0, w - t_w) if w - t_w > 0 else 0
+        return left, top, left + self.size[0], top + self.size[1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=10)
+    parser.add_argument('--size', type=int, default=640)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    loop, engine = LoopPSEEncode(num_classes=2), PSEEncode(num_classes=2)
+    loop_db, engine_db = LoopDBShrink(num_classes=2), DBEncode(num_classes=2)
+    loop_crop, engine_crop = LoopPSECrop(size=(320, 320)), PSECrop(size=(320, 320))
+
+    for i in range(100):
+        s = make_sample((np.random.randint(64, 640), np.random.randint(64, 640)), np.random.randint(0, 30), 2)
+        a, b = loop(copy_sample(s)), engine(copy_sample(s))
+        for key in ('pse_kernel', 'pse_mask'):
+            assert torch.equal(a[key], b[key]), key
+        assert np.array_equal(a['poly_meta']['keep'], b['poly_meta']['keep'])
+
+        c, d = loop_db(copy_sample(s)), engine_db(copy_sample(s))
+        assert torch.equal(c['db_shrink_map'], d['db_shrink_map'])
+        assert np.array_equal(c['poly_meta']['keep'], d['poly_meta']['keep'])
+
+        np.random.seed(i)
+        x = loop_crop.calc_cropping(b)
+        np.random.seed(i)
+        assert x == engine_crop.calc_cropping(b)
+    print('parity ok')
+
+    for num_polys in (10, 50, 200):
+        samples = [make_sample((args.size, args.size), num_polys, 2) for _ in range(args.num)]
+        loop_ms, engine_ms = bench(loop, samples), bench(engine, samples)
+        print('PSEEncode, {} polygons on {}x{}: loop {:.1f} ms, engine {:.1f} ms, x{:.1f}'.format(
+            num_polys, args.size, args.size, loop_ms, engine_ms, loop_ms / engine_ms))
@@ -0,0 +1,78 @@
+import cv2
+import time
+import argparse
+import numpy as np
+from shapely.geometry import Polygon
+
+from castty.datasets.utils.structures import Meta, PolyArray
+from castty.datasets.bamboo.colander import FilterSelfOverlapping
+
+
+class LoopFilterSelfOverlapping(FilterSelfOverlapping):
+    # every pair, the reference for the tree
+    def calc_reject(self, polys):
+        polygon_shapes = [Polygon(p) for p in polys]
+
+        reject = np.zeros(len(polys), dtype=np.bool_)
+        for i in range(len(polys) - 1):
+            for j in range(i + 1, len(polys)):
+                if self.iou is None:
+                    if polygon_shapes[i].intersects(polygon_shapes[j]):
+                        reject[i] = reject[j] = True
+                else:
+                    intersect = polygon_shapes[i].intersection(polygon_shapes[j]).area
+                    union = polygon_shapes[i].union(polygon_shapes[j]).area + 1e-6
+                    if intersect / union >= self.iou:
+                        reject[i] = reject[j] = True
+        return reject
+
+
+def make_document(num_polys):
+    # lines of slightly rotated word boxes, a few of them duplicated with an offset
+    w = 2000
+    h = max(1000, num_polys * 2)
+    polys = []
+    while len(polys) < num_polys:
+        cx, cy = np.random.uniform(0, w), np.random.uniform(0, h)
+        box = cv2.boxPoints(((cx, cy), (np.random.uniform(20, 120), np.random.uniform(10, 30)), np.random.uniform(-5, 5)))
+        polys.append(box)
+        if np.random.rand() < 0.05:
+            polys.append(box + np.random.uniform(-10, 10, 2).astype(np.float32))
+    return PolyArray(polys[:num_polys])
+
+
+def run(t, polys):
+    return t(dict(poly=polys.copy(), poly_meta=Meta(keep=np.ones(len(polys), dtype=np.bool_))))['poly_meta']['keep']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max_loop', type=int, default=2000, help='largest size the pairwise version is timed on')
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    for iou in (None, 0.1, 0.5):
+        loop, tree = LoopFilterSelfOverlapping(iou=iou), FilterSelfOverlapping(iou=iou)
+        for _ in range(20):
+            polys = make_document(np.random.randint(2, 300))
+            assert np.array_equal(run(loop, polys), run(tree, polys))
+
+            res = tree(dict(poly=polys.copy()))['poly']
+            assert len(res) == run(tree, polys).sum()
+    print('parity ok')
+
+    for num_polys in (100, 500, 1000, 2000, 5000):
+        polys = make_document(num_polys)
+        loop, tree = LoopFilterSelfOverlapping(), FilterSelfOverlapping()
+
+        start = time.perf_counter()
+        run(tree, polys)
+        tree_ms = (time.perf_counter() - start) * 1e3
+
+        if num_polys <= args.max_loop:
+            start = time.perf_counter()
+            run(loop, polys)
+            loop_ms = (time.perf_counter() - start) * 1e3
+            print('{} polygons: pairwise {:.1f} ms, tree {:.1f} ms, x{:.0f}'.format(num_polys, loop_ms, tree_ms, loop_ms / tree_ms))
+        else:
+            print('{} polygons: tree {:.1f} ms'.format(num_polys, tree_ms))
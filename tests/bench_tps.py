@@ -0,0 +1,137 @@
+import time
+import torch
+import argparse
+import numpy as np
+from PIL import Image
+
+from castty.datasets.bamboo import TPSStretch, TPSDistort
+from castty.datasets.bamboo.tps import gen_grid
+
+
+# the solver before caching the lattice, the reference for gen_grid
+def loop_calc_points(length):
+    a1, a2 = -1, 1
+    l = length - 1
+
+    res = []
+    for i in range(length):
+        res.append(((l - i) * a1 + i * a2) / l)
+    return res
+
+
+def loop_build_P(width, height):
+    x = loop_calc_points(width)
+    y = loop_calc_points(height)
+
+    shiftx, shifty = np.meshgrid(x, y)
+    xy = np.stack([shiftx, shifty], axis=-1).astype(np.float32).reshape(-1, 2)
+    return xy  # n (= self.I_r_width x self.I_r_height) x 2
+
+
+def loop_build_inv_delta_C(F, C):
+    """ Return inv_delta_C which is needed to calculate T """
+    hat_C = np.zeros((F, F), dtype=float)  # F x F
+    for i in range(0, F):
+        for j in range(i, F):
+            r = np.linalg.norm(C[i] - C[j])
+            hat_C[i, j] = r
+            hat_C[j, i] = r
+    np.fill_diagonal(hat_C, 1)
+    hat_C = (hat_C ** 2) * np.log(hat_C)
+    delta_C = np.concatenate(  # F+3 x F+3
+        [
+            np.concatenate([np.ones((F, 1)), C, hat_C], axis=1),  # F x F+3
+            np.concatenate([np.zeros((2, 3)), np.transpose(C)], axis=1),  # 2 x F+3
+            np.concatenate([np.zeros((1, 3)), np.ones((1, F))], axis=1)  # 1 x F+3
+        ],
+        axis=0
+    )
+    inv_delta_C = np.linalg.inv(delta_C)
+    return inv_delta_C  # F+3 x F+3
+
+
+def loop_build_P_hat(F, C, P, eps=1e-6):
+    n = P.shape[0]  # n (= self.I_r_width x self.I_r_height)
+    P_tile = np.tile(np.expand_dims(P, axis=1), (1, F, 1))  # n x 2 -> n x 1 x 2 -> n x F x 2
+    C_tile = np.expand_dims(C, axis=0)  # 1 x F x 2
+    P_diff = P_tile - C_tile  # n x F x 2
+    rbf_norm = np.linalg.norm(P_diff, ord=2, axis=2, keepdims=False)  # n x F
+    rbf = np.multiply(np.square(rbf_norm), np.log(rbf_norm + eps))  # n x F
+    P_hat = np.concatenate([np.ones((n, 1)), P, rbf], axis=1)
+    return P_hat  # n x F+3
+
+
+def loop_build_P_prime(tgt_cps, inv_delta_C, P_hat):
+    tgt_cps_with_zeros = np.concatenate([tgt_cps, np.zeros([3, 2], dtype=np.float32)], axis=0)
+    T = inv_delta_C @ tgt_cps_with_zeros  # F+3 x 2
+    grids = P_hat @ T  # n x 2
+    return grids.astype(np.float32)  # n x 2
+
+
+def loop_gen_grid(size, src_cps, tgt_cps, eps=1e-6, resize=False):
+    width, height = size
+
+    if resize:
+        x1 = np.min(src_cps[..., 0])
+        x2 = np.max(src_cps[..., 0]) 
+        y1 = np.min(src_cps[..., 1])
+        y2 = np.max(src_cps[..., 1])
+        r = min(2 / (x2 - x1), 2 / (y2 - y1))
+
+        resized_src_cps = r * src_cps
+
+        x1 = np.min(resized_src_cps[..., 0])
+        y1 = np.min(resized_src_cps[..., 1])
+        
+        resized_src_cps[..., 0] -= x1 + 1
+        resized_src_cps[..., 1] -= y1 + 1
+    else:
+        resized_src_cps = src_cps
+    
+    n_cps = len(resized_src_cps)
+
+    P = loop_build_P(width, height)  # 全图控制点，范围-1，1
+
+    inv_delta_C = loop_build_inv_delta_C(n_cps, resized_src_cps)  # F+3 x F+3
+    P_hat = loop_build_P_hat(n_cps, resized_src_cps, P, eps=1e-6)  # n x F+3
+    grids = loop_build_P_prime(tgt_cps, inv_delta_C, P_hat)
+    grids = grids.reshape(height, width, 2)
+    return grids
+
+
+def bench(fn, num):
+    start = time.perf_counter()
+    for _ in range(num):
+        fn()
+    return (time.perf_counter() - start) / num * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    for i in range(200):
+        w, h = np.random.randint(20, 400), np.random.randint(8, 100)
+        segment = np.random.randint(2, 8)
+        stretch = i % 2 == 0
+        tgt, src = TPSStretch.stretch((w, h), segment) if stretch else TPSDistort.distort((w, h), segment)
+        assert np.array_equal(loop_gen_grid((w, h), src.copy(), tgt, resize=i % 3 == 0), gen_grid((w, h), src.copy(), tgt, resize=i % 3 == 0))
+    print('parity ok')
+
+    for w, h in ((100, 32), (800, 64), (2000, 200)):
+        tgt, src = TPSDistort.distort((w, h), 4)
+        exact = gen_grid((w, h), src.copy(), tgt)
+        loop_ms = bench(lambda: loop_gen_grid((w, h), src.copy(), tgt), args.num)
+        res = '{}x{}: loop {:.2f} ms'.format(w, h, loop_ms)
+        for grid_scale in (1, 0.25):
+            ms = bench(lambda: gen_grid((w, h), src.copy(), tgt, grid_scale=grid_scale), args.num)
+            err = (np.abs(gen_grid((w, h), src.copy(), tgt, grid_scale=grid_scale) - exact) * ((w - 1) / 2, (h - 1) / 2)).max()
+            res += ', grid_scale={} {:.2f} ms (x{:.1f}, {:.3f} px max)'.format(grid_scale, ms, loop_ms / ms, err)
+        print(res)
+
+        image = Image.fromarray(np.random.randint(0, 256, (h, w, 3), dtype=np.uint8))
+        for grid_scale in (1, 0.25):
+            t = TPSDistort(segment=4, grid_scale=grid_scale)
+            print('  TPSDistort(grid_scale={}) on a PIL image: {:.2f} ms'.format(grid_scale, bench(lambda: t(dict(image=image)), args.num)))
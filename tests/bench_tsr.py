@@ -0,0 +1,401 @@
+import os
+import cv2
+import math
+import time
+import torch
+import shutil
+import tempfile
+import argparse
+import numpy as np
+from PIL import Image, ImageDraw
+
+from castty.datasets.readers import WTWReader
+from castty.datasets.utils.common import get_image_size
+from castty.datasets.bamboo.misc import CalcTSRGT
+
+
+class LoopTSRGT(CalcTSRGT):
+    # one point and one split at a time, the reference for the vectorized version
+    def calc_points_on_x(self, input_points, w):
+        points = []
+        ind = []
+
+        sid = np.argsort(input_points[:, 0])
+
+        for p in input_points[sid]:
+            if len(points) == 0:
+                points.append(p)
+                ind.append(True)
+            else:
+                if (p == points[-1]).all():
+                    continue
+                else:
+                    points.append(p)
+                    ind.append(True)
+
+        if points[0][0] > 0:
+            points = [np.array([0, points[0][1]]).astype(np.float32)] + points
+            ind = [False] + ind
+        if points[-1][0] < w - 1:
+            points.append(np.array([w + 1, points[-1][1]]).astype(np.float32))
+            ind[-1] = False
+            ind.append(False)
+        return np.array(points).astype(np.float32), np.array(ind).astype(np.bool_)
+
+    def calc_points_on_y(self, input_points, h):
+        points = []
+        ind = []
+
+        sid = np.argsort(input_points[:, 1])
+
+        for p in input_points[sid]:
+            if len(points) == 0:
+                points.append(p)
+                ind.append(True)
+            else:
+                if (p == points[-1]).all():
+                    continue
+                else:
+                    points.append(p)
+                    ind.append(True)
+
+        if points[0][1] > 0:
+            points = [np.array([points[0][0], 0]).astype(np.float32)] + points
+            ind = [False] + ind
+        if points[-1][1] < h - 1:
+            points.append(np.array([points[-1][0], h + 1]).astype(np.float32))
+            ind.append(False)
+        return np.array(points).astype(np.float32), np.array(ind).astype(np.bool_)
+
+    def calc_x(self, col, y, ind=None):
+        i = np.nonzero(col[:, 1] <= y)[0][-1]
+
+        if i == len(col) - 1:
+            if ind is None:
+                return col[i, 0]
+            else:
+                return col[i, 0], ind[i]
+
+        x1, y1 = col[i]
+        x2, y2 = col[i + 1]
+        if y2 - y1 == 0:
+            x = x2
+        else:
+            x = ((x2 - x1) / (y2 - y1)) * (y - y1) + x1
+
+        if ind is None:
+            return x
+        else:
+            return x, ind[i]
+
+    def calc_y(self, row, x, ind=None):
+        i = np.nonzero(row[:, 0] <= x)[0][-1]
+
+        if i == len(row) - 1:
+            if ind is None:
+                return row[i, 1]
+            else:
+                return row[i, 1], ind[i]
+
+        x1, y1 = row[i]
+        x2, y2 = row[i + 1]
+        if x2 - x1 == 0:
+            y = y2
+        else:
+            y = ((y2 - y1) / (x2 - x1)) * (x - x1) + y1
+
+        if ind is None:
+            return y
+        else:
+            return y, ind[i]
+
+    def forward(self, data_dict, **kwargs):
+        w, h = get_image_size(data_dict['image'])
+
+        rows = []
+        rows_ind = []
+
+        for table_id in np.unique(data_dict['bbox_meta']['table_id']):
+            startrows = data_dict['bbox_meta']['startrow'][data_dict['bbox_meta']['table_id'] == table_id]
+
+            ind = (data_dict['bbox_meta']['startrow'] == 0) & (data_dict['bbox_meta']['table_id'] == table_id)
+            points = data_dict['point'][ind][:, [0, 1], :].reshape(-1, 2)
+            points, ind = self.calc_points_on_x(points, w)
+            rows.append(points)
+            rows_ind.append(ind)
+
+            for i in range(len(np.unique(startrows))):
+                ind = (data_dict['bbox_meta']['endrow'] == i) & (data_dict['bbox_meta']['table_id'] == table_id)
+                points = data_dict['point'][ind][:, [2, 3], :].reshape(-1, 2)
+                points, ind = self.calc_points_on_x(points, w)
+                rows.append(points)
+                rows_ind.append(ind)
+
+        row_separators = [[], rows, []]
+
+        for i in range(len(rows)):
+            ut = []
+            bt = []
+            for j in range(len(rows[i])):
+                if i == 0:
+                    d1 = abs(self.calc_y(rows[i + 1], rows[i][j, 0]) - rows[i][j, 1])
+                    d2 = abs(0 - rows[i][j, 1])
+                elif i == len(rows) - 1:
+                    d1 = abs(h - rows[i][j, 1])
+                    d2 = abs(self.calc_y(rows[i - 1], rows[i][j, 0]) - rows[i][j, 1])
+                else:
+                    d1 = abs(self.calc_y(rows[i + 1], rows[i][j, 0]) - rows[i][j, 1])
+                    d2 = abs(self.calc_y(rows[i - 1], rows[i][j, 0]) - rows[i][j, 1])
+                distance = min(d1, d2) * self.ratio
+
+                ut.append([rows[i][j, 0], rows[i][j, 1] - distance])
+                bt.append([rows[i][j, 0], rows[i][j, 1] + distance])
+
+            ut = np.array(ut).astype(np.float32)
+            bt = np.array(bt).astype(np.float32)
+
+            row_separators[0].append(ut)
+            row_separators[2].append(bt)
+
+        x_tau = self.tau * w
+        row_refpt = torch.zeros(h).type(torch.float32)
+
+        for i in range(len(row_separators[0])):
+            y1_tau = self.calc_y(row_separators[0][i], x_tau)
+            y2_tau = self.calc_y(row_separators[1][i], x_tau)
+            y3_tau = self.calc_y(row_separators[2][i], x_tau)
+
+            radius = (y3_tau - y1_tau) / 2
+            y2_tau = int(y2_tau)
+            radius = int(radius) if int(radius) > 0 else 1
+
+            ys = torch.arange(h).type(torch.float32)
+            sigma = math.sqrt(0.5 * radius ** 2 / math.log(10))
+            r = -(ys - y2_tau) ** 2 / (2 * sigma ** 2)
+            heat = r.exp()
+            heat[heat < 0.1] = 0
+
+            row_refpt += heat
+
+        xs = np.linspace(0, w, num=self.split + 1)[1:-1]
+        gt_l_row = []
+        gt_c_row = []
+
+        for i in range(len(row_separators[0])):
+            t = []
+            c = []
+            for x in xs:
+                upper = self.calc_y(row_separators[0][i], x)
+                middle, pind = self.calc_y(row_separators[1][i], x, rows_ind[i])
+                lower = self.calc_y(row_separators[2][i], x)
+
+                t.append([upper, middle, lower])
+                c.append(pind)
+            gt_l_row.append(t)
+            gt_c_row.append(c)
+
+        gt_l_row = np.array(gt_l_row).astype(np.float32)
+        gt_c_row = np.array(gt_c_row).astype(np.bool_)
+
+        row_mask = Image.new('P', (w, h), 0)
+        draw = ImageDraw.Draw(row_mask)
+
+        for i in range(len(row_separators[0]) - 1):
+            polygon = np.concatenate([row_separators[2][i], row_separators[0][i + 1][::-1]])
+            draw.polygon(polygon.astype(np.int32).flatten().tolist(), fill=1)
+
+        gt_row_mask = np.array(row_mask)
+
+        cols = []
+        cols_ind = []
+
+        for table_id in np.unique(data_dict['bbox_meta']['table_id']):
+            startcols = data_dict['bbox_meta']['startcol'][data_dict['bbox_meta']['table_id'] == table_id]
+
+            ind = (data_dict['bbox_meta']['startcol'] == 0) & (data_dict['bbox_meta']['table_id'] == table_id)
+            points = data_dict['point'][ind][:, [0, 3], :].reshape(-1, 2)
+            points, ind = self.calc_points_on_y(points, h)
+            cols.append(points)
+            cols_ind.append(ind)
+
+            for i in range(len(np.unique(startcols))):
+                ind = (data_dict['bbox_meta']['endcol'] == i) & (data_dict['bbox_meta']['table_id'] == table_id)
+                points = data_dict['point'][ind][:, [1, 2], :].reshape(-1, 2)
+                points, ind = self.calc_points_on_y(points, h)
+                cols.append(points)
+                cols_ind.append(ind)
+
+        col_separators = [[], cols, []]
+
+        for i in range(len(cols)):
+            lt = []
+            rt = []
+            for j in range(len(cols[i])):
+                if i == 0:
+                    d1 = abs(self.calc_x(cols[i + 1], cols[i][j, 1]) - cols[i][j, 0])
+                    d2 = abs(0 - cols[i][j, 0])
+                elif i == len(cols) - 1:
+                    d1 = abs(w - cols[i][j, 0])
+                    d2 = abs(self.calc_x(cols[i - 1], cols[i][j, 1]) - cols[i][j, 0])
+                else:
+                    d1 = abs(self.calc_x(cols[i + 1], cols[i][j, 1]) - cols[i][j, 0])
+                    d2 = abs(self.calc_x(cols[i - 1], cols[i][j, 1]) - cols[i][j, 0])
+                distance = min(d1, d2) * self.ratio
+
+                lt.append([cols[i][j, 0] - distance, cols[i][j, 1]])
+                rt.append([cols[i][j, 0] + distance, cols[i][j, 1]])
+
+            lt = np.array(lt).astype(np.float32)
+            rt = np.array(rt).astype(np.float32)
+
+            col_separators[0].append(lt)
+            col_separators[2].append(rt)
+
+        y_tau = self.tau * h
+        col_refpt = torch.zeros(w).type(torch.float32)
+
+        for i in range(len(col_separators[0])):
+            x1_tau = self.calc_x(col_separators[0][i], y_tau)
+            x2_tau = self.calc_x(col_separators[1][i], y_tau)
+            x3_tau = self.calc_x(col_separators[2][i], y_tau)
+
+            radius = (x3_tau - x1_tau) / 2
+            x2_tau = int(x2_tau)
+            radius = int(radius) if int(radius) > 0 else 1
+
+            xs = torch.arange(w).type(torch.float32)
+            sigma = math.sqrt(0.5 * radius ** 2 / math.log(10))
+            r = -(xs - x2_tau) ** 2 / (2 * sigma ** 2)
+            heat = r.exp()
+            heat[heat < 0.1] = 0
+
+            col_refpt += heat
+
+        ys = np.linspace(0, h, num=self.split + 1)[1:-1]
+        gt_l_col = []
+        gt_c_col = []
+
+        for i in range(len(col_separators[0])):
+            t = []
+            c = []
+            for y in ys:
+                left = self.calc_x(col_separators[0][i], y)
+                middle, pind = self.calc_x(col_separators[1][i], y, cols_ind[i])
+                right = self.calc_x(col_separators[2][i], y)
+
+                t.append([left, middle, right])
+                c.append(pind)
+            gt_l_col.append(t)
+            gt_c_col.append(c)
+
+        gt_l_col = np.array(gt_l_col).astype(np.float32)
+        gt_c_col = np.array(gt_c_col).astype(np.bool_)
+
+        col_mask = Image.new('P', (w, h), 0)
+        draw = ImageDraw.Draw(col_mask)
+
+        for i in range(len(col_separators[0]) - 1):
+            polygon = np.concatenate([col_separators[2][i], col_separators[0][i + 1][::-1]])
+            draw.polygon(polygon.astype(np.int32).flatten().tolist(), fill=1)
+
+        gt_col_mask = np.array(col_mask)
+
+        data_dict['tsr_l_row'] = torch.from_numpy(gt_l_row) / h
+        data_dict['tsr_c_row'] = torch.from_numpy(gt_c_row)
+        data_dict['tsr_row_mask'] = torch.from_numpy(gt_row_mask)
+        data_dict['tsr_row_refpt'] = row_refpt
+
+        data_dict['tsr_l_col'] = torch.from_numpy(gt_l_col) / w
+        data_dict['tsr_c_col'] = torch.from_numpy(gt_c_col)
+        data_dict['tsr_col_mask'] = torch.from_numpy(gt_col_mask)
+        data_dict['tsr_col_refpt'] = col_refpt
+
+        return data_dict
+
+
+def make_table(x0, y0, w, h, num_rows, num_cols):
+    # cells of a slightly skewed grid, some of them spanning two rows or two columns
+    us = np.concatenate(([0], np.sort(np.random.uniform(0, 1, num_cols - 1)), [1])) * w
+    vs = np.concatenate(([0], np.sort(np.random.uniform(0, 1, num_rows - 1)), [1])) * h
+    skew_x, skew_y = np.random.uniform(-0.03, 0.03, 2)
+    jitter = np.random.uniform(-1.5, 1.5, (num_rows + 1, num_cols + 1, 2))
+
+    def corner(r, c):
+        return (x0 + us[c] + skew_x * vs[r] + jitter[r, c, 0], y0 + vs[r] + skew_y * us[c] + jitter[r, c, 1])
+
+    cells = []
+    taken = np.zeros((num_rows, num_cols), dtype=np.bool_)
+    for r in range(num_rows):
+        for c in range(num_cols):
+            if taken[r, c]:
+                continue
+            # the first column never spans rows and the first row never spans columns, so that
+            # every row and column has cells ending on it
+            rs = 2 if c > 0 and r < num_rows - 1 and np.random.rand() < 0.1 else 1
+            cs = 2 if r > 0 and c < num_cols - 1 and not taken[r, c + 1] and np.random.rand() < 0.1 else 1
+            if rs == 2 and taken[r + 1, c:c + cs].any():
+                rs = 1
+            taken[r:r + rs, c:c + cs] = True
+            points = [corner(r, c), corner(r, c + cs), corner(r + rs, c + cs), corner(r + rs, c)]
+            cells.append((points, c, c + cs - 1, r, r + rs - 1))
+    return cells
+
+
+def make_wtw(root, num, size):
+    os.makedirs(os.path.join(root, 'images'))
+    os.makedirs(os.path.join(root, 'xml'))
+    for i in range(num):
+        w, h = np.random.randint(size // 2, size, 2)
+        num_tables = np.random.randint(1, 4)
+        objects = []
+        for table_id in range(num_tables):
+            # tables stacked from top to bottom
+            band = h / num_tables
+            x0, y0 = np.random.uniform(5, 0.2 * w), table_id * band + np.random.uniform(5, 0.2 * band)
+            tw, th = np.random.uniform(0.5, 0.75) * w, np.random.uniform(0.5, 0.7) * band
+            num_rows, num_cols = np.random.randint(2, max(3, int(th // 12))), np.random.randint(2, 12)
+            for points, startcol, endcol, startrow, endrow in make_table(x0, y0, tw, th, num_rows, num_cols):
+                points = np.array(points)
+                coords = ''.join('<x{0}>{1}</x{0}><y{0}>{2}</y{0}>'.format(k + 1, x, y) for k, (x, y) in enumerate(points))
+                objects.append(
+                    '<object><bndbox><xmin>{}</xmin><ymin>{}</ymin><xmax>{}</xmax><ymax>{}</ymax>{}'
+                    '<tableid>{}</tableid><startcol>{}</startcol><endcol>{}</endcol><startrow>{}</startrow><endrow>{}</endrow>'
+                    '</bndbox></object>'.format(*points.min(axis=0), *points.max(axis=0), coords, table_id, startcol, endcol, startrow, endrow))
+        with open(os.path.join(root, 'xml', '{:05d}.xml'.format(i)), 'w') as f:
+            f.write('<annotation>{}</annotation>'.format(''.join(objects)))
+        cv2.imwrite(os.path.join(root, 'images', '{:05d}.jpg'.format(i)), np.full((h, w, 3), 255, dtype=np.uint8))
+
+
+def bench(t, samples):
+    start = time.perf_counter()
+    for s in samples:
+        t(dict(s))
+    return (time.perf_counter() - start) / len(samples) * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=50)
+    parser.add_argument('--size', type=int, default=1600)
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    tmp = tempfile.mkdtemp()
+    make_wtw(tmp, args.num, args.size)
+    reader = WTWReader(tmp, use_pil=False)
+    samples = [reader[i] for i in range(len(reader))]
+    shutil.rmtree(tmp)
+
+    for kwargs in (dict(), dict(split=8, ratio=0.4, tau=0.6)):
+        loop, vectorized = LoopTSRGT(**kwargs), CalcTSRGT(**kwargs)
+        for s in samples:
+            a, b = loop(dict(s)), vectorized(dict(s))
+            for key in ('tsr_l_row', 'tsr_c_row', 'tsr_row_mask', 'tsr_row_refpt', 'tsr_l_col', 'tsr_c_col', 'tsr_col_mask', 'tsr_col_refpt'):
+                assert torch.equal(a[key], b[key]), key
+    print('parity ok')
+
+    num_cells = sum(len(s['point']) for s in samples) / len(samples)
+    loop, vectorized = LoopTSRGT(), CalcTSRGT()
+    loop_ms, vectorized_ms = bench(loop, samples), bench(vectorized, samples)
+    print('{:.0f} cells per image: loop {:.1f} ms, vectorized {:.1f} ms, x{:.1f}'.format(
+        num_cells, loop_ms, vectorized_ms, loop_ms / vectorized_ms))